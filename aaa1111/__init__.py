@@ -1,3 +1,17 @@
-from aaa1111.client import AAA1111
+from aaa1111.client import (
+    AAA1111,
+    AAA1111Pool,
+    CircuitBreaker,
+    CircuitOpenError,
+    MicroBatcher,
+    RetryPolicy,
+)
 
-__all__ = ["AAA1111"]
+__all__ = [
+    "AAA1111",
+    "AAA1111Pool",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "MicroBatcher",
+    "RetryPolicy",
+]
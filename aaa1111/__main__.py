@@ -1,24 +1,43 @@
+import asyncio
 import io
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-
-import rich.progress as pg
-from rich.console import Group
-from rich.live import Live
-from rich.panel import Panel
-from rich.syntax import Syntax
-from ruamel.yaml import YAML
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
 from typer import Argument, Option, Typer
 from typing_extensions import Annotated
 
-from aaa1111.client import AAA1111
-from aaa1111.utils import FILE_EXT, load_from_file, save_image
+from aaa1111.client import AAA1111, AAA1111Pool, RetryPolicy
+from aaa1111.journal import Journal, file_digest, when_saved
+from aaa1111.report import JobStats, RunReport, attach, on_span, track
+from aaa1111.scheduler import affinity, schedule
+from aaa1111.sweep import Sweep, is_sweep
+from aaa1111.types.toimg import ToImageResponse
+from aaa1111.utils import FILE_EXT, ImageWriter, aload_from_file, load_from_file
 
 app_txt2img = Typer()
 app_img2img = Typer()
 
 
 defalut_output = Path("output")
+SCHEDULE_WINDOW = 256
 
 
 @app_txt2img.command(no_args_is_help=True)
@@ -27,7 +46,7 @@ def txt2img(
         List[Path],
         Argument(
             show_default=False,
-            help="Path to params files. .toml, .yaml, .yml, .json, .json5 available. others will be ignored.",
+            help="Path to params files. .toml, .yaml, .yml, .json, .json5 available. others will be ignored. a file with a 'sweep' table runs every combination of its axes.",
             exists=True,
             rich_help_panel="api",
         ),
@@ -47,11 +66,11 @@ def txt2img(
         ),
     ] = defalut_output,
     base_url: Annotated[
-        Optional[str],
+        Optional[List[str]],
         Option(
             "-b",
             "--base-url",
-            help="base url, if given, 'host', 'port' and 'https' are ignored.",
+            help="base url, if given, 'host', 'port' and 'https' are ignored. repeat to dispatch to multiple webui backends.",
             envvar="AAA1111_BASE_URL",
             rich_help_panel="api",
         ),
@@ -64,6 +83,86 @@ def txt2img(
     ] = "png",
     quality: Annotated[int, Option("-q", "--quality", rich_help_panel="save")] = 95,
     lossless: Annotated[bool, Option(rich_help_panel="save")] = True,
+    save_workers: Annotated[
+        int,
+        Option(
+            "--save-workers",
+            min=1,
+            help="Number of background threads saving images.",
+            rich_help_panel="save",
+        ),
+    ] = 2,
+    resume: Annotated[
+        bool,
+        Option(
+            help="Skip jobs already completed in the save directory's journal. a job is matched by the content of its params file only: changed init images or defaults it refers to are not noticed.",
+            rich_help_panel="save",
+        ),
+    ] = False,
+    concurrency: Annotated[
+        Optional[int],
+        Option(
+            "-c",
+            "--concurrency",
+            min=1,
+            help="Number of requests to keep in flight. if greater than 1, the async api is used. [default: number of backends]",
+            rich_help_panel="api",
+        ),
+    ] = None,
+    max_skips: Annotated[
+        int,
+        Option(
+            "--max-skips",
+            min=0,
+            help="Jobs for the checkpoint/vae already loaded run before older ones. a job is passed over at most this many times. 0 keeps the order of the files.",
+            rich_help_panel="api",
+        ),
+    ] = 8,
+    retries: Annotated[
+        int,
+        Option(
+            "--retries",
+            min=0,
+            help="Times to retry a request after a connection error or a 5xx response, with jittered backoff. a generate request is only retried when it did not reach the server.",
+            rich_help_panel="api",
+        ),
+    ] = 2,
+    report: Annotated[
+        Optional[Path],
+        Option(
+            "--report",
+            help="Append a jsonl record of each job, with timings, outputs and the backend, and a summary of the run to this file.",
+            dir_okay=False,
+            rich_help_panel="report",
+        ),
+    ] = None,
+    metrics: Annotated[
+        Optional[Path],
+        Option(
+            "--metrics",
+            help="Keep prometheus metrics of the run in this file, e.g. for node_exporter's textfile collector.",
+            dir_okay=False,
+            rich_help_panel="report",
+        ),
+    ] = None,
+    metrics_port: Annotated[
+        Optional[int],
+        Option(
+            "--metrics-port",
+            min=0,
+            max=65535,
+            help="Serve prometheus metrics of the run on this port, at /metrics.",
+            rich_help_panel="report",
+        ),
+    ] = None,
+    metrics_host: Annotated[
+        str,
+        Option(
+            "--metrics-host",
+            help="Address to serve the metrics on, e.g. 0.0.0.0 for every interface.",
+            rich_help_panel="report",
+        ),
+    ] = "127.0.0.1",
 ):
     _inner(
         params,
@@ -75,6 +174,15 @@ def txt2img(
         save_ext,
         quality,
         lossless,
+        concurrency,
+        save_workers,
+        resume,
+        max_skips,
+        retries,
+        report,
+        metrics,
+        metrics_port,
+        metrics_host,
         task="txt2img",
     )
 
@@ -85,7 +193,7 @@ def img2img(
         List[Path],
         Argument(
             show_default=False,
-            help="Path to params files. .toml, .yaml, .yml, .json, .json5 available. others will be ignored.",
+            help="Path to params files. .toml, .yaml, .yml, .json, .json5 available. others will be ignored. a file with a 'sweep' table runs every combination of its axes.",
             exists=True,
             rich_help_panel="api",
         ),
@@ -105,11 +213,11 @@ def img2img(
         ),
     ] = defalut_output,
     base_url: Annotated[
-        Optional[str],
+        Optional[List[str]],
         Option(
             "-b",
             "--base-url",
-            help="base url, if given, 'host', 'port' and 'https' are ignored.",
+            help="base url, if given, 'host', 'port' and 'https' are ignored. repeat to dispatch to multiple webui backends.",
             envvar="AAA1111_BASE_URL",
             rich_help_panel="api",
         ),
@@ -122,6 +230,86 @@ def img2img(
     ] = "png",
     quality: Annotated[int, Option("-q", "--quality", rich_help_panel="save")] = 95,
     lossless: Annotated[bool, Option(rich_help_panel="save")] = True,
+    save_workers: Annotated[
+        int,
+        Option(
+            "--save-workers",
+            min=1,
+            help="Number of background threads saving images.",
+            rich_help_panel="save",
+        ),
+    ] = 2,
+    resume: Annotated[
+        bool,
+        Option(
+            help="Skip jobs already completed in the save directory's journal. a job is matched by the content of its params file only: changed init images or defaults it refers to are not noticed.",
+            rich_help_panel="save",
+        ),
+    ] = False,
+    concurrency: Annotated[
+        Optional[int],
+        Option(
+            "-c",
+            "--concurrency",
+            min=1,
+            help="Number of requests to keep in flight. if greater than 1, the async api is used. [default: number of backends]",
+            rich_help_panel="api",
+        ),
+    ] = None,
+    max_skips: Annotated[
+        int,
+        Option(
+            "--max-skips",
+            min=0,
+            help="Jobs for the checkpoint/vae already loaded run before older ones. a job is passed over at most this many times. 0 keeps the order of the files.",
+            rich_help_panel="api",
+        ),
+    ] = 8,
+    retries: Annotated[
+        int,
+        Option(
+            "--retries",
+            min=0,
+            help="Times to retry a request after a connection error or a 5xx response, with jittered backoff. a generate request is only retried when it did not reach the server.",
+            rich_help_panel="api",
+        ),
+    ] = 2,
+    report: Annotated[
+        Optional[Path],
+        Option(
+            "--report",
+            help="Append a jsonl record of each job, with timings, outputs and the backend, and a summary of the run to this file.",
+            dir_okay=False,
+            rich_help_panel="report",
+        ),
+    ] = None,
+    metrics: Annotated[
+        Optional[Path],
+        Option(
+            "--metrics",
+            help="Keep prometheus metrics of the run in this file, e.g. for node_exporter's textfile collector.",
+            dir_okay=False,
+            rich_help_panel="report",
+        ),
+    ] = None,
+    metrics_port: Annotated[
+        Optional[int],
+        Option(
+            "--metrics-port",
+            min=0,
+            max=65535,
+            help="Serve prometheus metrics of the run on this port, at /metrics.",
+            rich_help_panel="report",
+        ),
+    ] = None,
+    metrics_host: Annotated[
+        str,
+        Option(
+            "--metrics-host",
+            help="Address to serve the metrics on, e.g. 0.0.0.0 for every interface.",
+            rich_help_panel="report",
+        ),
+    ] = "127.0.0.1",
 ):
     _inner(
         params,
@@ -133,27 +321,173 @@ def img2img(
         save_ext,
         quality,
         lossless,
+        concurrency,
+        save_workers,
+        resume,
+        max_skips,
+        retries,
+        report,
+        metrics,
+        metrics_port,
+        metrics_host,
         task="img2img",
     )
 
 
+class Job(NamedTuple):
+    path: Path
+    digest: str
+    index: Optional[int] = None  # the combination of a sweep file
+
+
+def _make_client(
+    base_url: Optional[List[str]],
+    host: str,
+    port: int,
+    https: bool,
+    retries: int,
+    traced: bool = False,
+) -> Union[AAA1111, AAA1111Pool]:
+    retry = RetryPolicy(attempts=retries + 1) if retries else None
+    # the spans are only timed for the run report
+    hook = on_span if traced else None
+    if base_url and len(base_url) > 1:
+        # a failing backend is skipped while the others take its jobs
+        return AAA1111Pool(base_url, retry=retry, breaker=True, on_span=hook)
+    url = base_url[0] if base_url else None
+    return AAA1111(
+        host=host, port=port, base_url=url, https=https, retry=retry, on_span=hook
+    )
+
+
+def iter_jobs(
+    params: List[Path], task: str, sweeps: Dict[Path, Sweep]
+) -> Iterator[Job]:
+    # each file is read when its jobs are reached, sweep files are kept in
+    # `sweeps` as specs, plain files are loaded again (from the payload cache)
+    # when run
+    for path in params:
+        digest = file_digest(path)
+        payload = load_from_file(path)
+        if not is_sweep(payload):
+            yield Job(path, digest)
+            continue
+        sweep = sweeps[path] = Sweep.from_payload(payload, task)
+        for i in range(len(sweep)):
+            yield Job(path, digest, i)
+
+
+def completed(journal: Journal, task: str, resume: bool) -> Callable[[Job], bool]:
+    # without `--resume` every job runs again
+    if not resume:
+        return lambda job: False
+    return lambda job: journal.is_done(task, job.path, job.digest, job.index)
+
+
+def count_jobs(
+    jobs: Iterable[Job],
+    files: int,
+    sweeps: Dict[Path, Sweep],
+    is_done: Callable[[Job], bool],
+    on_count: Callable[[int, int], None],
+) -> Iterator[Job]:
+    # the plan starts at one job per file and is corrected as the files are
+    # read: a sweep adds its combinations, completed jobs are skipped.
+    # `on_count(planned, skipped)` is called before a job when the plan
+    # changed, and once at the end.
+    planned, skipped, counted = files, 0, files
+    for job in jobs:
+        if job.index == 0:
+            planned += len(sweeps[job.path]) - 1
+        if is_done(job):
+            planned -= 1
+            skipped += 1
+            continue
+        if planned != counted:
+            on_count(planned, skipped)
+            counted = planned
+        yield job
+    on_count(planned, skipped)
+
+
+def load_job(job: Job, sweeps: Dict[Path, Sweep]) -> Dict[str, Any]:
+    if job.index is None:
+        return load_from_file(job.path)
+    return sweeps[job.path][job.index]
+
+
+async def aload_job(job: Job, sweeps: Dict[Path, Sweep]) -> Dict[str, Any]:
+    if job.index is None:
+        return await aload_from_file(job.path)
+    return sweeps[job.path][job.index]
+
+
 def _inner(
     params: List[Path],
     save_dir: Path,
-    base_url: Optional[str],
+    base_url: Optional[List[str]],
     host: str,
     port: int,
     https: bool,
     save_ext: str,
     quality: int,
     lossless: bool,
+    concurrency: Optional[int] = None,
+    save_workers: int = 2,
+    resume: bool = False,
+    max_skips: int = 8,
+    retries: int = 0,
+    report: Optional[Path] = None,
+    metrics: Optional[Path] = None,
+    metrics_port: Optional[int] = None,
+    metrics_host: str = "127.0.0.1",
     *,
     task: str = "txt2img",
 ):
-    client = AAA1111(host=host, port=port, base_url=base_url, https=https)
+    if task not in ("txt2img", "img2img"):
+        msg = f"Unknown task: {task}"
+        raise ValueError(msg)
+
+    reported = report is not None or metrics is not None or metrics_port is not None
+    client = _make_client(base_url, host, port, https, retries, traced=reported)
+    if concurrency is None:
+        concurrency = len(base_url) if base_url else 1
     save_dir.mkdir(parents=True, exist_ok=True)
     params = filter_paths(params)
-    length = len(params)
+
+    journal = Journal(save_dir)
+    sweeps: Dict[Path, Sweep] = {}
+
+    def on_count(planned: int, skips: int) -> None:
+        nonlocal length, skipped
+        length, skipped = planned, skips
+        progress.update(pg_task, total=planned)
+        if run_report is not None:
+            run_report.plan(planned)
+
+    # jobs are generated and counted lazily, the files are read as they are
+    # reached. they are grouped by checkpoint/vae, the payloads are cached
+    # for the run below.
+    length, skipped = len(params), 0
+    jobs = schedule(
+        count_jobs(
+            iter_jobs(params, task, sweeps),
+            len(params),
+            sweeps,
+            completed(journal, task, resume),
+            on_count,
+        ),
+        key=lambda j: affinity(load_job(j, sweeps)),
+        window=SCHEDULE_WINDOW,
+        max_skips=max_skips,
+    )
+
+    # rich is imported here, `--help` does not need it
+    import rich.progress as pg
+    from rich.console import Group
+    from rich.live import Live
+    from rich.panel import Panel
+    from rich.syntax import Syntax
 
     progress = pg.Progress(
         pg.SpinnerColumn(),
@@ -165,45 +499,206 @@ def _inner(
         pg.TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
     )
     pg_task = progress.add_task(task, total=length)
+    count = 0
+    run_report = (
+        RunReport(task, report, metrics, metrics_port, metrics_host)
+        if reported
+        else None
+    )
 
-    with Live(progress) as live:
-        for i in range(length):
-            payload = load_from_file(params[i])
-            panel = Panel(
-                Syntax(format_payload(payload), "yaml", theme="ansi_dark"),
-                title=f"{task} [green]{i + 1}/{length}[/green]",
+    def on_done(
+        job: Job, payload: Dict[str, Any], saved: List["Future[Path]"], stats: JobStats
+    ) -> None:
+        nonlocal count
+        count += 1
+        if stats.error is None:
+            when_saved(
+                saved,
+                partial(journal.record, task, job.path, job.digest, index=job.index),
             )
-            live.update(Group(progress, panel))
+        else:
+            # not journaled, `--resume` runs it again
+            name = job.path if job.index is None else f"{job.path} #{job.index}"
+            progress.console.print(f"failed: {name}: {stats.error}", markup=False)
+        if run_report is not None:
+            run_report.job(job.path, job.index, stats, saved)
 
-            if task == "txt2img":
-                resp = client.txt2img(payload)
-            elif task == "img2img":
-                resp = client.img2img(payload)
-            else:
-                msg = f"Unknown task: {task}"
-                raise ValueError(msg)
+        panel = Panel(
+            Syntax(format_payload(payload), "yaml", theme="ansi_dark"),
+            title=f"{task} [green]{count}/{length}[/green]",
+        )
+        live.update(Group(progress, panel))
+        progress.update(pg_task, advance=1)
 
-            for j, image in enumerate(resp.images):
-                infotexts = resp.info.get("infotexts", [])
-                if infotexts:
-                    j %= len(infotexts)
-                    infotext = infotexts[j]
-                else:
-                    infotext = None
+    writer = ImageWriter(
+        save_dir,
+        save_ext,
+        quality,
+        lossless,
+        save_workers,
+        on_span=on_span if reported else None,
+    )
+    # the report is closed after the writer, once every saved job is recorded
+    with reporting(run_report, length), Live(progress) as live, writer, client:
+        if concurrency > 1:
+            load = partial(aload_job, sweeps=sweeps)
+            coro = _arun(client, jobs, load, on_done, writer, concurrency, task=task)
+            asyncio.run(coro)
+        else:
+            load = partial(load_job, sweeps=sweeps)
+            _run(client, jobs, load, on_done, writer, task=task)
 
-                save_image(image, save_dir, infotext, save_ext, quality, lossless)
+        if skipped:
+            progress.console.print(f"resume: skipped {skipped} completed jobs")
+        live.update(progress)
 
-            progress.update(pg_task, advance=1)
 
-        live.update(progress)
+@contextmanager
+def reporting(run_report: Optional[RunReport], length: int) -> Iterator[None]:
+    if run_report is None:
+        yield
+        return
+
+    run_report.plan(length)
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        import rich
+
+        rich.print(format_summary(run_report.close(error)))
+
+
+def _run(
+    client: Union[AAA1111, AAA1111Pool],
+    jobs: Iterable[Job],
+    load: Callable[[Job], Dict[str, Any]],
+    on_done: Callable[[Job, Dict[str, Any], List["Future[Path]"], JobStats], None],
+    writer: ImageWriter,
+    *,
+    task: str,
+):
+    generate = client.txt2img if task == "txt2img" else client.img2img
+    endpoint = f"/sdapi/v1/{task}"
+
+    for job in jobs:
+        payload = load(job)
+        resp = None
+        with track(endpoint) as stats:
+            try:
+                resp = generate(payload)
+            except Exception as e:
+                # the job is reported as failed, the run goes on
+                stats.error = f"{type(e).__name__}: {e}"
+        with attach(stats):
+            saved = save_response(resp, writer) if resp is not None else []
+        on_done(job, payload, saved, stats)
+
+
+async def _arun(
+    client: Union[AAA1111, AAA1111Pool],
+    jobs: Iterable[Job],
+    load: Callable[[Job], Awaitable[Dict[str, Any]]],
+    on_done: Callable[[Job, Dict[str, Any], List["Future[Path]"], JobStats], None],
+    writer: ImageWriter,
+    concurrency: int,
+    *,
+    task: str,
+):
+    generate = client.atxt2img if task == "txt2img" else client.aimg2img
+    endpoint = f"/sdapi/v1/{task}"
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(job: Job):
+        payload = await load(job)
+        resp = None
+        async with semaphore:
+            with track(endpoint) as stats:
+                try:
+                    resp = await generate(payload)
+                except Exception as e:
+                    stats.error = f"{type(e).__name__}: {e}"
+        return payload, resp, stats
+
+    # jobs are started ahead of time, but consumed in order.
+    # twice the concurrency keeps the server queue full while the head is saved.
+    window = concurrency * 2
+
+    # the async clients must be closed in the loop that used them
+    async with client:
+        await _aconsume(iter(jobs), run, on_done, writer, window)
+
+
+async def _aconsume(
+    jobs: Iterator[Job],
+    run: Callable[
+        [Job], Awaitable[Tuple[Dict[str, Any], Optional[ToImageResponse], JobStats]]
+    ],
+    on_done: Callable[[Job, Dict[str, Any], List["Future[Path]"], JobStats], None],
+    writer: ImageWriter,
+    window: int,
+):
+    pending: Deque[Tuple[Job, asyncio.Task]] = deque()
+    try:
+        while True:
+            for job in islice(jobs, window - len(pending)):
+                pending.append((job, asyncio.ensure_future(run(job))))
+            if not pending:
+                break
+
+            job, t = pending.popleft()
+            payload, resp, stats = await t
+            with attach(stats):
+                saved = await asave_response(resp, writer) if resp is not None else []
+            on_done(job, payload, saved, stats)
+    finally:
+        for _, t in pending:
+            t.cancel()
+
+
+def _iter_images(resp: ToImageResponse) -> Iterator[Tuple[Any, Optional[str]]]:
+    infotexts = resp.info.get("infotexts", [])
+    for j, image in enumerate(resp.images):
+        infotext = infotexts[j % len(infotexts)] if infotexts else None
+        yield image, infotext
+
+
+def save_response(resp: ToImageResponse, writer: ImageWriter) -> List["Future[Path]"]:
+    return [writer.submit(image, infotext) for image, infotext in _iter_images(resp)]
+
+
+async def asave_response(
+    resp: ToImageResponse, writer: ImageWriter
+) -> List["Future[Path]"]:
+    return [
+        await writer.asubmit(image, infotext) for image, infotext in _iter_images(resp)
+    ]
 
 
 def format_payload(payload: Dict[str, Any]) -> str:
+    from ruamel.yaml import YAML
+
     stream = io.StringIO()
     YAML().dump(payload, stream)
     return stream.getvalue().strip()
 
 
+def format_summary(summary: Dict[str, Any]) -> str:
+    latency = summary["latency"]
+    text = (
+        f"{summary['jobs']} jobs, {summary['images']} images in {summary['seconds']:.1f}s: "
+        f"{summary['images_per_second']:.2f} images/s, "
+        f"latency p50 {latency['p50']:.2f}s p95 {latency['p95']:.2f}s"
+    )
+    failed = summary["failed_jobs"] + summary["failed_requests"]
+    if failed:
+        text += f", {summary['failed_jobs']} failed jobs, {summary['failed_requests']} failed requests"
+    return text
+
+
 def filter_paths(paths: List[Path]) -> List[Path]:
     return [p for p in paths if p.is_file() and p.suffix.lower() in FILE_EXT]
 
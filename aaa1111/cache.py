@@ -0,0 +1,310 @@
+import copy
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Hashable, Optional, Union
+
+import orjson
+from PIL import Image
+
+PathType = Union[str, Path]
+
+
+def file_key(path: PathType) -> str:
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}:{st.st_mtime_ns}:{st.st_size}"
+
+
+class LRUCache:
+    # least recently used entries are evicted once the total size of the
+    # values exceeds `max_bytes`.
+    def __init__(self, max_bytes: int = 64 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None) -> None:
+        if size is None:
+            size = len(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._sizes[key]
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._sizes[key] = size
+            self.nbytes += size
+
+            while self.nbytes > self.max_bytes:
+                old, _ = self._data.popitem(last=False)
+                self.nbytes -= self._sizes.pop(old)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            self.nbytes -= self._sizes.pop(key)
+            return self._data.pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+
+
+class DiskStore:
+    # content-addressed files under `root`, `<root>/<key[:2]>/<key>`.
+    # when the total size exceeds `max_bytes`, the files with the oldest
+    # mtime are removed until it is below 90% of `max_bytes`.
+    # `get` touches the file, so the eviction is roughly lru.
+    def __init__(self, root: PathType, max_bytes: int = 1024 * 2**20):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._nbytes: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.root.joinpath(key[:2], key)
+
+    def _files(self):
+        if not self.root.is_dir():
+            return []
+        return [p for p in self.root.glob("*/*") if not p.name.endswith(".tmp")]
+
+    @property
+    def nbytes(self) -> int:
+        if self._nbytes is None:
+            self._nbytes = sum(p.stat().st_size for p in self._files())
+        return self._nbytes
+
+    def __contains__(self, key: str) -> bool:
+        return self._path(key).is_file()
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._nbytes = self.nbytes + len(data)
+            if self._nbytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        files = []
+        for p in self._files():
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * 0.9
+        for _, size, p in files:
+            if total <= target:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+        self._nbytes = total
+
+    def clear(self) -> None:
+        with self._lock:
+            for p in self._files():
+                p.unlink(missing_ok=True)
+            self._nbytes = 0
+
+
+class Base64Cache:
+    # cache of base64 encoded input images.
+    # files are keyed by (path, mtime, size), PIL images by a hash of their
+    # content, so a changed file or image is never served from the cache.
+    def __init__(
+        self,
+        max_bytes: int = 64 * 2**20,
+        disk: Union[PathType, DiskStore, None] = None,
+    ):
+        self.memory = LRUCache(max_bytes)
+        if isinstance(disk, (str, Path)):
+            disk = DiskStore(disk)
+        self.disk = disk
+
+    @staticmethod
+    def file_key(path: PathType) -> str:
+        return f"file:{file_key(path)}"
+
+    @staticmethod
+    def image_key(img: Image.Image) -> str:
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{img.mode}:{img.size}".encode())
+        h.update(img.tobytes())
+        # "P" and "PA" images: the same indices with another palette
+        palette = img.getpalette() if img.mode in ("P", "PA") else None
+        if palette:
+            h.update(bytes(palette))
+        h.update(str(img.info.get("transparency")).encode())
+        h.update(str(img.info.get("parameters")).encode())
+        h.update(img.getexif().tobytes())
+        return f"pil:{h.hexdigest()}"
+
+    @staticmethod
+    def _disk_key(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            data = self.disk.get(self._disk_key(key))
+            if data is not None:
+                value = data.decode("ascii")
+                self.memory.put(key, value)
+        return value
+
+    def put(self, key: str, value: str) -> None:
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(self._disk_key(key), value.encode("ascii"))
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+def _orjson_default(obj: Any) -> Any:
+    # ruamel.yaml loads floats as `ScalarFloat`
+    if isinstance(obj, float):
+        return float(obj)
+    raise TypeError
+
+
+class PayloadCache:
+    # cache of parsed payload files, keyed by (path, mtime, size).
+    # data that json can represent is kept as orjson bytes, so every `get`
+    # returns a fresh copy cheaply; with `disk`, these bytes are also written
+    # as a compiled sidecar that later processes load instead of the source.
+    # anything else (e.g. toml datetimes) is kept in memory and deep-copied.
+    def __init__(
+        self,
+        max_bytes: int = 16 * 2**20,
+        disk: Union[PathType, DiskStore, None] = None,
+    ):
+        self.memory = LRUCache(max_bytes)
+        if isinstance(disk, (str, Path)):
+            disk = DiskStore(disk)
+        self.disk = disk
+
+    @staticmethod
+    def _disk_key(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest() + ".json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(self._disk_key(key))
+            if value is not None:
+                self.memory.put(key, value)
+
+        if value is None:
+            return None
+        if isinstance(value, bytes):
+            return orjson.loads(value)
+        return copy.deepcopy(value)
+
+    def put(self, key: str, data: Dict[str, Any], size: int) -> None:
+        try:
+            value = orjson.dumps(
+                data, default=_orjson_default, option=orjson.OPT_PASSTHROUGH_DATETIME
+            )
+        except TypeError:
+            self.memory.put(key, copy.deepcopy(data), size)
+            return
+
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(self._disk_key(key), value)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+class ResultCache:
+    # txt2img/img2img response bodies in a DiskStore, keyed by a hash of the
+    # endpoint, the final payload and the checkpoint/vae the server uses.
+    # only payloads with a fixed seed are deterministic enough to be cached.
+    def __init__(self, root: PathType, max_bytes: int = 4 * 2**30):
+        self.store = DiskStore(root, max_bytes)
+
+    @staticmethod
+    def cacheable(payload: Dict[str, Any]) -> bool:
+        if payload.get("seed", -1) == -1:
+            return False
+        return payload.get("subseed", -1) != -1 or not payload.get("subseed_strength")
+
+    @staticmethod
+    def key(endpoint: str, payload: Dict[str, Any], model: Dict[str, Any]) -> str:
+        data = orjson.dumps(
+            {"endpoint": endpoint, "payload": payload, "model": model},
+            default=_orjson_default,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+        )
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.store.get(key)
+
+    def put(self, key: str, body: bytes) -> None:
+        self.store.put(key, body)
+
+    def clear(self) -> None:
+        self.store.clear()
+
+
+image_cache: Optional[Base64Cache] = Base64Cache()
+payload_cache: Optional[PayloadCache] = PayloadCache()
+
+
+def set_image_cache(cache: Optional[Base64Cache]) -> None:
+    global image_cache
+    image_cache = cache
+
+
+def set_payload_cache(cache: Optional[PayloadCache]) -> None:
+    global payload_cache
+    payload_cache = cache
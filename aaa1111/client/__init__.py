@@ -1,3 +1,13 @@
+from .batch import MicroBatcher
 from .main import AAA1111
+from .pool import AAA1111Pool
+from .resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
 
-__all__ = ["AAA1111"]
+__all__ = [
+    "AAA1111",
+    "AAA1111Pool",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "MicroBatcher",
+    "RetryPolicy",
+]
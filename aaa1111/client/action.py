@@ -1,8 +1,9 @@
 from abc import ABC
 
-from beartype import beartype
 from httpx import AsyncClient, Client
 
+from aaa1111.typecheck import beartype
+
 INTERROGATE = "/sdapi/v1/interrogate"
 INTERRUPT = "/sdapi/v1/interrupt"
 SKIP = "/sdapi/v1/skip"
@@ -12,6 +13,9 @@ RELOAD_CHECKPOINT = "/sdapi/v1/reload-checkpoint"
 REFRESH_LORAS = "/sdapi/v1/refresh-loras"
 REFRESH_LYCOS = "/sdapi/v1/refresh-lycos"
 
+# sent twice, these would stop the next job too
+NOT_IDEMPOTENT = (INTERRUPT, SKIP)
+
 
 @beartype
 class ActionMixin(ABC):
@@ -19,12 +23,12 @@ class ActionMixin(ABC):
     aclient: AsyncClient
 
     def _act(self, endpoint: str) -> None:
-        resp = self.client.post(endpoint)
-        resp.raise_for_status()
+        self._request("POST", endpoint, idempotent=endpoint not in NOT_IDEMPOTENT)
 
     async def _aact(self, endpoint: str) -> None:
-        resp = await self.aclient.post(endpoint)
-        resp.raise_for_status()
+        await self._arequest(
+            "POST", endpoint, idempotent=endpoint not in NOT_IDEMPOTENT
+        )
 
     def interrogate(self) -> None:
         self._act(INTERROGATE)
@@ -46,9 +50,11 @@ class ActionMixin(ABC):
 
     def refresh_checkpoints(self) -> None:
         self._act(REFRESH_CHECKPOINTS)
+        self.invalidate("sd_models")
 
     async def arefresh_checkpoints(self) -> None:
         await self._aact(REFRESH_CHECKPOINTS)
+        self.invalidate("sd_models")
 
     def unload_checkpoint(self) -> None:
         self._act(UNLOAD_CHECKPOINT)
@@ -58,18 +64,24 @@ class ActionMixin(ABC):
 
     def reload_checkpoint(self) -> None:
         self._act(RELOAD_CHECKPOINT)
+        self.invalidate("sd_models")
 
     async def areload_checkpoint(self) -> None:
         await self._aact(RELOAD_CHECKPOINT)
+        self.invalidate("sd_models")
 
     def refresh_loras(self) -> None:
         self._act(REFRESH_LORAS)
+        self.invalidate("loras")
 
     async def arefresh_loras(self) -> None:
         await self._aact(REFRESH_LORAS)
+        self.invalidate("loras")
 
     def refresh_lycos(self) -> None:
         self._act(REFRESH_LYCOS)
+        self.invalidate("lycos")
 
     async def arefresh_lycos(self) -> None:
         await self._aact(REFRESH_LYCOS)
+        self.invalidate("lycos")
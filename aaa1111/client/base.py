@@ -0,0 +1,318 @@
+import asyncio
+import hashlib
+import time
+import weakref
+from abc import ABC
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+
+import orjson
+from httpx import AsyncClient, Client, HTTPError, Response
+
+from aaa1111.cache import _orjson_default
+from aaa1111.stream import ImageStreamParser
+from aaa1111.trace import NO_SPAN, HTTPTrace, Span, SpanContext, SpanHook
+from aaa1111.typecheck import beartype
+
+from .resilience import CircuitBreaker, RetryPolicy
+
+
+def request_key(endpoint: str, payload: Any) -> str:
+    data = orjson.dumps(
+        [endpoint, payload],
+        default=_orjson_default,
+        option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+    )
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class SingleFlight:
+    # identical calls made while the first one is still running wait for
+    # its result instead of starting their own.
+    # the call runs in its own task, so cancelling one waiter does not
+    # cancel it for the others.
+    def __init__(self):
+        self._calls: weakref.WeakKeyDictionary[Any, Dict[str, asyncio.Future]]
+        self._calls = weakref.WeakKeyDictionary()
+
+    def __len__(self) -> int:
+        loop = asyncio.get_running_loop()
+        return len(self._calls.get(loop, {}))
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+
+        task = calls.get(key)
+        if task is None:
+            task = loop.create_task(fn())
+            calls[key] = task
+            task.add_done_callback(lambda _: calls.pop(key, None))
+        return await asyncio.shield(task)
+
+
+@beartype
+class RequestMixin(ABC):
+    client: Client
+    aclient: AsyncClient
+    coalesce: bool
+    retry: Optional[RetryPolicy]
+    breaker: Optional[CircuitBreaker]
+    on_span: Optional[SpanHook]
+    _flights: SingleFlight
+
+    def _span(self, name: str, endpoint: str):
+        # a no-op unless `on_span` is set
+        if self.on_span is None:
+            return NO_SPAN
+        return SpanContext(
+            self.on_span, Span(name, endpoint, 0.0, backend=str(self.base_url))
+        )
+
+    def _traced(self, kwargs: Dict[str, Any], trace: Any) -> Dict[str, Any]:
+        extensions = {**kwargs.get("extensions", {}), "trace": trace}
+        return {**kwargs, "extensions": extensions}
+
+    def _emit_http(self, url: str, trace: HTTPTrace, resp: Optional[Response]) -> None:
+        for span in trace.spans(url, str(self.base_url), resp):
+            self.on_span(span)
+
+    def _abort_trial(self, trial: bool) -> None:
+        if trial and self.breaker is not None:
+            self.breaker.abort()
+
+    def _generation_idempotent(self) -> bool:
+        # see RetryPolicy
+        return self.retry is not None and self.retry.retry_generation
+
+    def _retry_delay(
+        self,
+        attempt: int,
+        exc: HTTPError,
+        idempotent: bool,
+        breaker: Optional[CircuitBreaker],
+    ) -> Optional[float]:
+        if breaker is not None:
+            breaker.record(exc)
+        if self.retry is None:
+            return None
+        return self.retry.delay(attempt, exc, idempotent)
+
+    def _request(
+        self,
+        method: str,
+        url: str,
+        *,
+        idempotent: bool = True,
+        circuit: bool = True,
+        **kwargs,
+    ) -> Response:
+        # `idempotent`: the request may be sent again after it reached the server.
+        # `circuit`: the request is guarded by and counts for the breaker
+        breaker = self.breaker if circuit else None
+        attempt = 0
+        while True:
+            trial = breaker is not None and breaker.check()
+            try:
+                if self.on_span is None:
+                    resp = self.client.request(method, url, **kwargs)
+                else:
+                    resp = self._traced_request(method, url, kwargs)
+                resp.raise_for_status()
+            except HTTPError as e:
+                delay = self._retry_delay(attempt, e, idempotent, breaker)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                self._abort_trial(trial)
+                raise
+            if breaker is not None:
+                breaker.record()
+            return resp
+
+    def _traced_request(
+        self, method: str, url: str, kwargs: Dict[str, Any]
+    ) -> Response:
+        trace = HTTPTrace()
+        resp = None
+        try:
+            with self._span("request", url) as span:
+                resp = self.client.request(method, url, **self._traced(kwargs, trace))
+                span.bytes = resp.num_bytes_downloaded
+                if resp.is_error:
+                    span.error = f"HTTP {resp.status_code}"
+        finally:
+            self._emit_http(url, trace, resp)
+        return resp
+
+    async def _atraced_request(
+        self, method: str, url: str, kwargs: Dict[str, Any]
+    ) -> Response:
+        trace = HTTPTrace()
+        resp = None
+        try:
+            with self._span("request", url) as span:
+                resp = await self.aclient.request(
+                    method, url, **self._traced(kwargs, trace.acall)
+                )
+                span.bytes = resp.num_bytes_downloaded
+                if resp.is_error:
+                    span.error = f"HTTP {resp.status_code}"
+        finally:
+            self._emit_http(url, trace, resp)
+        return resp
+
+    async def _arequest(
+        self,
+        method: str,
+        url: str,
+        *,
+        idempotent: bool = True,
+        circuit: bool = True,
+        **kwargs,
+    ) -> Response:
+        breaker = self.breaker if circuit else None
+        attempt = 0
+        while True:
+            trial = breaker is not None and breaker.check()
+            try:
+                if self.on_span is None:
+                    resp = await self.aclient.request(method, url, **kwargs)
+                else:
+                    resp = await self._atraced_request(method, url, kwargs)
+                resp.raise_for_status()
+            except HTTPError as e:
+                delay = self._retry_delay(attempt, e, idempotent, breaker)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # cancelled, or not an http error: the trial has no verdict
+                self._abort_trial(trial)
+                raise
+            if breaker is not None:
+                breaker.record()
+            return resp
+
+    def _stream(
+        self,
+        method: str,
+        url: str,
+        parser: ImageStreamParser,
+        *,
+        idempotent: bool = True,
+        **kwargs,
+    ) -> None:
+        # `_request`, with the body fed to `parser` as it arrives.
+        # once the parser has data, a failure is not retried.
+        attempt = 0
+        while True:
+            trial = self.breaker is not None and self.breaker.check()
+            trace = HTTPTrace()
+            if self.on_span is not None:
+                kwargs = self._traced(kwargs, trace)
+            try:
+                with self._span("request", url) as span, self.client.stream(
+                    method, url, **kwargs
+                ) as resp:
+                    self._check_stream(resp, span)
+                    for chunk in resp.iter_bytes():
+                        parser.feed(chunk)
+                    span.bytes = resp.num_bytes_downloaded
+            except HTTPError as e:
+                delay = self._retry_delay(
+                    attempt, e, idempotent and not parser.started, self.breaker
+                )
+                if delay is None:
+                    parser.abort()
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                parser.abort()
+                self._abort_trial(trial)
+                raise
+            finally:
+                if self.on_span is not None:
+                    self._emit_http(url, trace, None)
+            if self.breaker is not None:
+                self.breaker.record()
+            return
+
+    async def _astream(
+        self,
+        method: str,
+        url: str,
+        parser: ImageStreamParser,
+        *,
+        idempotent: bool = True,
+        **kwargs,
+    ) -> None:
+        attempt = 0
+        while True:
+            trial = self.breaker is not None and self.breaker.check()
+            trace = HTTPTrace()
+            if self.on_span is not None:
+                kwargs = self._traced(kwargs, trace.acall)
+            try:
+                with self._span("request", url) as span:
+                    async with self.aclient.stream(method, url, **kwargs) as resp:
+                        self._check_stream(resp, span)
+                        async for chunk in resp.aiter_bytes():
+                            parser.feed(chunk)
+                        span.bytes = resp.num_bytes_downloaded
+            except HTTPError as e:
+                delay = self._retry_delay(
+                    attempt, e, idempotent and not parser.started, self.breaker
+                )
+                if delay is None:
+                    parser.abort()
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                parser.abort()
+                self._abort_trial(trial)
+                raise
+            finally:
+                if self.on_span is not None:
+                    self._emit_http(url, trace, None)
+            if self.breaker is not None:
+                self.breaker.record()
+            return
+
+    @staticmethod
+    def _check_stream(resp: Response, span: Span) -> None:
+        if resp.is_error:
+            span.error = f"HTTP {resp.status_code}"
+        resp.raise_for_status()
+
+    async def _apost_body(
+        self,
+        endpoint: str,
+        payload: Any,
+        client_kwargs: Optional[Mapping[str, Any]] = None,
+        *,
+        coalesce: bool = True,
+        idempotent: bool = True,
+    ) -> bytes:
+        async def fetch() -> bytes:
+            resp = await self._arequest(
+                "POST",
+                endpoint,
+                idempotent=idempotent,
+                json=payload,
+                **(client_kwargs or {}),
+            )
+            return resp.content
+
+        # client_kwargs can change the request in ways the key does not see
+        if not (self.coalesce and coalesce) or client_kwargs:
+            return await fetch()
+        return await self._flights.do(request_key(endpoint, payload), fetch)
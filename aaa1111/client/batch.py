@@ -0,0 +1,171 @@
+import asyncio
+import random
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+
+from aaa1111.typecheck import beartype
+from aaa1111.types.toimg import TXT2IMG, ToImageResponse
+from aaa1111.utils import arecursive_read_image
+
+from .base import request_key
+from .main import AAA1111
+from .pool import AAA1111Pool
+
+# per-image lists in the response info
+PER_IMAGE_INFO = (
+    "all_prompts",
+    "all_negative_prompts",
+    "all_seeds",
+    "all_subseeds",
+    "infotexts",
+)
+MAX_SEED = 4294967294
+
+Job = Tuple[Dict[str, Any], "asyncio.Future[ToImageResponse]"]
+
+
+def batch_key(payload: Dict[str, Any]) -> Optional[str]:
+    # jobs with the same key differ at most in the seed and can share a batch.
+    # with a subseed or a script, the images of a batch are not independent.
+    if payload.get("batch_size", 1) != 1 or payload.get("n_iter", 1) != 1:
+        return None
+    if payload.get("subseed_strength") or payload.get("script_name"):
+        return None
+    if not isinstance(payload.get("seed", -1), int):
+        return None
+    rest = {k: v for k, v in payload.items() if k != "seed"}
+    return request_key("txt2img", rest)
+
+
+def split_batches(jobs: List[Job], max_batch: int) -> List[List[Job]]:
+    # webui uses seed, seed + 1, ... for the images of a batch, so jobs
+    # with an explicit seed are batched only with consecutive seeds.
+    # jobs with a random seed fit anywhere.
+    batches = []
+    fixed = sorted(
+        (j for j in jobs if j[0].get("seed", -1) != -1), key=lambda j: j[0]["seed"]
+    )
+    run: List[Job] = []
+    for job in fixed:
+        prev = run[-1][0]["seed"] if run else None
+        if run and (job[0]["seed"] != prev + 1 or len(run) == max_batch):
+            batches.append(run)
+            run = []
+        run.append(job)
+    if run:
+        batches.append(run)
+
+    free = [j for j in jobs if j[0].get("seed", -1) == -1]
+    batches.extend(free[i : i + max_batch] for i in range(0, len(free), max_batch))
+    return batches
+
+
+def split_response(resp: ToImageResponse, seeds: List[int]) -> List[ToImageResponse]:
+    # the grid image, if the server returned one, comes first
+    first = resp.info.get("index_of_first_image", 0)
+    images = resp.images[first:]
+    if len(images) < len(seeds):
+        msg = f"expected {len(seeds)} images in the batch, got {len(images)}"
+        raise ValueError(msg)
+
+    resps = []
+    for i, seed in enumerate(seeds):
+        info = {**resp.info, "index_of_first_image": 0, "seed": seed, "batch_size": 1}
+        for k in PER_IMAGE_INFO:
+            v = resp.info.get(k)
+            if isinstance(v, list):
+                v = v[first:] if k == "infotexts" else v
+                info[k] = v[i : i + 1]
+        if info.get("all_subseeds"):
+            info["subseed"] = info["all_subseeds"][0]
+        parameters = {**resp.parameters, "seed": seed, "batch_size": 1}
+        resps.append(
+            ToImageResponse(images=images[i : i + 1], parameters=parameters, info=info)
+        )
+    return resps
+
+
+@beartype
+class MicroBatcher:
+    # txt2img requests that differ only in the seed, made within `window`
+    # seconds of each other, are sent as one request with a larger batch_size.
+    # every caller gets a response with only its own image.
+    def __init__(
+        self,
+        client: Union[AAA1111, AAA1111Pool],
+        window: float = 0.05,
+        max_batch: int = 8,
+    ):
+        if max_batch < 1:
+            msg = f"max_batch must be 1 or greater, got {max_batch}"
+            raise ValueError(msg)
+        self.client = client
+        self.window = window
+        self.max_batch = max_batch
+        self._groups: Dict[str, List[Job]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks = set()
+
+    async def _prepare(self, payload: Any, kwargs: Mapping[str, Any]) -> Dict[str, Any]:
+        base = self.client
+        if isinstance(base, AAA1111Pool):
+            base = base.backends[0]
+        payload = await base._aget_payload(payload)
+        payload = {**base.defaults, **payload, **kwargs}
+        payload = await base._aconvert_script(payload)
+        # images are encoded before keying, the key is made of json
+        return await arecursive_read_image(payload)
+
+    async def atxt2img(
+        self,
+        payload: Union[str, Path, Mapping[str, Any], TXT2IMG],
+        **kwargs,
+    ) -> ToImageResponse:
+        payload = await self._prepare(payload, kwargs)
+        key = batch_key(payload)
+        if key is None:
+            return await self.client.atxt2img(payload)
+
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        group = self._groups.setdefault(key, [])
+        group.append((payload, fut))
+        if len(group) >= self.max_batch:
+            self._flush(key)
+        elif len(group) == 1:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return await fut
+
+    def _flush(self, key: str) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        jobs = [j for j in self._groups.pop(key, []) if not j[1].done()]
+        for batch in split_batches(jobs, self.max_batch):
+            task = asyncio.ensure_future(self._run(batch))
+            # keep a reference, the loop only holds weak ones
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Job]) -> None:
+        seeds = [payload.get("seed", -1) for payload, _ in batch]
+        if seeds[0] == -1:
+            start = random.randrange(MAX_SEED - len(batch))
+            seeds = [start + i for i in range(len(batch))]
+
+        try:
+            if len(batch) == 1:
+                resps = [await self.client.atxt2img(batch[0][0])]
+            else:
+                payload = {**batch[0][0], "seed": seeds[0], "batch_size": len(batch)}
+                resp = await self.client.atxt2img(payload)
+                resps = split_response(resp, seeds)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        for (_, fut), resp in zip(batch, resps):
+            if not fut.done():
+                fut.set_result(resp)
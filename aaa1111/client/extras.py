@@ -2,12 +2,15 @@ from abc import ABC
 from pathlib import Path
 from typing import Any, Mapping, Optional, Union
 
-from beartype import beartype
+import orjson
 from httpx import AsyncClient, Client
 
+from aaa1111.stream import ImageSink, ImageStreamParser
+from aaa1111.typecheck import beartype
 from aaa1111.types.extras import (
     ExtrasBatchImages,
     ExtrasBatchImagesResponse,
+    ExtrasBatchImagesStreamResponse,
     ExtrasSingleImage,
     ExtrasSingleImageResponse,
 )
@@ -33,21 +36,24 @@ class ExtrasMixin(ABC):
         client_kwargs: Optional[Mapping[str, Any]] = None,
         **kwargs,
     ):
-        payload = self._get_payload(payload)
-        if payload["image"] is not None:
-            payload["image"] = image_to_base64(payload["image"])
+        with self._span("payload", EXTRA_SINGLE_IMAGE):
+            payload = self._get_payload(payload)
+        with self._span("encode", EXTRA_SINGLE_IMAGE):
+            if payload["image"] is not None:
+                payload["image"] = image_to_base64(payload["image"])
         payload = {**payload, **kwargs}
 
-        resp = self.client.post(
-            EXTRA_SINGLE_IMAGE, json=payload, **(client_kwargs or {})
+        resp = self._request(
+            "POST", EXTRA_SINGLE_IMAGE, json=payload, **(client_kwargs or {})
         )
-        resp.raise_for_status()
 
-        data = resp.json()
-        return ExtrasSingleImageResponse(
-            html_info=data["html_info"],
-            image=data["image"],
-        )
+        with self._span("parse", EXTRA_SINGLE_IMAGE) as span:
+            span.bytes = len(resp.content)
+            data = resp.json()
+            return ExtrasSingleImageResponse(
+                html_info=data["html_info"],
+                image=data["image"],
+            )
 
     async def aextra_single_image(
         self,
@@ -55,21 +61,22 @@ class ExtrasMixin(ABC):
         client_kwargs: Optional[Mapping[str, Any]] = None,
         **kwargs,
     ):
-        payload = await self._aget_payload(payload)
-        if payload["image"] is not None:
-            payload["image"] = await aimage_to_base64(payload["image"])
+        with self._span("payload", EXTRA_SINGLE_IMAGE):
+            payload = await self._aget_payload(payload)
+        with self._span("encode", EXTRA_SINGLE_IMAGE):
+            if payload["image"] is not None:
+                payload["image"] = await aimage_to_base64(payload["image"])
         payload = {**payload, **kwargs}
 
-        resp = await self.aclient.post(
-            EXTRA_SINGLE_IMAGE, json=payload, **(client_kwargs or {})
-        )
-        resp.raise_for_status()
+        body = await self._apost_body(EXTRA_SINGLE_IMAGE, payload, client_kwargs)
 
-        data = resp.json()
-        return ExtrasSingleImageResponse(
-            html_info=data["html_info"],
-            image=data["image"],
-        )
+        with self._span("parse", EXTRA_SINGLE_IMAGE) as span:
+            span.bytes = len(body)
+            data = orjson.loads(body)
+            return ExtrasSingleImageResponse(
+                html_info=data["html_info"],
+                image=data["image"],
+            )
 
     def extra_batch_images(
         self,
@@ -77,38 +84,90 @@ class ExtrasMixin(ABC):
         client_kwargs: Optional[Mapping[str, Any]] = None,
         **kwargs,
     ):
-        payload = self._get_payload(payload)
-        payload = recursive_read_image(payload)
+        with self._span("payload", EXTRA_BATCH_IMAGES):
+            payload = self._get_payload(payload)
+        with self._span("encode", EXTRA_BATCH_IMAGES):
+            payload = recursive_read_image(payload)
+        payload = {**payload, **kwargs}
+
+        resp = self._request(
+            "POST", EXTRA_BATCH_IMAGES, json=payload, **(client_kwargs or {})
+        )
+
+        with self._span("parse", EXTRA_BATCH_IMAGES) as span:
+            span.bytes = len(resp.content)
+            data = resp.json()
+            return ExtrasBatchImagesResponse(
+                html_info=data["html_info"],
+                images=data["images"],
+            )
+
+    async def aextra_batch_images(
+        self,
+        payload: Union[str, Path, Mapping[str, Any], ExtrasBatchImages],
+        client_kwargs: Optional[Mapping[str, Any]] = None,
+        **kwargs,
+    ):
+        with self._span("payload", EXTRA_BATCH_IMAGES):
+            payload = await self._aget_payload(payload)
+        with self._span("encode", EXTRA_BATCH_IMAGES):
+            payload = await arecursive_read_image(payload)
         payload = {**payload, **kwargs}
 
-        resp = self.client.post(
-            EXTRA_BATCH_IMAGES, json=payload, **(client_kwargs or {})
+        body = await self._apost_body(EXTRA_BATCH_IMAGES, payload, client_kwargs)
+
+        with self._span("parse", EXTRA_BATCH_IMAGES) as span:
+            span.bytes = len(body)
+            data = orjson.loads(body)
+            return ExtrasBatchImagesResponse(
+                html_info=data["html_info"],
+                images=data["images"],
+            )
+
+    def extra_batch_images_stream(
+        self,
+        payload: Union[str, Path, Mapping[str, Any], ExtrasBatchImages],
+        sink: ImageSink,
+        client_kwargs: Optional[Mapping[str, Any]] = None,
+        **kwargs,
+    ):
+        with self._span("payload", EXTRA_BATCH_IMAGES):
+            payload = self._get_payload(payload)
+        with self._span("encode", EXTRA_BATCH_IMAGES):
+            payload = recursive_read_image(payload)
+        payload = {**payload, **kwargs}
+
+        parser = ImageStreamParser(sink)
+        self._stream(
+            "POST", EXTRA_BATCH_IMAGES, parser, json=payload, **(client_kwargs or {})
         )
-        resp.raise_for_status()
 
-        data = resp.json()
-        return ExtrasBatchImagesResponse(
+        data = parser.close()
+        return ExtrasBatchImagesStreamResponse(
             html_info=data["html_info"],
             images=data["images"],
         )
 
-    async def aextra_batch_images(
+    async def aextra_batch_images_stream(
         self,
         payload: Union[str, Path, Mapping[str, Any], ExtrasBatchImages],
+        sink: ImageSink,
         client_kwargs: Optional[Mapping[str, Any]] = None,
         **kwargs,
     ):
-        payload = await self._aget_payload(payload)
-        payload = await arecursive_read_image(payload)
+        with self._span("payload", EXTRA_BATCH_IMAGES):
+            payload = await self._aget_payload(payload)
+        with self._span("encode", EXTRA_BATCH_IMAGES):
+            payload = await arecursive_read_image(payload)
         payload = {**payload, **kwargs}
 
-        resp = await self.aclient.post(
-            EXTRA_BATCH_IMAGES, json=payload, **(client_kwargs or {})
+        parser = ImageStreamParser(sink)
+        await self._astream(
+            "POST", EXTRA_BATCH_IMAGES, parser, json=payload, **(client_kwargs or {})
         )
-        resp.raise_for_status()
 
-        data = resp.json()
-        return ExtrasBatchImagesResponse(
+        data = parser.close()
+        return ExtrasBatchImagesStreamResponse(
             html_info=data["html_info"],
             images=data["images"],
         )
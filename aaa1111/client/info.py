@@ -1,9 +1,10 @@
 from abc import ABC
 from typing import Any, Dict, List
 
-from beartype import beartype
+import orjson
 from httpx import AsyncClient, Client
 
+from aaa1111.typecheck import beartype
 from aaa1111.types.base import ImageType
 from aaa1111.types.info import (
     EmbeddingItem,
@@ -55,169 +56,145 @@ class InfoMixin(ABC):
 
     def png_info(self, image: ImageType):
         image = image_to_base64(image)
-        resp = self.client.post(PNG_INFO, json={"image": image})
-        resp.raise_for_status()
+        resp = self._request("POST", PNG_INFO, json={"image": image})
         return PNGInfoResponse(**resp.json())
 
     async def apng_info(self, image: ImageType):
         image = image_to_base64(image)
-        resp = await self.aclient.post(PNG_INFO, json={"image": image})
-        resp.raise_for_status()
-        return PNGInfoResponse(**resp.json())
+        body = await self._apost_body(PNG_INFO, {"image": image})
+        return PNGInfoResponse(**orjson.loads(body))
 
+    # polled while generating: a slow poll must not open the breaker
     def progress(self, skip_current_image: bool = False):
-        resp = self.client.get(
-            PROGRESS, params={"skip_current_image": skip_current_image}
+        resp = self._request(
+            "GET",
+            PROGRESS,
+            circuit=False,
+            params={"skip_current_image": skip_current_image},
         )
-        resp.raise_for_status()
         return ProgressResponse(**resp.json())
 
     async def aprogress(self, skip_current_image: bool = False):
-        resp = await self.aclient.get(
-            PROGRESS, params={"skip_current_image": skip_current_image}
+        resp = await self._arequest(
+            "GET",
+            PROGRESS,
+            circuit=False,
+            params={"skip_current_image": skip_current_image},
         )
-        resp.raise_for_status()
         return ProgressResponse(**resp.json())
 
     def cmd_flags(self) -> Dict[str, Any]:
-        resp = self.client.get(CMD_FLAGS)
-        resp.raise_for_status()
+        resp = self._request("GET", CMD_FLAGS)
         return resp.json()
 
     async def acmd_flags(self) -> Dict[str, Any]:
-        resp = await self.aclient.get(CMD_FLAGS)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", CMD_FLAGS)
         return resp.json()
 
     def samplers(self) -> List[SamplerItem]:
-        resp = self.client.get(SAMPLERS)
-        resp.raise_for_status()
+        resp = self._request("GET", SAMPLERS)
         return [SamplerItem(**item) for item in resp.json()]
 
     async def asamplers(self) -> List[SamplerItem]:
-        resp = await self.aclient.get(SAMPLERS)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", SAMPLERS)
         return [SamplerItem(**item) for item in resp.json()]
 
     def upscalers(self) -> List[UpscalerItem]:
-        resp = self.client.get(UPSCALERS)
-        resp.raise_for_status()
+        resp = self._request("GET", UPSCALERS)
         return [UpscalerItem(**item) for item in resp.json()]
 
     async def aupscalers(self) -> List[UpscalerItem]:
-        resp = await self.aclient.get(UPSCALERS)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", UPSCALERS)
         return [UpscalerItem(**item) for item in resp.json()]
 
     def latent_upscale_modes(self) -> List[LatentUpscalerModeItem]:
-        resp = self.client.get(LATENT_UPSCALE_MODES)
-        resp.raise_for_status()
+        resp = self._request("GET", LATENT_UPSCALE_MODES)
         return [LatentUpscalerModeItem(**item) for item in resp.json()]
 
     async def alatent_upscale_modes(self) -> List[LatentUpscalerModeItem]:
-        resp = await self.aclient.get(LATENT_UPSCALE_MODES)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", LATENT_UPSCALE_MODES)
         return [LatentUpscalerModeItem(**item) for item in resp.json()]
 
     def sd_models(self) -> List[SDModelItem]:
-        resp = self.client.get(SD_MODELS)
-        resp.raise_for_status()
+        resp = self._request("GET", SD_MODELS)
         return [SDModelItem(**item) for item in resp.json()]
 
     async def asd_models(self) -> List[SDModelItem]:
-        resp = await self.aclient.get(SD_MODELS)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", SD_MODELS)
         return [SDModelItem(**item) for item in resp.json()]
 
     def sd_vae(self) -> List[SDVaeItem]:
-        resp = self.client.get(SD_VAE)
-        resp.raise_for_status()
+        resp = self._request("GET", SD_VAE)
         return [SDVaeItem(**item) for item in resp.json()]
 
     async def asd_vae(self) -> List[SDVaeItem]:
-        resp = await self.aclient.get(SD_VAE)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", SD_VAE)
         return [SDVaeItem(**item) for item in resp.json()]
 
     def hypernetworks(self) -> List[HypernetworkItem]:
-        resp = self.client.get(HYPERNETWORKS)
-        resp.raise_for_status()
+        resp = self._request("GET", HYPERNETWORKS)
         return [HypernetworkItem(**item) for item in resp.json()]
 
     async def ahypernetworks(self) -> List[HypernetworkItem]:
-        resp = await self.aclient.get(HYPERNETWORKS)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", HYPERNETWORKS)
         return [HypernetworkItem(**item) for item in resp.json()]
 
     def face_restorers(self) -> List[FaceRestorerItem]:
-        resp = self.client.get(FACE_RESTORERS)
-        resp.raise_for_status()
+        resp = self._request("GET", FACE_RESTORERS)
         return [FaceRestorerItem(**item) for item in resp.json()]
 
     async def aface_restorers(self) -> List[FaceRestorerItem]:
-        resp = await self.aclient.get(FACE_RESTORERS)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", FACE_RESTORERS)
         return [FaceRestorerItem(**item) for item in resp.json()]
 
     def realesrgan_models(self) -> List[RealesrganItem]:
-        resp = self.client.get(REALESRGAN_MODELS)
-        resp.raise_for_status()
+        resp = self._request("GET", REALESRGAN_MODELS)
         return [RealesrganItem(**item) for item in resp.json()]
 
     async def arealesrgan_models(self) -> List[RealesrganItem]:
-        resp = await self.aclient.get(REALESRGAN_MODELS)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", REALESRGAN_MODELS)
         return [RealesrganItem(**item) for item in resp.json()]
 
     def prompt_styles(self) -> List[PromptStyleItem]:
-        resp = self.client.get(PROMPT_STYLES)
-        resp.raise_for_status()
+        resp = self._request("GET", PROMPT_STYLES)
         return [PromptStyleItem(**item) for item in resp.json()]
 
     async def aprompt_styles(self) -> List[PromptStyleItem]:
-        resp = await self.aclient.get(PROMPT_STYLES)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", PROMPT_STYLES)
         return [PromptStyleItem(**item) for item in resp.json()]
 
     def embeddings(self) -> EmbeddingsResponse:
-        resp = self.client.get(EMBEDDINGS)
-        resp.raise_for_status()
+        resp = self._request("GET", EMBEDDINGS)
         data = resp.json()
         loaded = {k: EmbeddingItem(**v) for k, v in data["loaded"].items()}
         skipped = {k: EmbeddingItem(**v) for k, v in data["skipped"].items()}
         return EmbeddingsResponse(loaded=loaded, skipped=skipped)
 
     async def aembeddings(self) -> EmbeddingsResponse:
-        resp = await self.aclient.get(EMBEDDINGS)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", EMBEDDINGS)
         data = resp.json()
         loaded = {k: EmbeddingItem(**v) for k, v in data["loaded"].items()}
         skipped = {k: EmbeddingItem(**v) for k, v in data["skipped"].items()}
         return EmbeddingsResponse(loaded=loaded, skipped=skipped)
 
     def memory(self) -> MemoryResponse:
-        resp = self.client.get(MEMORY)
-        resp.raise_for_status()
+        resp = self._request("GET", MEMORY)
         return MemoryResponse(**resp.json())
 
     async def amemory(self) -> MemoryResponse:
-        resp = await self.aclient.get(MEMORY)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", MEMORY)
         return MemoryResponse(**resp.json())
 
     def scripts(self) -> ScriptsList:
-        resp = self.client.get(SCRIPTS)
-        resp.raise_for_status()
+        resp = self._request("GET", SCRIPTS)
         return ScriptsList(**resp.json())
 
     async def ascripts(self) -> ScriptsList:
-        resp = await self.aclient.get(SCRIPTS)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", SCRIPTS)
         return ScriptsList(**resp.json())
 
     def script_info(self) -> List[ScriptInfo]:
-        resp = self.client.get(SCRIPT_INFO)
-        resp.raise_for_status()
+        resp = self._request("GET", SCRIPT_INFO)
         return [
             ScriptInfo(
                 name=item["name"],
@@ -229,8 +206,7 @@ class InfoMixin(ABC):
         ]
 
     async def ascript_info(self) -> List[ScriptInfo]:
-        resp = await self.aclient.get(SCRIPT_INFO)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", SCRIPT_INFO)
         return [
             ScriptInfo(
                 name=item["name"],
@@ -242,21 +218,17 @@ class InfoMixin(ABC):
         ]
 
     def loras(self) -> List[LoraInfo]:
-        resp = self.client.get(LORAS)
-        resp.raise_for_status()
+        resp = self._request("GET", LORAS)
         return [LoraInfo(**item) for item in resp.json()]
 
     async def aloras(self) -> List[LoraInfo]:
-        resp = await self.aclient.get(LORAS)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", LORAS)
         return [LoraInfo(**item) for item in resp.json()]
 
     def lycos(self) -> List[LycoInfo]:
-        resp = self.client.get(LYCOS)
-        resp.raise_for_status()
+        resp = self._request("GET", LYCOS)
         return [LycoInfo(**item) for item in resp.json()]
 
     async def alycos(self) -> List[LycoInfo]:
-        resp = await self.aclient.get(LYCOS)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", LYCOS)
         return [LycoInfo(**item) for item in resp.json()]
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+from abc import ABC
+from typing import Any, Dict, Tuple
+
+from aaa1111.typecheck import beartype
+
+# seconds a server inventory stays fresh.
+# lists that change by adding files to the server expire sooner,
+# the built-in ones practically never.
+INVENTORY_TTL: Dict[str, float] = {
+    "cmd_flags": float("inf"),
+    "samplers": 3600.0,
+    "upscalers": 3600.0,
+    "latent_upscale_modes": 3600.0,
+    "face_restorers": 3600.0,
+    "realesrgan_models": 3600.0,
+    "scripts": 3600.0,
+    "script_info": 3600.0,
+    "sd_models": 300.0,
+    "sd_vae": 300.0,
+    "hypernetworks": 300.0,
+    "prompt_styles": 300.0,
+    "embeddings": 300.0,
+    "loras": 300.0,
+    "lycos": 300.0,
+}
+
+
+@beartype
+class InventoryMixin(ABC):
+    inventory_ttl: Dict[str, float]
+    _inventory: Dict[str, Tuple[float, Any]]
+    _inventory_gen: int
+    _inventory_lock: threading.Lock
+
+    def _inventory_name(self, name: str) -> str:
+        if name not in self.inventory_ttl:
+            msg = f"unknown inventory: {name!r}, expected one of {sorted(self.inventory_ttl)}"
+            raise ValueError(msg)
+        return name
+
+    def _inventory_get(self, name: str) -> Tuple[bool, Any]:
+        with self._inventory_lock:
+            entry = self._inventory.get(name)
+        if entry is None or entry[0] < time.monotonic():
+            return False, None
+        return True, entry[1]
+
+    def _inventory_put(self, name: str, gen: int, value: Any) -> None:
+        expires = time.monotonic() + self.inventory_ttl[name]
+        with self._inventory_lock:
+            # drop results fetched before an invalidation
+            if gen == self._inventory_gen:
+                self._inventory[name] = (expires, value)
+
+    def inventory(self, name: str) -> Any:
+        # cached result of the info method `name`, e.g. "samplers".
+        # the value is shared between callers, do not modify it.
+        hit, value = self._inventory_get(self._inventory_name(name))
+        if hit:
+            return value
+        gen = self._inventory_gen
+        value = getattr(self, name)()
+        self._inventory_put(name, gen, value)
+        return value
+
+    async def ainventory(self, name: str) -> Any:
+        hit, value = self._inventory_get(self._inventory_name(name))
+        if hit:
+            return value
+
+        async def fetch() -> Any:
+            gen = self._inventory_gen
+            value = await getattr(self, f"a{name}")()
+            self._inventory_put(name, gen, value)
+            return value
+
+        return await self._flights.do(f"inventory:{name}", fetch)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: self.inventory(name) for name in self.inventory_ttl}
+
+    async def asnapshot(self) -> Dict[str, Any]:
+        names = list(self.inventory_ttl)
+        values = await asyncio.gather(*(self.ainventory(name) for name in names))
+        return dict(zip(names, values))
+
+    def invalidate(self, *names: str) -> None:
+        # forget the given inventories, or all of them
+        with self._inventory_lock:
+            self._inventory_gen += 1
+            if not names:
+                self._inventory.clear()
+            for name in names:
+                self._inventory.pop(name, None)
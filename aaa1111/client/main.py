@@ -1,21 +1,45 @@
-import asyncio
+import threading
 from pathlib import Path
-from typing import Any, Mapping, Optional, Union
+from typing import Any, Dict, Mapping, Optional, Union
 
-from beartype import beartype
-from httpx import URL, AsyncClient, BasicAuth, Client, Timeout
+from httpx import (
+    URL,
+    AsyncClient,
+    AsyncHTTPTransport,
+    BasicAuth,
+    Client,
+    HTTPTransport,
+    Limits,
+    Timeout,
+)
 
+from aaa1111.cache import ResultCache
+from aaa1111.trace import SpanHook
+from aaa1111.typecheck import beartype
 from aaa1111.utils import load_from_file
 
 from .action import ActionMixin
+from .base import RequestMixin, SingleFlight
 from .extras import ExtrasMixin
 from .info import InfoMixin
+from .inventory import INVENTORY_TTL, InventoryMixin
 from .options import OptionsMixin
+from .resilience import CircuitBreaker, RetryPolicy
 from .toimg import ToImageMixin
+from .watch import WatchMixin
 
 
 @beartype
-class AAA1111(OptionsMixin, InfoMixin, ActionMixin, ExtrasMixin, ToImageMixin):
+class AAA1111(
+    OptionsMixin,
+    InfoMixin,
+    ActionMixin,
+    ExtrasMixin,
+    ToImageMixin,
+    InventoryMixin,
+    WatchMixin,
+    RequestMixin,
+):
     def __init__(
         self,
         host: str = "127.0.0.1",
@@ -26,6 +50,16 @@ class AAA1111(OptionsMixin, InfoMixin, ActionMixin, ExtrasMixin, ToImageMixin):
         password: Union[str, bytes, None] = None,
         defaults: Union[str, Path, Mapping[str, Any], None] = None,
         client_kwargs: Optional[Mapping[str, Any]] = None,
+        result_cache: Union[str, Path, ResultCache, None] = None,
+        coalesce: bool = True,
+        inventory_ttl: Optional[Mapping[str, float]] = None,
+        retry: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        on_span: Optional[SpanHook] = None,
+        max_connections: Optional[int] = 100,
+        max_keepalive_connections: Optional[int] = 20,
+        keepalive_expiry: Optional[float] = 5.0,
+        uds: Optional[str] = None,
     ):
         if base_url is None:
             pre = "https" if https else "http"
@@ -38,47 +72,140 @@ class AAA1111(OptionsMixin, InfoMixin, ActionMixin, ExtrasMixin, ToImageMixin):
         else:
             self.defaults = defaults or {}
 
+        if isinstance(result_cache, (str, Path)):
+            result_cache = ResultCache(result_cache)
+        self.result_cache = result_cache
+        self.coalesce = coalesce
+        self.retry = retry
+        self.breaker = breaker
+        # called with a Span for every phase of a call, see aaa1111.trace
+        self.on_span = on_span
+        self._flights = SingleFlight()
+
+        self.inventory_ttl = {**INVENTORY_TTL, **(inventory_ttl or {})}
+        self._inventory = {}
+        self._inventory_gen = 0
+        self._inventory_lock = threading.Lock()
+
         auth = BasicAuth(username, password) if username else None
-        kwargs = {
+        self._client_kwargs = {
             "auth": auth,
             "follow_redirects": True,
             "base_url": init_base_url,
             "timeout": None,
+            "limits": Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
             **(client_kwargs or {}),
         }
-        self.client = Client(**kwargs)
-        self.aclient = AsyncClient(**kwargs)
+        self.uds = uds
+
+        # created on first use, most programs only need one of them
+        self._client: Optional[Client] = None
+        self._aclient: Optional[AsyncClient] = None
+        self._client_lock = threading.Lock()
+
+    def _make_kwargs(self, transport_cls: Any) -> Dict[str, Any]:
+        kwargs = dict(self._client_kwargs)
+        if self.uds is not None and "transport" not in kwargs:
+            kwargs["transport"] = transport_cls(
+                verify=kwargs.get("verify", True),
+                cert=kwargs.get("cert"),
+                http2=kwargs.get("http2", False),
+                limits=kwargs["limits"],
+                uds=self.uds,
+            )
+        return kwargs
+
+    @property
+    def client(self) -> Client:
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = Client(**self._make_kwargs(HTTPTransport))
+        return self._client
+
+    @property
+    def aclient(self) -> AsyncClient:
+        if self._aclient is None:
+            with self._client_lock:
+                if self._aclient is None:
+                    kwargs = self._make_kwargs(AsyncHTTPTransport)
+                    self._aclient = AsyncClient(**kwargs)
+        return self._aclient
+
+    @property
+    def get(self):
+        return self.client.get
+
+    @property
+    def aget(self):
+        return self.aclient.get
+
+    @property
+    def post(self):
+        return self.client.post
+
+    @property
+    def apost(self):
+        return self.aclient.post
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
 
-        self.get = self.client.get
-        self.aget = self.aclient.get
-        self.post = self.client.post
-        self.apost = self.aclient.post
+    async def aclose(self) -> None:
+        self.close()
+        if self._aclient is not None:
+            await self._aclient.aclose()
+            self._aclient = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
 
     def __del__(self):
-        self.client.close()
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            loop = None
-        if loop and loop.is_running():
-            loop.create_task(self.aclient.aclose())
-        else:
-            asyncio.run(self.aclient.aclose())
+        # an async client can only be closed in its event loop, which may be
+        # gone by now. its connections are closed when they are collected.
+        client = getattr(self, "_client", None)
+        if client is not None:
+            client.close()
 
     @property
     def base_url(self) -> URL:
-        return self.client.base_url
+        for client in (self._client, self._aclient):
+            if client is not None:
+                return client.base_url
+        url = URL(self._client_kwargs["base_url"])
+        if not url.raw_path.endswith(b"/"):
+            url = url.copy_with(raw_path=url.raw_path + b"/")
+        return url
 
     @base_url.setter
     def base_url(self, url: Union[str, URL]):
-        self.client.base_url = url
-        self.aclient.base_url = url
+        self._client_kwargs["base_url"] = url
+        for client in (self._client, self._aclient):
+            if client is not None:
+                client.base_url = url
 
     @property
     def timeout(self) -> Timeout:
-        return self.client.timeout
+        return Timeout(self._client_kwargs["timeout"])
 
     @timeout.setter
     def timeout(self, timeout: Any):
-        self.client.timeout = timeout
-        self.aclient.timeout = timeout
+        self._client_kwargs["timeout"] = timeout
+        for client in (self._client, self._aclient):
+            if client is not None:
+                client.timeout = timeout
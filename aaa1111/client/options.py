@@ -1,10 +1,13 @@
 from abc import ABC
 from typing import Any, Dict
 
-from beartype import beartype
 from httpx import AsyncClient, Client
 
+from aaa1111.typecheck import beartype
+
 OPTIONS = "/sdapi/v1/options"
+# options that select the model, part of the result cache key
+MODEL_OPTIONS = ("sd_model_checkpoint", "sd_vae")
 
 
 @beartype
@@ -13,19 +16,23 @@ class OptionsMixin(ABC):
     aclient: AsyncClient
 
     def get_options(self) -> Dict[str, Any]:
-        resp = self.client.get(OPTIONS)
-        resp.raise_for_status()
+        resp = self._request("GET", OPTIONS)
         return resp.json()
 
     async def aget_options(self) -> Dict[str, Any]:
-        resp = await self.aclient.get(OPTIONS)
-        resp.raise_for_status()
+        resp = await self._arequest("GET", OPTIONS)
         return resp.json()
 
+    def model_options(self) -> Dict[str, Any]:
+        options = self.get_options()
+        return {k: options.get(k) for k in MODEL_OPTIONS}
+
+    async def amodel_options(self) -> Dict[str, Any]:
+        options = await self.aget_options()
+        return {k: options.get(k) for k in MODEL_OPTIONS}
+
     def set_options(self, **kwargs: Any) -> None:
-        resp = self.client.post(OPTIONS, json=kwargs)
-        resp.raise_for_status()
+        self._request("POST", OPTIONS, json=kwargs)
 
     async def aset_options(self, **kwargs: Any) -> None:
-        resp = await self.aclient.post(OPTIONS, json=kwargs)
-        resp.raise_for_status()
+        await self._arequest("POST", OPTIONS, json=kwargs)
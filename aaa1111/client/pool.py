@@ -0,0 +1,320 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import (
+    Any,
+    Collection,
+    Deque,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+from aaa1111.cache import ResultCache
+from aaa1111.trace import SpanHook
+from aaa1111.typecheck import beartype
+from aaa1111.types.info import ProgressResponse
+
+from .info import PROGRESS
+from .main import AAA1111
+from .resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+# latencies kept per method, and needed before hedging starts
+HEDGE_SAMPLES = 100
+HEDGE_MIN_SAMPLES = 20
+POLL_PARAMS = {"skip_current_image": True}
+
+
+async def first_result(tasks: Sequence["asyncio.Future[Any]"]) -> Any:
+    # the result of the first task that succeeds, or the last error
+    pending = set(tasks)
+    try:
+        while True:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for t in done:
+                if t.exception() is None:
+                    return t.result()
+            if not pending:
+                return done.pop().result()
+    finally:
+        for t in pending:
+            t.cancel()
+        # let the losers release their backend before returning
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+@beartype
+class AAA1111Pool:
+    def __init__(
+        self,
+        backends: Sequence[Union[str, AAA1111]],
+        username: Union[str, bytes, None] = None,
+        password: Union[str, bytes, None] = None,
+        defaults: Union[str, Path, Mapping[str, Any], None] = None,
+        client_kwargs: Optional[Mapping[str, Any]] = None,
+        result_cache: Union[str, Path, ResultCache, None] = None,
+        poll_interval: float = 1.0,
+        poll_timeout: float = 2.0,
+        retry: Optional[RetryPolicy] = None,
+        breaker: bool = False,
+        hedge_percentile: Optional[float] = None,
+        on_span: Optional[SpanHook] = None,
+    ):
+        if not backends:
+            msg = "at least one backend is required."
+            raise ValueError(msg)
+        if isinstance(result_cache, (str, Path)):
+            result_cache = ResultCache(result_cache)
+        if hedge_percentile is not None and not 0 < hedge_percentile < 1:
+            msg = f"hedge_percentile must be between 0 and 1, got {hedge_percentile}"
+            raise ValueError(msg)
+
+        self.backends: List[AAA1111] = [
+            b
+            if isinstance(b, AAA1111)
+            else AAA1111(
+                base_url=b,
+                username=username,
+                password=password,
+                defaults=defaults,
+                client_kwargs=client_kwargs,
+                result_cache=result_cache,
+                retry=retry,
+                breaker=CircuitBreaker() if breaker else None,
+                on_span=on_span,
+            )
+            for b in backends
+        ]
+        self.poll_interval = poll_interval
+        # a hung backend must not hold up the dispatch
+        self.poll_timeout = poll_timeout
+        self.hedge_percentile = hedge_percentile
+        self._latencies: Dict[str, Deque[float]] = {}
+
+        n = len(self.backends)
+        self._lock = threading.Lock()
+        self._in_flight = [0] * n
+        self._busy = [False] * n
+        self._eta = [0.0] * n
+        self._healthy = [True] * n
+        self._polled_at = [float("-inf")] * n
+        self._turn = 0
+
+    def __len__(self) -> int:
+        return len(self.backends)
+
+    def close(self) -> None:
+        for backend in self.backends:
+            backend.close()
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(backend.aclose() for backend in self.backends))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def in_flight(self) -> List[int]:
+        with self._lock:
+            return list(self._in_flight)
+
+    def _stale(self) -> List[int]:
+        # the stale backends are claimed: concurrent dispatches do not poll
+        # them again while this poll is running
+        with self._lock:
+            now = time.monotonic()
+            stale = [
+                i
+                for i, t in enumerate(self._polled_at)
+                if now - t >= self.poll_interval and self._in_flight[i] == 0
+            ]
+            for i in stale:
+                self._polled_at[i] = now
+        return stale
+
+    def _update(self, i: int, resp: Any) -> None:
+        with self._lock:
+            self._polled_at[i] = time.monotonic()
+            if isinstance(resp, Exception):
+                self._healthy[i] = False
+                return
+            self._healthy[i] = True
+            self._busy[i] = resp.progress > 0 or resp.state.get("job_count", 0) > 0
+            self._eta[i] = float(resp.eta_relative)
+
+    def _score(self, i: int) -> Tuple[int, int, float]:
+        # a backend that is busy while we have nothing in flight on it is
+        # serving someone else, so count that job as one of ours.
+        external = int(self._busy[i] and self._in_flight[i] == 0)
+        breaker = self.backends[i].breaker
+        unhealthy = not self._healthy[i] or (
+            breaker is not None and breaker.state == "open"
+        )
+        return (int(unhealthy), self._in_flight[i] + external, self._eta[i])
+
+    def _acquire(self, exclude: Collection[int] = ()) -> int:
+        with self._lock:
+            n = len(self.backends)
+            # rotate the starting point so ties are spread round-robin
+            order = [(self._turn + k) % n for k in range(n)]
+            i = min((j for j in order if j not in exclude), key=self._score)
+            self._turn = (i + 1) % n
+            self._in_flight[i] += 1
+            return i
+
+    def _release(self, i: int) -> None:
+        with self._lock:
+            self._in_flight[i] -= 1
+
+    def _progress(self, i: int) -> Union[ProgressResponse, Exception]:
+        # no retry or breaker, a failed poll only marks the backend unhealthy
+        try:
+            resp = self.backends[i].client.get(
+                PROGRESS, params=POLL_PARAMS, timeout=self.poll_timeout
+            )
+            resp.raise_for_status()
+            return ProgressResponse(**resp.json())
+        except Exception as e:
+            return e
+
+    async def _aprogress(self, i: int) -> Union[ProgressResponse, Exception]:
+        try:
+            resp = await self.backends[i].aclient.get(
+                PROGRESS, params=POLL_PARAMS, timeout=self.poll_timeout
+            )
+            resp.raise_for_status()
+            return ProgressResponse(**resp.json())
+        except Exception as e:
+            return e
+
+    def _poll(self) -> None:
+        # progress is only polled for idle backends: for the others,
+        # our own in-flight count is the better signal.
+        stale = self._stale()
+        if len(stale) == 1:
+            self._update(stale[0], self._progress(stale[0]))
+        elif stale:
+            with ThreadPoolExecutor(len(stale)) as executor:
+                for i, resp in zip(stale, executor.map(self._progress, stale)):
+                    self._update(i, resp)
+
+    async def _apoll(self) -> None:
+        stale = self._stale()
+        if not stale:
+            return
+        resps = await asyncio.gather(*(self._aprogress(i) for i in stale))
+        for i, resp in zip(stale, resps):
+            self._update(i, resp)
+
+    def _record(self, method: str, elapsed: float) -> None:
+        with self._lock:
+            latencies = self._latencies.setdefault(method, deque(maxlen=HEDGE_SAMPLES))
+            latencies.append(elapsed)
+
+    def _hedge_delay(self, method: str) -> Optional[float]:
+        if self.hedge_percentile is None or len(self.backends) < 2:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies.get(method, ()))
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[int(self.hedge_percentile * (len(latencies) - 1))]
+
+    def _dispatch(self, method: str, *args, **kwargs):
+        # no hedging here: it needs a second request in flight, see `_adispatch`
+        self._poll()
+        # a backend with an open circuit fails fast, try the next one
+        attempt = 0
+        while True:
+            i = self._acquire()
+            try:
+                return getattr(self.backends[i], method)(*args, **kwargs)
+            except CircuitOpenError:
+                attempt += 1
+                if attempt == len(self.backends):
+                    raise
+            finally:
+                self._release(i)
+
+    async def _acall(self, method: str, args: Any, kwargs: Any, running: Set[int]):
+        # `running`: the backends of the other copies of this call, not reused
+        attempt = 0
+        while True:
+            i = self._acquire(running)
+            running.add(i)
+            start = time.monotonic()
+            try:
+                resp = await getattr(self.backends[i], method)(*args, **kwargs)
+            except CircuitOpenError:
+                attempt += 1
+                if attempt == len(self.backends):
+                    raise
+                continue
+            finally:
+                running.discard(i)
+                self._release(i)
+            self._record(method, time.monotonic() - start)
+            return resp
+
+    async def _adispatch(self, method: str, *args, **kwargs):
+        await self._apoll()
+        delay = self._hedge_delay(method)
+        running: Set[int] = set()
+        first = asyncio.ensure_future(self._acall(method, args, kwargs, running))
+        if delay is None:
+            return await first
+
+        # slower than `hedge_percentile` of the recent calls:
+        # send the same request to another backend, and take the first answer.
+        # async only, the sync methods never hedge
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        if done:
+            return first.result()
+        second = asyncio.ensure_future(self._acall(method, args, kwargs, running))
+        return await first_result([first, second])
+
+    def txt2img(self, *args, **kwargs):
+        return self._dispatch("txt2img", *args, **kwargs)
+
+    async def atxt2img(self, *args, **kwargs):
+        return await self._adispatch("atxt2img", *args, **kwargs)
+
+    def img2img(self, *args, **kwargs):
+        return self._dispatch("img2img", *args, **kwargs)
+
+    async def aimg2img(self, *args, **kwargs):
+        return await self._adispatch("aimg2img", *args, **kwargs)
+
+    def extra_single_image(self, *args, **kwargs):
+        return self._dispatch("extra_single_image", *args, **kwargs)
+
+    async def aextra_single_image(self, *args, **kwargs):
+        return await self._adispatch("aextra_single_image", *args, **kwargs)
+
+    def extra_batch_images(self, *args, **kwargs):
+        return self._dispatch("extra_batch_images", *args, **kwargs)
+
+    async def aextra_batch_images(self, *args, **kwargs):
+        return await self._adispatch("aextra_batch_images", *args, **kwargs)
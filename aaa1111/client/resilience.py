@@ -0,0 +1,126 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from httpx import (
+    ConnectError,
+    ConnectTimeout,
+    HTTPStatusError,
+    PoolTimeout,
+    TransportError,
+)
+
+from aaa1111.typecheck import beartype
+
+# the request never reached the server, so it is always safe to send again
+NOT_SENT = (ConnectError, ConnectTimeout, PoolTimeout)
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def is_server_failure(exc: BaseException) -> bool:
+    # a 4xx means the server is fine and the request is not
+    if isinstance(exc, HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, TransportError)
+
+
+@beartype
+@dataclass
+class RetryPolicy:
+    # `attempts` is the total number of tries.
+    # the delay before retry n is uniform in [0, min(max_backoff, backoff * 2**n)],
+    # or Retry-After if the server sent a longer one.
+    # txt2img/img2img are only retried when they did not reach the server: after
+    # a read timeout the webui is likely still generating, and a retry would
+    # queue a second generation. `retry_generation` retries them like the rest.
+    attempts: int = 3
+    backoff: float = 0.5
+    max_backoff: float = 30.0
+    statuses: Tuple[int, ...] = (500, 502, 503, 504)
+    retry_generation: bool = False
+
+    def __post_init__(self):
+        if self.attempts < 1:
+            msg = f"attempts must be 1 or greater, got {self.attempts}"
+            raise ValueError(msg)
+
+    def retryable(self, exc: BaseException, idempotent: bool = True) -> bool:
+        if isinstance(exc, NOT_SENT):
+            return True
+        if not idempotent:
+            return False
+        if isinstance(exc, HTTPStatusError):
+            return exc.response.status_code in self.statuses
+        return isinstance(exc, TransportError)
+
+    def delay(
+        self, attempt: int, exc: BaseException, idempotent: bool = True
+    ) -> Optional[float]:
+        # seconds to wait before the next try, None to give up
+        if attempt + 1 >= self.attempts or not self.retryable(exc, idempotent):
+            return None
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+        if isinstance(exc, HTTPStatusError):
+            retry_after = exc.response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = max(delay, min(float(retry_after), self.max_backoff))
+        return delay
+
+
+class CircuitBreaker:
+    # after `threshold` server failures in a row, requests fail fast with
+    # CircuitOpenError for `reset_after` seconds. then a single trial request
+    # is let through: success closes the circuit, failure opens it again.
+    def __init__(self, threshold: int = 5, reset_after: float = 30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._trial or time.monotonic() - self._opened_at < self.reset_after:
+                return "open"
+            return "half-open"
+
+    def check(self) -> bool:
+        # True for the trial request, which must end with record() or abort()
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if (
+                not self._trial
+                and time.monotonic() - self._opened_at >= self.reset_after
+            ):
+                self._trial = True
+                return True
+        msg = f"circuit open after {self._failures} failures in a row"
+        raise CircuitOpenError(msg)
+
+    def abort(self) -> None:
+        # the trial request ended without an answer, e.g. it was cancelled:
+        # the next request is the trial
+        with self._lock:
+            self._trial = False
+
+    def record(self, exc: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if exc is None or not is_server_failure(exc):
+                self._failures = 0
+                self._opened_at = None
+                self._trial = False
+                return
+            self._failures += 1
+            if self._trial or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                self._trial = False
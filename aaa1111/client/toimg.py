@@ -3,10 +3,19 @@ from dataclasses import asdict, is_dataclass
 from pathlib import Path
 from typing import Any, Dict, Mapping, Optional, Union
 
-from beartype import beartype
+import orjson
 from httpx import AsyncClient, Client
 
-from aaa1111.types.toimg import IMG2IMG, TXT2IMG, ScriptBase, ToImageResponse
+from aaa1111.cache import ResultCache
+from aaa1111.stream import ImageSink, ImageStreamParser
+from aaa1111.typecheck import beartype
+from aaa1111.types.toimg import (
+    IMG2IMG,
+    TXT2IMG,
+    ScriptBase,
+    ToImageResponse,
+    ToImageStreamResponse,
+)
 from aaa1111.utils import (
     aload_from_file,
     arecursive_read_image,
@@ -14,12 +23,68 @@ from aaa1111.utils import (
     recursive_read_image,
 )
 
+from .options import MODEL_OPTIONS
+
 
 @beartype
 class ToImageMixin(ABC):
     client: Client
     aclient: AsyncClient
     defaults: Dict[str, Any]
+    result_cache: Optional[ResultCache]
+
+    def _prepare(
+        self, payload: Any, kwargs: Mapping[str, Any], endpoint: str = ""
+    ) -> Dict[str, Any]:
+        with self._span("payload", endpoint):
+            payload = self._get_payload(payload)
+            payload = {**self.defaults, **payload, **kwargs}
+            payload = self._convert_script(payload)
+        with self._span("encode", endpoint):
+            return recursive_read_image(payload)
+
+    async def _aprepare(
+        self, payload: Any, kwargs: Mapping[str, Any], endpoint: str = ""
+    ) -> Dict[str, Any]:
+        with self._span("payload", endpoint):
+            payload = await self._aget_payload(payload)
+            payload = {**self.defaults, **payload, **kwargs}
+            payload = await self._aconvert_script(payload)
+        with self._span("encode", endpoint):
+            return await arecursive_read_image(payload)
+
+    def _parse(self, endpoint: str, body: bytes) -> ToImageResponse:
+        with self._span("parse", endpoint) as span:
+            span.bytes = len(body)
+            data = orjson.loads(body)
+            return ToImageResponse(
+                images=data["images"],
+                parameters=data["parameters"],
+                info=data["info"],
+            )
+
+    def _result_key(self, endpoint: str, payload: Dict[str, Any]) -> Optional[str]:
+        if self.result_cache is None or not self.result_cache.cacheable(payload):
+            return None
+        # the loaded model is read for every call that does not set it: another
+        # client may have changed it, and a stale key would serve (or store)
+        # images of the wrong checkpoint
+        override = payload.get("override_settings") or {}
+        if any(k not in override for k in MODEL_OPTIONS):
+            override = {**self.model_options(), **override}
+        model = {k: override.get(k) for k in MODEL_OPTIONS}
+        return self.result_cache.key(endpoint, payload, model)
+
+    async def _aresult_key(
+        self, endpoint: str, payload: Dict[str, Any]
+    ) -> Optional[str]:
+        if self.result_cache is None or not self.result_cache.cacheable(payload):
+            return None
+        override = payload.get("override_settings") or {}
+        if any(k not in override for k in MODEL_OPTIONS):
+            override = {**await self.amodel_options(), **override}
+        model = {k: override.get(k) for k in MODEL_OPTIONS}
+        return self.result_cache.key(endpoint, payload, model)
 
     def _2img(
         self,
@@ -29,39 +94,101 @@ class ToImageMixin(ABC):
         endpoint: str,
         **kwargs,
     ):
-        payload = self._get_payload(payload)
-        payload = {**self.defaults, **payload, **kwargs}
-        payload = self._convert_script(payload)
-        payload = recursive_read_image(payload)
+        payload = self._prepare(payload, kwargs, endpoint)
+
+        key = self._result_key(endpoint, payload)
+        body = self.result_cache.get(key) if key else None
+        if body is None:
+            resp = self._request(
+                "POST",
+                endpoint,
+                idempotent=self._generation_idempotent(),
+                json=payload,
+                **(client_kwargs or {}),
+            )
+            body = resp.content
+            if key:
+                self.result_cache.put(key, body)
+
+        return self._parse(endpoint, body)
+
+    async def _a2img(
+        self,
+        payload: Union[str, Path, Mapping[str, Any], TXT2IMG, IMG2IMG],
+        client_kwargs: Optional[Mapping[str, Any]] = None,
+        *,
+        endpoint: str,
+        **kwargs,
+    ):
+        payload = await self._aprepare(payload, kwargs, endpoint)
+
+        key = await self._aresult_key(endpoint, payload)
+        body = self.result_cache.get(key) if key else None
+        if body is None:
+            # a random seed makes identical payloads different requests
+            body = await self._apost_body(
+                endpoint,
+                payload,
+                client_kwargs,
+                coalesce=ResultCache.cacheable(payload),
+                idempotent=self._generation_idempotent(),
+            )
+            if key:
+                self.result_cache.put(key, body)
+
+        return self._parse(endpoint, body)
+
+    def _2img_stream(
+        self,
+        payload: Union[str, Path, Mapping[str, Any], TXT2IMG, IMG2IMG],
+        sink: ImageSink,
+        client_kwargs: Optional[Mapping[str, Any]] = None,
+        *,
+        endpoint: str,
+        **kwargs,
+    ):
+        payload = self._prepare(payload, kwargs, endpoint)
 
-        resp = self.client.post(endpoint, json=payload, **(client_kwargs or {}))
-        resp.raise_for_status()
+        parser = ImageStreamParser(sink)
+        self._stream(
+            "POST",
+            endpoint,
+            parser,
+            idempotent=self._generation_idempotent(),
+            json=payload,
+            **(client_kwargs or {}),
+        )
 
-        data = resp.json()
-        return ToImageResponse(
+        data = parser.close()
+        return ToImageStreamResponse(
             images=data["images"],
             parameters=data["parameters"],
             info=data["info"],
         )
 
-    async def _a2img(
+    async def _a2img_stream(
         self,
         payload: Union[str, Path, Mapping[str, Any], TXT2IMG, IMG2IMG],
+        sink: ImageSink,
         client_kwargs: Optional[Mapping[str, Any]] = None,
         *,
         endpoint: str,
         **kwargs,
     ):
-        payload = await self._aget_payload(payload)
-        payload = {**self.defaults, **payload, **kwargs}
-        payload = await self._aconvert_script(payload)
-        payload = await arecursive_read_image(payload)
+        payload = await self._aprepare(payload, kwargs, endpoint)
 
-        resp = await self.aclient.post(endpoint, json=payload, **(client_kwargs or {}))
-        resp.raise_for_status()
-        data = resp.json()
+        parser = ImageStreamParser(sink)
+        await self._astream(
+            "POST",
+            endpoint,
+            parser,
+            idempotent=self._generation_idempotent(),
+            json=payload,
+            **(client_kwargs or {}),
+        )
 
-        return ToImageResponse(
+        data = parser.close()
+        return ToImageStreamResponse(
             images=data["images"],
             parameters=data["parameters"],
             info=data["info"],
@@ -119,6 +246,66 @@ class ToImageMixin(ABC):
             **kwargs,
         )
 
+    def txt2img_stream(
+        self,
+        payload: Union[str, Path, Mapping[str, Any], TXT2IMG],
+        sink: ImageSink,
+        client_kwargs: Optional[Mapping[str, Any]] = None,
+        **kwargs,
+    ):
+        return self._2img_stream(
+            payload,
+            sink,
+            client_kwargs=client_kwargs,
+            endpoint="/sdapi/v1/txt2img",
+            **kwargs,
+        )
+
+    async def atxt2img_stream(
+        self,
+        payload: Union[str, Path, Mapping[str, Any], TXT2IMG],
+        sink: ImageSink,
+        client_kwargs: Optional[Mapping[str, Any]] = None,
+        **kwargs,
+    ):
+        return await self._a2img_stream(
+            payload,
+            sink,
+            client_kwargs=client_kwargs,
+            endpoint="/sdapi/v1/txt2img",
+            **kwargs,
+        )
+
+    def img2img_stream(
+        self,
+        payload: Union[str, Path, Mapping[str, Any], IMG2IMG],
+        sink: ImageSink,
+        client_kwargs: Optional[Mapping[str, Any]] = None,
+        **kwargs,
+    ):
+        return self._2img_stream(
+            payload,
+            sink,
+            client_kwargs=client_kwargs,
+            endpoint="/sdapi/v1/img2img",
+            **kwargs,
+        )
+
+    async def aimg2img_stream(
+        self,
+        payload: Union[str, Path, Mapping[str, Any], IMG2IMG],
+        sink: ImageSink,
+        client_kwargs: Optional[Mapping[str, Any]] = None,
+        **kwargs,
+    ):
+        return await self._a2img_stream(
+            payload,
+            sink,
+            client_kwargs=client_kwargs,
+            endpoint="/sdapi/v1/img2img",
+            **kwargs,
+        )
+
     @staticmethod
     def _get_payload(payload: Any) -> Dict[str, Any]:
         if hasattr(payload, "asdict"):
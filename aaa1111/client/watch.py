@@ -0,0 +1,100 @@
+import asyncio
+from abc import ABC
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Mapping, Optional, Union
+
+from httpx import AsyncClient, HTTPError
+
+from aaa1111.typecheck import beartype
+from aaa1111.types.info import ProgressEvent
+from aaa1111.types.toimg import IMG2IMG, TXT2IMG
+
+
+def next_interval(eta: float, min_interval: float, max_interval: float) -> float:
+    # poll about ten times over the remaining time,
+    # rarely when the job has a long way to go, often near the end
+    return min(max(eta / 10, min_interval), max_interval)
+
+
+@beartype
+class WatchMixin(ABC):
+    aclient: AsyncClient
+
+    async def _awatch(
+        self,
+        job: Awaitable[Any],
+        *,
+        previews: bool,
+        min_interval: float,
+        max_interval: float,
+    ) -> AsyncIterator[ProgressEvent]:
+        task = asyncio.ensure_future(job)
+        interval = min_interval
+        state = {}
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=interval)
+                if done:
+                    break
+                try:
+                    resp = await self.aprogress(skip_current_image=not previews)
+                except HTTPError:
+                    # a failed poll is not a failed job
+                    interval = max_interval
+                    continue
+                state = resp.state
+                interval = next_interval(
+                    float(resp.eta_relative), min_interval, max_interval
+                )
+                yield ProgressEvent(
+                    progress=resp.progress,
+                    eta_relative=resp.eta_relative,
+                    state=resp.state,
+                    current_image=resp.current_image,
+                    textinfo=resp.textinfo,
+                )
+
+            yield ProgressEvent(
+                progress=1.0, eta_relative=0.0, state=state, result=task.result()
+            )
+        finally:
+            if not task.done():
+                task.cancel()
+
+    async def atxt2img_progress(
+        self,
+        payload: Union[str, Path, Mapping[str, Any], TXT2IMG],
+        client_kwargs: Optional[Mapping[str, Any]] = None,
+        *,
+        previews: bool = False,
+        min_interval: float = 0.25,
+        max_interval: float = 5.0,
+        **kwargs,
+    ) -> AsyncIterator[ProgressEvent]:
+        job = self.atxt2img(payload, client_kwargs, **kwargs)
+        async for event in self._awatch(
+            job,
+            previews=previews,
+            min_interval=min_interval,
+            max_interval=max_interval,
+        ):
+            yield event
+
+    async def aimg2img_progress(
+        self,
+        payload: Union[str, Path, Mapping[str, Any], IMG2IMG],
+        client_kwargs: Optional[Mapping[str, Any]] = None,
+        *,
+        previews: bool = False,
+        min_interval: float = 0.25,
+        max_interval: float = 5.0,
+        **kwargs,
+    ) -> AsyncIterator[ProgressEvent]:
+        job = self.aimg2img(payload, client_kwargs, **kwargs)
+        async for event in self._awatch(
+            job,
+            previews=previews,
+            min_interval=min_interval,
+            max_interval=max_interval,
+        ):
+            yield event
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Sequence, Set, Tuple
+
+import orjson
+
+JOURNAL_NAME = ".aaa1111-journal.jsonl"
+
+Key = Tuple[str, str, str, Optional[int]]
+
+
+def file_digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def when_saved(
+    futures: Sequence["Future[Path]"], callback: Callable[[List[Path]], Any]
+) -> None:
+    # call `callback` with the saved paths once every future succeeded
+    if not futures:
+        callback([])
+        return
+
+    lock = threading.Lock()
+    remaining = [len(futures)]
+
+    def done(fut: Future) -> None:
+        if fut.cancelled() or fut.exception() is not None:
+            return
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            callback([f.result() for f in futures])
+
+    for fut in futures:
+        fut.add_done_callback(done)
+
+
+class Journal:
+    # append-only jsonl of completed jobs, one line per param file:
+    # {"task", "file", "hash", "outputs", "time"}, and "index" for each
+    # combination of a sweep file.
+    # a job is recorded only after all of its images are saved, so a crash
+    # never marks unfinished work as done.
+    def __init__(self, save_dir: Path, name: str = JOURNAL_NAME):
+        self.path = save_dir.joinpath(name)
+        self._lock = threading.Lock()
+        self._completed: Optional[Set[Key]] = None
+
+    @staticmethod
+    def _key(task: str, file: Path, digest: str, index: Optional[int]) -> Key:
+        return (task, str(file.resolve()), digest, index)
+
+    def _load(self) -> Set[Key]:
+        completed = set()
+        if not self.path.is_file():
+            return completed
+
+        with self.path.open("rb") as f:
+            for line in f:
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # a partially written last line after a crash
+                    continue
+                completed.add(
+                    (entry["task"], entry["file"], entry["hash"], entry.get("index"))
+                )
+        return completed
+
+    def is_done(
+        self, task: str, file: Path, digest: str, index: Optional[int] = None
+    ) -> bool:
+        with self._lock:
+            if self._completed is None:
+                self._completed = self._load()
+            return self._key(task, file, digest, index) in self._completed
+
+    def record(
+        self,
+        task: str,
+        file: Path,
+        digest: str,
+        outputs: Sequence[Path],
+        index: Optional[int] = None,
+    ) -> None:
+        key = self._key(task, file, digest, index)
+        entry = {
+            "task": task,
+            "file": key[1],
+            "hash": digest,
+            "outputs": [os.path.abspath(p) for p in outputs],
+            "time": datetime.now(timezone.utc).isoformat(),
+        }
+        if index is not None:
+            entry["index"] = index
+        line = orjson.dumps(entry) + b"\n"
+
+        with self._lock:
+            with self.path.open("ab") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            if self._completed is not None:
+                self._completed.add(key)
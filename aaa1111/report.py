@@ -0,0 +1,469 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+import orjson
+
+from aaa1111.trace import Span
+
+# prometheus histogram buckets of the job latency, seconds
+BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0)
+# latencies below this share the first bucket of a `LatencySketch`
+MIN_LATENCY = 1e-6
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    # the value at the rounded interpolation index (numpy's "nearest"),
+    # `values` sorted
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+class LatencySketch:
+    # latencies counted in log-spaced buckets, quantiles within `accuracy`
+    # relative error: a run of any length takes a few hundred counters
+    def __init__(self, accuracy: float = 0.01):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self._counts: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        key = math.ceil(math.log(max(value, MIN_LATENCY)) / self._log_gamma)
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        # the bucket holding the value `percentile` would pick
+        if not self.count:
+            return 0.0
+        rank = round(q * (self.count - 1))
+        seen = 0
+        for key in sorted(self._counts):
+            seen += self._counts[key]
+            if seen > rank:
+                return min(self.max, 2 * self.gamma**key / (self.gamma + 1))
+        return self.max
+
+
+@dataclass
+class JobStats:
+    # one generate call, filled in by the request spans sent while it runs
+    # and the "save" spans of its images
+    endpoint: str
+    start: float = 0.0
+    end: float = 0.0
+    backend: str = ""
+    requests: int = 0
+    failed_requests: int = 0
+    downloaded: int = 0
+    phases: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None  # the generate call raised
+    # the images of a job are saved by several writer threads
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, repr=False, compare=False
+    )
+
+    @property
+    def latency(self) -> float:
+        return self.end - self.start
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self._add(span)
+
+    def _add(self, span: Span) -> None:
+        self.phases[span.name] = self.phases.get(span.name, 0.0) + span.duration
+        if span.name != "request":
+            return
+        self.requests += 1
+        if span.error is not None:
+            self.failed_requests += 1
+            return
+        self.backend = span.backend
+        self.downloaded += span.bytes
+
+
+_current: ContextVar[Optional[JobStats]] = ContextVar("aaa1111_job", default=None)
+
+
+@contextmanager
+def track(endpoint: str) -> Iterator[JobStats]:
+    # spans of `endpoint` sent in this block, in this thread or task and the
+    # tasks it starts, are added to the stats
+    stats = JobStats(endpoint, time.perf_counter())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        stats.end = time.perf_counter()
+        _current.reset(token)
+
+
+@contextmanager
+def attach(stats: JobStats) -> Iterator[JobStats]:
+    # spans sent in this block are added to the stats of a finished `track`,
+    # e.g. the "save" spans of the images it submits to an ImageWriter
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def on_span(span: Span) -> None:
+    # the `on_span` hook of the clients and the ImageWriter, for `track`
+    stats = _current.get()
+    if stats is not None and span.endpoint in (stats.endpoint, ""):
+        stats.add(span)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _labels(**labels: str) -> str:
+    text = ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in labels.items()
+    )
+    return "{" + text + "}"
+
+
+class Metrics:
+    # counters of a run in the prometheus text format, written to a file
+    # (node_exporter's textfile collector) and/or served on /metrics
+    def __init__(self, task: str):
+        self.task = task
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self.planned = 0
+        self.jobs: Dict[Tuple[str, str], int] = {}
+        self.requests: Dict[Tuple[str, str], int] = {}
+        self.downloaded: Dict[str, int] = {}
+        self.images = 0
+        self.output_bytes = 0
+        self.buckets = [0] * len(BUCKETS)
+        self.latency = LatencySketch()
+        self._server: Any = None
+
+    def observe(self, record: Dict[str, Any]) -> None:
+        backend = record["backend"]
+        status = "failed" if record["error"] else "done"
+        with self._lock:
+            key = (backend, status)
+            self.jobs[key] = self.jobs.get(key, 0) + 1
+            failed = record["failed_requests"]
+            for s, n in (("ok", record["requests"] - failed), ("error", failed)):
+                if n:
+                    key = (backend, s)
+                    self.requests[key] = self.requests.get(key, 0) + n
+            self.downloaded[backend] = (
+                self.downloaded.get(backend, 0) + record["downloaded_bytes"]
+            )
+            self.images += record["images"]
+            self.output_bytes += record["bytes"]
+            for i, le in enumerate(BUCKETS):
+                if record["latency"] <= le:
+                    self.buckets[i] += 1
+            self.latency.add(record["latency"])
+
+    def totals(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "jobs": sum(self.jobs.values()),
+                "failed_jobs": sum(
+                    n for (_, s), n in self.jobs.items() if s == "failed"
+                ),
+                "images": self.images,
+                "bytes": self.output_bytes,
+                "downloaded_bytes": sum(self.downloaded.values()),
+                "requests": sum(self.requests.values()),
+                "failed_requests": sum(
+                    n for (_, s), n in self.requests.items() if s == "error"
+                ),
+                "latency": {
+                    "mean": (
+                        self.latency.sum / self.latency.count
+                        if self.latency.count
+                        else 0.0
+                    ),
+                    "p50": self.latency.quantile(0.50),
+                    "p90": self.latency.quantile(0.90),
+                    "p95": self.latency.quantile(0.95),
+                    "p99": self.latency.quantile(0.99),
+                    "max": self.latency.max,
+                },
+                "backends": self._backends(),
+            }
+
+    def _backends(self) -> Dict[str, int]:
+        backends: Dict[str, int] = {}
+        for (b, _), n in sorted(self.jobs.items()):
+            backends[b] = backends.get(b, 0) + n
+        return backends
+
+    def render(self) -> str:
+        task = self.task
+        lines = []
+
+        def metric(name: str, kind: str, help_: str, samples) -> None:
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_labels(**labels)} {value}")
+
+        with self._lock:
+            metric(
+                "aaa1111_run_start_time_seconds",
+                "gauge",
+                "Start time of the run since unix epoch.",
+                [("", {"task": task}, self._started)],
+            )
+            metric(
+                "aaa1111_jobs_planned",
+                "gauge",
+                "Jobs to run.",
+                [("", {"task": task}, self.planned)],
+            )
+            metric(
+                "aaa1111_jobs_total",
+                "counter",
+                "Finished jobs.",
+                [
+                    ("", {"task": task, "backend": b, "status": s}, n)
+                    for (b, s), n in sorted(self.jobs.items())
+                ],
+            )
+            metric(
+                "aaa1111_requests_total",
+                "counter",
+                "Generate requests, including retries.",
+                [
+                    ("", {"task": task, "backend": b, "status": s}, n)
+                    for (b, s), n in sorted(self.requests.items())
+                ],
+            )
+            metric(
+                "aaa1111_downloaded_bytes_total",
+                "counter",
+                "Bytes of the generate responses.",
+                [
+                    ("", {"task": task, "backend": b}, n)
+                    for b, n in sorted(self.downloaded.items())
+                ],
+            )
+            metric(
+                "aaa1111_images_total",
+                "counter",
+                "Saved images.",
+                [("", {"task": task}, self.images)],
+            )
+            metric(
+                "aaa1111_output_bytes_total",
+                "counter",
+                "Bytes of the saved images.",
+                [("", {"task": task}, self.output_bytes)],
+            )
+            metric(
+                "aaa1111_job_duration_seconds",
+                "histogram",
+                "Latency of the generate call of a job.",
+                [
+                    *(
+                        ("_bucket", {"task": task, "le": str(le)}, n)
+                        for le, n in zip(BUCKETS, self.buckets)
+                    ),
+                    ("_bucket", {"task": task, "le": "+Inf"}, self.latency.count),
+                    ("_sum", {"task": task}, self.latency.sum),
+                    ("_count", {"task": task}, self.latency.count),
+                ],
+            )
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path) -> None:
+        # replaced at once, a scraper never reads half a file
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(self.render())
+        os.replace(tmp, path)
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> int:
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server.server_address[1]
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class RunReport:
+    # jsonl of a cli run, appended to: one "job" record per param file (each
+    # combination of a sweep file) once its images are saved or its generate
+    # call failed, and a "summary" record at the end, of running totals kept
+    # in `metrics`. records of one run share its "run" start time.
+    def __init__(
+        self,
+        task: str,
+        path: Optional[Path] = None,
+        metrics_path: Optional[Path] = None,
+        metrics_port: Optional[int] = None,
+        metrics_host: str = "127.0.0.1",
+    ):
+        self.task = task
+        self.path = path
+        self.metrics_path = metrics_path
+        self.run = _now()
+        self.metrics = Metrics(task)
+        if metrics_port is not None:
+            self.metrics.serve(metrics_port, metrics_host)
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        if self.path is None:
+            return
+        with self.path.open("ab") as f:
+            f.write(orjson.dumps(record) + b"\n")
+
+    def plan(self, jobs: int) -> None:
+        self.metrics.planned = jobs
+        if self.metrics_path is not None:
+            self.metrics.write(self.metrics_path)
+
+    def job(
+        self,
+        file: Path,
+        index: Optional[int],
+        stats: JobStats,
+        saved: Sequence["Future[Path]"],
+    ) -> None:
+        # recorded once every image is saved or failed to
+        lock = threading.Lock()
+        remaining = [len(saved)]
+        save_start = time.perf_counter()
+
+        def done(_: Any = None) -> None:
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] <= 0
+            if last:
+                self._record(file, index, stats, saved, save_start)
+
+        if not saved:
+            done()
+        for fut in saved:
+            fut.add_done_callback(done)
+
+    def _record(
+        self,
+        file: Path,
+        index: Optional[int],
+        stats: JobStats,
+        saved: Sequence["Future[Path]"],
+        save_start: float,
+    ) -> None:
+        outputs = []
+        errors = [stats.error] if stats.error is not None else []
+        for fut in saved:
+            exc = fut.exception()
+            if exc is not None:
+                errors.append(f"{type(exc).__name__}: {exc}")
+                continue
+            path = fut.result()
+            outputs.append({"path": os.path.abspath(path), "bytes": _size(path)})
+
+        record: Dict[str, Any] = {
+            "type": "job",
+            "run": self.run,
+            "task": self.task,
+            "file": os.path.abspath(file),
+            "time": _now(),
+            "backend": stats.backend,
+            "start": stats.start - self._start,
+            "latency": stats.latency,
+            "save": time.perf_counter() - save_start,
+            "phases": stats.phases,
+            "requests": stats.requests,
+            "failed_requests": stats.failed_requests,
+            "downloaded_bytes": stats.downloaded,
+            "images": len(outputs),
+            "bytes": sum(o["bytes"] for o in outputs),
+            "outputs": outputs,
+            "error": "; ".join(errors) or None,
+        }
+        if index is not None:
+            record["index"] = index
+
+        with self._lock:
+            self._write(record)
+        self.metrics.observe(record)
+        if self.metrics_path is not None:
+            self.metrics.write(self.metrics_path)
+
+    def summary(self, error: Optional[BaseException] = None) -> Dict[str, Any]:
+        seconds = time.perf_counter() - self._start
+        totals = self.metrics.totals()
+        return {
+            "type": "summary",
+            "run": self.run,
+            "task": self.task,
+            "time": _now(),
+            "seconds": seconds,
+            **totals,
+            "images_per_second": totals["images"] / seconds if seconds else 0.0,
+            "jobs_per_second": totals["jobs"] / seconds if seconds else 0.0,
+            "error": None if error is None else f"{type(error).__name__}: {error}",
+        }
+
+    def close(self, error: Optional[BaseException] = None) -> Dict[str, Any]:
+        # call after the writer is closed, every job is recorded by then
+        summary = self.summary(error)
+        with self._lock:
+            self._write(summary)
+        if self.metrics_path is not None:
+            self.metrics.write(self.metrics_path)
+        self.metrics.stop()
+        return summary
+
+
+def _size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
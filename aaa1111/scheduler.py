@@ -0,0 +1,96 @@
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+Affinity = Tuple[Optional[str], Optional[str]]
+
+
+def affinity(payload: Dict[str, Any]) -> Affinity:
+    # the checkpoint and vae a job makes the server load, None for "any"
+    override = payload.get("override_settings") or {}
+    return (override.get("sd_model_checkpoint"), override.get("sd_vae"))
+
+
+class _Entry:
+    __slots__ = ("item", "key", "skips")
+
+    def __init__(self, item: Any, key: Affinity):
+        self.item = item
+        self.key = key
+        self.skips = 0
+
+
+class AffinityQueue:
+    # pending jobs, popped so that the ones for the checkpoint/vae that is
+    # already loaded go first, and model swaps happen as rarely as possible.
+    # a job is passed over at most `max_skips` times, then it runs next.
+    # with max_skips=0 jobs are popped in the order they were pushed.
+    def __init__(self, max_skips: int = 8):
+        if max_skips < 0:
+            msg = f"max_skips must be 0 or greater, got {max_skips}"
+            raise ValueError(msg)
+        self.max_skips = max_skips
+        self.current: Affinity = (None, None)
+        self._entries: List[_Entry] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def push(self, item: Any, key: Affinity) -> None:
+        self._entries.append(_Entry(item, key))
+
+    def _score(self, key: Affinity) -> int:
+        # 2: no swap, 1: only the vae changes, 0: the checkpoint changes.
+        # None on either side, "any" or "not known yet", matches everything.
+        ckpt, vae = (
+            k is None or c is None or k == c for k, c in zip(key, self.current)
+        )
+        return 2 if ckpt and vae else int(ckpt)
+
+    def _choose(self) -> int:
+        if self._entries[0].skips >= self.max_skips:
+            return 0
+        best, best_score = 0, -1
+        for i, entry in enumerate(self._entries):
+            score = self._score(entry.key)
+            if score > best_score:
+                best, best_score = i, score
+                if score == 2:
+                    break
+        return best
+
+    def pop(self) -> Any:
+        if not self._entries:
+            msg = "pop from an empty AffinityQueue"
+            raise IndexError(msg)
+
+        i = self._choose()
+        for entry in self._entries[:i]:
+            entry.skips += 1
+        entry = self._entries.pop(i)
+        self.current = tuple(
+            c if k is None else k for k, c in zip(entry.key, self.current)
+        )
+        return entry.item
+
+
+def schedule(
+    items: Iterable[Any],
+    key: Callable[[Any], Affinity],
+    window: int = 64,
+    max_skips: int = 8,
+) -> Iterator[Any]:
+    # reorder `items` by affinity, looking at most `window` items ahead.
+    # `items` is consumed lazily.
+    if window < 1:
+        msg = f"window must be 1 or greater, got {window}"
+        raise ValueError(msg)
+
+    it = iter(items)
+    queue = AffinityQueue(max_skips)
+    for item in islice(it, window):
+        queue.push(item, key(item))
+
+    while queue:
+        yield queue.pop()
+        for item in islice(it, 1):
+            queue.push(item, key(item))
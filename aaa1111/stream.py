@@ -0,0 +1,306 @@
+import base64
+import re
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Optional, Sequence, Union
+
+import orjson
+
+from aaa1111.utils import sniff_format
+
+ImageSink = Union[str, Path, Callable[[int], Any]]
+
+FORMAT_EXT = {"PNG": ".png", "JPEG": ".jpg", "WEBP": ".webp", "GIF": ".gif"}
+
+_IN_STRING = re.compile(rb'["\\]')
+_OUTSIDE = re.compile(rb'["\[\]{},]')
+_WHITESPACE = b" \t\r\n"
+_ESCAPES = {b"/": b"/", b"\\": b"\\", b'"': b'"'}
+
+
+class _FileTarget:
+    # the extension is only known after the first decoded bytes,
+    # so the file is opened on the first write of at least 12 bytes.
+    def __init__(self, save_dir: Path):
+        self.save_dir = save_dir
+        self.path: Optional[Path] = None
+        self._head = b""
+        self._fp: Optional[BinaryIO] = None
+
+    def _open(self) -> None:
+        from ulid import ULID
+
+        ext = FORMAT_EXT.get(sniff_format(self._head) or "", ".bin")
+        self.path = self.save_dir.joinpath(str(ULID())).with_suffix(ext)
+        self._fp = open(self.path, "wb")  # noqa: SIM115
+        self._fp.write(self._head)
+        self._head = b""
+
+    def write(self, data: bytes) -> None:
+        if self._fp is None:
+            self._head += data
+            if len(self._head) >= 12:
+                self._open()
+            return
+        self._fp.write(data)
+
+    def finish(self) -> Path:
+        if self._fp is None:
+            self._open()
+        self._fp.close()
+        return self.path
+
+    def abort(self) -> None:
+        if self._fp is not None:
+            self._fp.close()
+            self.path.unlink()
+
+
+class _SinkTarget:
+    def __init__(self, fp: Any):
+        self.fp = fp
+
+    def write(self, data: bytes) -> None:
+        self.fp.write(data)
+
+    def finish(self) -> Any:
+        return self.fp
+
+    def abort(self) -> None:
+        pass
+
+
+class ImageStreamParser:
+    # Incremental parser for a json object response.
+    # Base64 strings under `image_keys` (a string or an array of strings) are
+    # decoded chunk by chunk into the sink and never kept in memory as a whole,
+    # the other top-level values are collected and parsed with orjson.
+    #
+    # sink: a directory to save the images into, or a callable that takes the
+    # image index and returns a writable binary file object.
+    def __init__(
+        self,
+        sink: ImageSink,
+        image_keys: Sequence[str] = ("images", "image"),
+    ):
+        if isinstance(sink, (str, Path)):
+            save_dir = Path(sink)
+            self._new_target = lambda _: _FileTarget(save_dir)
+        else:
+            self._new_target = lambda i: _SinkTarget(sink(i))
+        self.image_keys = image_keys
+        self.data: Dict[str, Any] = {}
+
+        self._state = "start"
+        self._key = ""
+        self._raw = bytearray()
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._b64 = b""
+        self._target: Any = None
+        self._count = 0
+
+    @property
+    def done(self) -> bool:
+        return self._state == "end"
+
+    @property
+    def started(self) -> bool:
+        return self._state != "start"
+
+    def feed(self, buf: bytes) -> None:
+        pos = 0
+        while pos < len(buf):
+            if self._state == "raw":
+                pos = self._scan_raw(buf, pos)
+            elif self._state == "key_string":
+                pos = self._scan_key(buf, pos)
+            elif self._state == "image":
+                pos = self._scan_image(buf, pos)
+            elif buf[pos] in _WHITESPACE:
+                pos += 1
+            else:
+                pos = getattr(self, f"_on_{self._state}")(buf, pos)
+
+    def _on_start(self, buf: bytes, pos: int) -> int:
+        self._expect(buf[pos : pos + 1], b"{")
+        self._state = "key"
+        return pos + 1
+
+    def _on_key(self, buf: bytes, pos: int) -> int:
+        c = buf[pos : pos + 1]
+        if c == b",":
+            return pos + 1
+        if c == b"}":
+            self._state = "end"
+            return pos + 1
+
+        self._expect(c, b'"')
+        self._raw = bytearray(b'"')
+        self._in_string = True
+        self._state = "key_string"
+        return pos + 1
+
+    def _scan_key(self, buf: bytes, pos: int) -> int:
+        end = self._skip_string(buf, pos)
+        self._raw += buf[pos:end]
+        if not self._in_string:
+            self._key = orjson.loads(bytes(self._raw))
+            self._raw = bytearray()
+            self._state = "colon"
+        return end
+
+    def _on_colon(self, buf: bytes, pos: int) -> int:
+        self._expect(buf[pos : pos + 1], b":")
+        self._state = "value"
+        return pos + 1
+
+    def _on_value(self, buf: bytes, pos: int) -> int:
+        c = buf[pos : pos + 1]
+        if self._key in self.image_keys and c == b"[":
+            self.data[self._key] = []
+            self._state = "array"
+            return pos + 1
+        if self._key in self.image_keys and c == b'"':
+            self._start_image()
+            return pos + 1
+        self._state = "raw"
+        return pos
+
+    def _on_array(self, buf: bytes, pos: int) -> int:
+        c = buf[pos : pos + 1]
+        if c == b",":
+            return pos + 1
+        if c == b"]":
+            self._state = "key"
+            return pos + 1
+        self._expect(c, b'"')
+        self._start_image()
+        return pos + 1
+
+    def _on_end(self, buf: bytes, pos: int) -> int:
+        msg = f"unexpected data after the end of json: {buf[pos : pos + 1]!r}"
+        raise ValueError(msg)
+
+    def close(self) -> Dict[str, Any]:
+        if self._state != "end":
+            self.abort()
+            msg = "incomplete json response"
+            raise ValueError(msg)
+        return self.data
+
+    def abort(self) -> None:
+        if self._target is not None:
+            self._target.abort()
+            self._target = None
+
+    @staticmethod
+    def _expect(c: bytes, expected: bytes) -> None:
+        if c != expected:
+            msg = f"invalid json: expected {expected!r}, got {c!r}"
+            raise ValueError(msg)
+
+    def _skip_string(self, buf: bytes, pos: int) -> int:
+        # move past the end of the current string, or to the end of buffer
+        while pos < len(buf):
+            if self._escape:
+                self._escape = False
+                pos += 1
+                continue
+            m = _IN_STRING.search(buf, pos)
+            if m is None:
+                return len(buf)
+            pos = m.end()
+            if m.group() == b"\\":
+                self._escape = True
+            else:
+                self._in_string = False
+                break
+        return pos
+
+    def _scan_raw(self, buf: bytes, pos: int) -> int:
+        start = pos
+        done = False
+
+        while pos < len(buf) and not done:
+            if self._in_string:
+                pos = self._skip_string(buf, pos)
+                done = not self._in_string and self._depth == 0
+                continue
+
+            m = _OUTSIDE.search(buf, pos)
+            if m is None:
+                pos = len(buf)
+                break
+            c = m.group()
+            if c == b'"':
+                self._in_string = True
+                pos = m.end()
+            elif c in (b"[", b"{"):
+                self._depth += 1
+                pos = m.end()
+            elif self._depth == 0:
+                # `,` or `}` right after a scalar value: not a part of it
+                pos = m.start()
+                done = True
+            elif c == b",":
+                pos = m.end()
+            else:
+                self._depth -= 1
+                pos = m.end()
+                done = self._depth == 0
+
+        self._raw += buf[start:pos]
+        if done:
+            self.data[self._key] = orjson.loads(bytes(self._raw))
+            self._raw = bytearray()
+            self._state = "key"
+        return pos
+
+    def _start_image(self) -> None:
+        self._target = self._new_target(self._count)
+        self._count += 1
+        self._b64 = b""
+        self._state = "image"
+
+    def _decode(self, data: bytes) -> None:
+        if self._b64:
+            data = self._b64 + data
+        n = len(data) - len(data) % 4
+        if n:
+            self._target.write(base64.b64decode(data[:n]))
+        self._b64 = data[n:]
+
+    def _scan_image(self, buf: bytes, pos: int) -> int:
+        if self._escape:
+            self._escape = False
+            c = buf[pos : pos + 1]
+            if c not in _ESCAPES:
+                msg = f"unexpected escape in base64 string: {c!r}"
+                raise ValueError(msg)
+            self._decode(_ESCAPES[c])
+            return pos + 1
+
+        m = _IN_STRING.search(buf, pos)
+        if m is None:
+            self._decode(buf[pos:])
+            return len(buf)
+
+        self._decode(buf[pos : m.start()])
+        if m.group() == b"\\":
+            self._escape = True
+            return m.end()
+
+        if self._b64:
+            self._target.write(
+                base64.b64decode(self._b64 + b"=" * (-len(self._b64) % 4))
+            )
+        result = self._target.finish()
+        self._target = None
+        if isinstance(self.data.get(self._key), list):
+            self.data[self._key].append(result)
+            self._state = "array"
+        else:
+            self.data[self._key] = result
+            self._state = "key"
+        return m.end()
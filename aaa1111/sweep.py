@@ -0,0 +1,113 @@
+from dataclasses import fields
+from typing import Any, Dict, Iterator, List, Mapping, Sequence, Tuple
+
+from aaa1111.types.toimg import IMG2IMG, TXT2IMG
+
+SWEEP_KEY = "sweep"
+
+# axes that make the server load another model, expanded outermost so
+# that all the combinations for one model are generated in a row
+EXPENSIVE_AXES = (
+    "override_settings.sd_model_checkpoint",
+    "override_settings.sd_vae",
+)
+
+TASK_FIELDS = {
+    "txt2img": frozenset(f.name for f in fields(TXT2IMG)),
+    "img2img": frozenset(f.name for f in fields(IMG2IMG)),
+}
+
+
+def is_sweep(payload: Mapping[str, Any]) -> bool:
+    return SWEEP_KEY in payload
+
+
+def _axis_values(name: str, spec: Any) -> Sequence[Any]:
+    # a list of values, or {start, stop, step} for a range of integers
+    if isinstance(spec, Mapping):
+        try:
+            values = range(spec["start"], spec["stop"], spec.get("step", 1))
+        except (KeyError, TypeError) as e:
+            msg = f"sweep axis {name!r}: a range needs integer 'start' and 'stop', and optionally 'step'."
+            raise ValueError(msg) from e
+    elif isinstance(spec, (list, tuple)):
+        values = spec
+    else:
+        msg = f"sweep axis {name!r}: expected a list or a range, got {type(spec).__name__}"
+        raise ValueError(msg)
+
+    if len(values) == 0:
+        msg = f"sweep axis {name!r} has no values."
+        raise ValueError(msg)
+    return values
+
+
+def _set(payload: Dict[str, Any], name: str, value: Any) -> None:
+    # "a.b" sets payload["a"]["b"], copying the dicts on the way
+    *parents, last = name.split(".")
+    d = payload
+    for key in parents:
+        child = d.get(key)
+        child = dict(child) if isinstance(child, Mapping) else {}
+        d[key] = child
+        d = child
+    d[last] = value
+
+
+class Sweep:
+    # every combination of the `axes` values applied to `base`.
+    # combinations are made on demand, `sweep[i]` or iteration, so the size
+    # of the sweep does not matter for memory.
+    # the first axis changes slowest, expensive axes are moved to the front.
+    def __init__(
+        self,
+        base: Mapping[str, Any],
+        axes: Mapping[str, Any],
+        task: str = "txt2img",
+    ):
+        if task not in TASK_FIELDS:
+            msg = f"Unknown task: {task}"
+            raise ValueError(msg)
+        if not axes:
+            msg = "a sweep needs at least one axis."
+            raise ValueError(msg)
+
+        for name in axes:
+            if name.split(".")[0] not in TASK_FIELDS[task]:
+                msg = f"sweep axis {name!r} is not a {task} field."
+                raise ValueError(msg)
+
+        def rank(name: str) -> int:
+            if name in EXPENSIVE_AXES:
+                return EXPENSIVE_AXES.index(name)
+            return len(EXPENSIVE_AXES)
+
+        names = sorted(axes, key=rank)
+        self.base = {k: v for k, v in base.items() if k != SWEEP_KEY}
+        self.axes: List[Tuple[str, Sequence[Any]]] = [
+            (name, _axis_values(name, axes[name])) for name in names
+        ]
+
+    @classmethod
+    def from_payload(cls, payload: Mapping[str, Any], task: str = "txt2img"):
+        return cls(payload, payload[SWEEP_KEY], task)
+
+    def __len__(self) -> int:
+        n = 1
+        for _, values in self.axes:
+            n *= len(values)
+        return n
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        if not 0 <= index < len(self):
+            msg = f"sweep index out of range: {index}"
+            raise IndexError(msg)
+
+        payload = dict(self.base)
+        for name, values in reversed(self.axes):
+            index, i = divmod(index, len(values))
+            _set(payload, name, values[i])
+        return payload
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (self[i] for i in range(len(self)))
@@ -0,0 +1,3 @@
+from .server import FakeWebUI
+
+__all__ = ["FakeWebUI"]
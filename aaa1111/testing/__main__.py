@@ -0,0 +1,40 @@
+from typer import Option, Typer
+from typing_extensions import Annotated
+
+from .server import FakeWebUI
+
+app = Typer()
+
+
+@app.command()
+def main(
+    host: Annotated[str, Option("-h", "--host")] = "127.0.0.1",
+    port: Annotated[int, Option("-p", "--port")] = 7860,
+    step_time: Annotated[float, Option(help="Seconds per sampling step.")] = 0.01,
+    batch_cost: Annotated[
+        float, Option(help="Extra time of each more image in a batch, per step.")
+    ] = 0.5,
+    extras_time: Annotated[float, Option(help="Seconds per extras image.")] = 0.05,
+    model_load_time: Annotated[
+        float, Option(help="Seconds to change the checkpoint.")
+    ] = 0.5,
+):
+    server = FakeWebUI(
+        host,
+        port,
+        step_time=step_time,
+        batch_cost=batch_cost,
+        extras_time=extras_time,
+        model_load_time=model_load_time,
+    )
+    print(f"fake webui on {server.base_url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,268 @@
+import asyncio
+import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import orjson
+from typer import Option, Typer
+from typing_extensions import Annotated
+
+from aaa1111.client import AAA1111
+from aaa1111.report import percentile
+
+from .server import FakeWebUI, _make_png
+
+WORKLOADS = ("txt2img", "img2img", "extras")
+MODES = ("sync", "async")
+
+app = Typer()
+
+
+@dataclass
+class LoadResult:
+    mode: str
+    workload: str
+    concurrency: int
+    requests: int
+    errors: int
+    seconds: float
+    p50: float
+    p95: float
+    p99: float
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.seconds if self.seconds else 0.0
+
+    @classmethod
+    def from_latencies(
+        cls,
+        mode: str,
+        workload: str,
+        concurrency: int,
+        latencies: List[float],
+        errors: int,
+        seconds: float,
+    ) -> "LoadResult":
+        latencies = sorted(latencies)
+        return cls(
+            mode,
+            workload,
+            concurrency,
+            len(latencies) + errors,
+            errors,
+            seconds,
+            percentile(latencies, 0.50),
+            percentile(latencies, 0.95),
+            percentile(latencies, 0.99),
+        )
+
+
+def make_call(workload: str, steps: int, size: int) -> Tuple[str, Dict[str, Any]]:
+    # the client method and payload of one request
+    if workload == "txt2img":
+        payload = {"prompt": "a cat", "steps": steps, "width": size, "height": size}
+        return "txt2img", payload
+    image = base64.b64encode(_make_png(size, size)).decode()
+    if workload == "img2img":
+        payload = {
+            "prompt": "a cat",
+            "steps": steps,
+            "width": size,
+            "height": size,
+            "init_images": [image],
+            "denoising_strength": 0.75,
+        }
+        return "img2img", payload
+    if workload == "extras":
+        return "extra_single_image", {"image": image, "upscaling_resize": 2}
+    msg = f"Unknown workload: {workload}"
+    raise ValueError(msg)
+
+
+def run_sync(
+    api: AAA1111, method: str, payload: Dict[str, Any], concurrency: int, n: int
+) -> Tuple[List[float], int, float]:
+    fn: Callable[..., Any] = getattr(api, method)
+
+    def one(_: int) -> Optional[float]:
+        start = time.perf_counter()
+        try:
+            fn(payload)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(n)))
+    seconds = time.perf_counter() - start
+    latencies = [r for r in results if r is not None]
+    return latencies, n - len(latencies), seconds
+
+
+async def run_async(
+    api: AAA1111, method: str, payload: Dict[str, Any], concurrency: int, n: int
+) -> Tuple[List[float], int, float]:
+    fn: Callable[..., Any] = getattr(api, "a" + method)
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(n))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                await fn(payload)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def run_load(
+    base_url: str,
+    workloads: Sequence[str] = WORKLOADS,
+    modes: Sequence[str] = MODES,
+    concurrency: Sequence[int] = (1, 2, 4, 8),
+    requests: int = 32,
+    steps: int = 20,
+    size: int = 512,
+    on_result: Optional[Callable[[LoadResult], None]] = None,
+) -> List[LoadResult]:
+    # every workload at every concurrency level, after one warm-up request.
+    # coalescing is turned off, it would merge the identical requests.
+    results = []
+
+    def report(mode: str, workload: str, c: int, out) -> None:
+        result = LoadResult.from_latencies(mode, workload, c, *out)
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+
+    calls = [(w, *make_call(w, steps, size)) for w in workloads]
+    if "sync" in modes:
+        with AAA1111(base_url=base_url, coalesce=False) as api:
+            for workload, method, payload in calls:
+                getattr(api, method)(payload)
+                for c in concurrency:
+                    report(
+                        "sync", workload, c, run_sync(api, method, payload, c, requests)
+                    )
+
+    async def arun():
+        async with AAA1111(base_url=base_url, coalesce=False) as api:
+            for workload, method, payload in calls:
+                await getattr(api, "a" + method)(payload)
+                for c in concurrency:
+                    out = await run_async(api, method, payload, c, requests)
+                    report("async", workload, c, out)
+
+    if "async" in modes:
+        asyncio.run(arun())
+    return results
+
+
+@app.command()
+def main(
+    base_url: Annotated[
+        Optional[str],
+        Option(
+            "-b",
+            "--base-url",
+            help="webui to load. [default: start a FakeWebUI in this process]",
+        ),
+    ] = None,
+    workload: Annotated[
+        Optional[List[str]],
+        Option("-w", "--workload", help="txt2img, img2img or extras, repeatable."),
+    ] = None,
+    mode: Annotated[
+        Optional[List[str]],
+        Option("-m", "--mode", help="sync or async, repeatable."),
+    ] = None,
+    concurrency: Annotated[
+        Optional[List[int]],
+        Option("-c", "--concurrency", min=1, help="repeatable. [default: 1 2 4 8]"),
+    ] = None,
+    requests: Annotated[
+        int, Option("-n", "--requests", min=1, help="Requests per level.")
+    ] = 32,
+    steps: Annotated[int, Option(min=1)] = 20,
+    size: Annotated[int, Option(min=8, help="Image width and height.")] = 512,
+    step_time: Annotated[
+        float, Option(help="Seconds per step of the FakeWebUI.")
+    ] = 0.01,
+    output: Annotated[
+        Optional[Path], Option("-o", "--output", help="Write the results as JSON.")
+    ] = None,
+):
+    from rich.console import Console
+    from rich.table import Table
+
+    for w in workload or ():
+        if w not in WORKLOADS:
+            msg = f"Unknown workload: {w}"
+            raise ValueError(msg)
+    for m in mode or ():
+        if m not in MODES:
+            msg = f"Unknown mode: {m}"
+            raise ValueError(msg)
+
+    console = Console()
+    server = None
+    if base_url is None:
+        server = FakeWebUI(step_time=step_time).start()
+        base_url = server.base_url
+
+    table = Table(title=f"load test: {base_url}")
+    for col in ("mode", "workload", "concurrency", "req/s", "p50", "p95", "p99"):
+        table.add_column(
+            col, justify="left" if col in ("mode", "workload") else "right"
+        )
+
+    def on_result(r: LoadResult) -> None:
+        table.add_row(
+            r.mode,
+            r.workload,
+            str(r.concurrency),
+            f"{r.throughput:.2f}",
+            f"{r.p50 * 1000:.0f} ms",
+            f"{r.p95 * 1000:.0f} ms",
+            f"{r.p99 * 1000:.0f} ms" + (f" ({r.errors} errors)" if r.errors else ""),
+        )
+        console.print(
+            f"{r.mode} {r.workload} c={r.concurrency}: {r.throughput:.2f} req/s"
+        )
+
+    try:
+        results = run_load(
+            base_url,
+            workload or WORKLOADS,
+            mode or MODES,
+            concurrency or (1, 2, 4, 8),
+            requests,
+            steps,
+            size,
+            on_result,
+        )
+    finally:
+        if server is not None:
+            server.stop()
+
+    console.print(table)
+    if output is not None:
+        data = [{**asdict(r), "throughput": r.throughput} for r in results]
+        output.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,438 @@
+import base64
+import io
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import orjson
+from PIL import Image
+
+from aaa1111.utils import png_add_text
+
+MODELS = ["model1.safetensors [0123456789]", "model2.safetensors [abcdef0123]"]
+
+DEFAULT_OPTIONS: Dict[str, Any] = {
+    "sd_model_checkpoint": MODELS[0],
+    "sd_vae": "Automatic",
+    "CLIP_stop_at_last_layers": 1,
+    "return_grid": True,
+    "samples_format": "png",
+}
+
+# answers of the GET endpoints that do not depend on the server state
+STATIC: Dict[str, Any] = {
+    "/sdapi/v1/cmd-flags": {"api": True, "listen": False, "xformers": True},
+    "/sdapi/v1/samplers": [
+        {"name": name, "aliases": [], "options": {}}
+        for name in ("Euler a", "Euler", "DPM++ 2M Karras", "DDIM")
+    ],
+    "/sdapi/v1/upscalers": [
+        {
+            "name": name,
+            "model_name": None,
+            "model_path": None,
+            "model_url": None,
+            "scale": 4,
+        }
+        for name in ("None", "Lanczos", "R-ESRGAN 4x+")
+    ],
+    "/sdapi/v1/latent-upscale-modes": [
+        {"name": "Latent"},
+        {"name": "Latent (nearest)"},
+    ],
+    "/sdapi/v1/sd-models": [
+        {
+            "title": title,
+            "model_name": title.split(".")[0],
+            "hash": title[-11:-1],
+            "sha256": None,
+            "filename": f"/models/Stable-diffusion/{title.split(' ')[0]}",
+            "config": None,
+        }
+        for title in MODELS
+    ],
+    "/sdapi/v1/sd-vae": [
+        {"model_name": "vae1.safetensors", "filename": "/models/VAE/vae1.safetensors"}
+    ],
+    "/sdapi/v1/hypernetworks": [],
+    "/sdapi/v1/face-restorers": [
+        {"name": "CodeFormer", "cmd_dir": None},
+        {"name": "GFPGAN", "cmd_dir": None},
+    ],
+    "/sdapi/v1/realesrgan-models": [{"name": "R-ESRGAN 4x+", "path": None, "scale": 4}],
+    "/sdapi/v1/prompt-styles": [],
+    "/sdapi/v1/embeddings": {"loaded": {}, "skipped": {}},
+    "/sdapi/v1/memory": {"ram": {"free": 2**33, "used": 2**33}, "cuda": {}},
+    "/sdapi/v1/scripts": {"txt2img": ["x/y/z plot"], "img2img": ["x/y/z plot"]},
+    "/sdapi/v1/script-info": [],
+    "/sdapi/v1/loras": [
+        {
+            "name": f"lora{i}",
+            "alias": f"lora{i}",
+            "path": f"/models/Lora/lora{i}.safetensors",
+            "metadata": {},
+        }
+        for i in range(100)
+    ],
+    "/sdapi/v1/lycos": [],
+}
+
+EMPTY_POSTS = (
+    "/sdapi/v1/refresh-checkpoints",
+    "/sdapi/v1/refresh-loras",
+    "/sdapi/v1/refresh-lycos",
+    "/sdapi/v1/reload-checkpoint",
+    "/sdapi/v1/unload-checkpoint",
+)
+
+
+def _encode(image: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    image.save(buf, format="png")
+    return buf.getvalue()
+
+
+def _make_png(width: int, height: int) -> bytes:
+    # a gradient compresses about as well as a generated image
+    gradient = Image.linear_gradient("L")
+    r = gradient.resize((width, height))
+    g = gradient.transpose(Image.Transpose.ROTATE_90).resize((width, height))
+    b = Image.new("L", (width, height), 128)
+    return _encode(Image.merge("RGB", (r, g, b)))
+
+
+class FakeWebUI:
+    # a stand-in for the webui api, to test and load test clients without a gpu.
+    #
+    # generation runs on a single worker, like webui: concurrent requests wait
+    # in a queue. a job takes `step_time` seconds per sampling step, and every
+    # extra image of a batch adds `batch_cost` of that. /progress reports the
+    # running job. changing the checkpoint takes `model_load_time` seconds.
+    #
+    #   with FakeWebUI(step_time=0.05) as server:
+    #       api = AAA1111(server.base_url)
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        *,
+        step_time: float = 0.01,
+        batch_cost: float = 0.5,
+        extras_time: float = 0.05,
+        model_load_time: float = 0.5,
+    ):
+        self.step_time = step_time
+        self.batch_cost = batch_cost
+        self.extras_time = extras_time
+        self.model_load_time = model_load_time
+        self.options = dict(DEFAULT_OPTIONS)
+        self.requests: Dict[str, int] = {}
+
+        self._worker = threading.Lock()
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._step = 0
+        self._steps = 0
+        self._step_secs = 0.0
+        self._interrupted = False
+        self._skipped = False
+        self._seed = 0
+        self._pngs: Dict[Tuple[int, int], bytes] = {}
+
+        self.server = _Server((host, port), _handler(self))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeWebUI":
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self.server.serve_forever,
+                kwargs={"poll_interval": 0.05},
+                name="fake-webui",
+                daemon=True,
+            )
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self.server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeWebUI":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def handle(
+        self, method: str, path: str, query: Dict[str, List[str]], body: Any
+    ) -> Tuple[int, Any]:
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+        if method == "GET":
+            if path == "/sdapi/v1/progress":
+                skip = query.get("skip_current_image", ["false"])[0] == "true"
+                return 200, self._progress(skip)
+            if path == "/sdapi/v1/options":
+                return 200, self.options
+            if path in STATIC:
+                return 200, STATIC[path]
+        elif path in EMPTY_POSTS:
+            return 200, {}
+        elif path.startswith("/sdapi/v1/"):
+            handler = getattr(self, "_post_" + path[10:].replace("-", "_"), None)
+            if handler is not None:
+                return 200, handler(body)
+        return 404, {"detail": "Not Found"}
+
+    def _post_txt2img(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        return self._2img(body, img2img=False)
+
+    def _post_img2img(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        return self._2img(body, img2img=True)
+
+    def _post_extra_single_image(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        images = self._extras([body.get("image")], body)
+        return {"html_info": "", "image": images[0]}
+
+    def _post_extra_batch_images(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        data = [item["data"] for item in body.get("imageList", [])]
+        return {"html_info": "", "images": self._extras(data, body)}
+
+    def _post_png_info(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        return self._png_info(body.get("image", ""))
+
+    def _post_interrogate(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        return {"caption": "a photo of a cat"}
+
+    def _post_options(self, body: Dict[str, Any]) -> None:
+        with self._queue():
+            self._load_model(body.get("sd_model_checkpoint"))
+            self.options.update(body)
+
+    def _post_interrupt(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._interrupted = True
+        return {}
+
+    def _post_skip(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._skipped = True
+        return {}
+
+    def _progress(self, skip_current_image: bool) -> Dict[str, Any]:
+        with self._lock:
+            step, steps, secs, queued = (
+                self._step,
+                self._steps,
+                self._step_secs,
+                self._queued,
+            )
+            state = {
+                "skipped": self._skipped,
+                "interrupted": self._interrupted,
+                "job": "",
+                "job_count": queued + (steps > 0),
+                "job_no": 0,
+                "sampling_step": step,
+                "sampling_steps": steps,
+            }
+
+        image = None
+        if steps and step and not skip_current_image:
+            image = base64.b64encode(self._png(64, 64)).decode()
+        return {
+            "progress": step / steps if steps else 0.0,
+            "eta_relative": (steps - step) * secs,
+            "state": state,
+            "current_image": image,
+            "textinfo": None,
+        }
+
+    def _png(self, width: int, height: int) -> bytes:
+        key = (width, height)
+        if key not in self._pngs:
+            self._pngs[key] = _make_png(width, height)
+        return self._pngs[key]
+
+    def _load_model(self, checkpoint: Optional[str]) -> None:
+        # called on the worker
+        if checkpoint and checkpoint != self.options["sd_model_checkpoint"]:
+            time.sleep(self.model_load_time)
+            self.options["sd_model_checkpoint"] = checkpoint
+
+    def _run(self, steps: int, step_secs: float) -> None:
+        # one job on the worker, step by step so /progress can follow it
+        with self._lock:
+            self._step, self._steps, self._step_secs = 0, steps, step_secs
+            self._interrupted = self._skipped = False
+        for _ in range(steps):
+            with self._lock:
+                if self._interrupted or self._skipped:
+                    break
+            time.sleep(step_secs)
+            with self._lock:
+                self._step += 1
+        with self._lock:
+            self._steps = self._step = 0
+
+    @contextmanager
+    def _queue(self) -> Iterator[None]:
+        # wait for the worker, counted in /progress job_count meanwhile
+        with self._lock:
+            self._queued += 1
+        try:
+            self._worker.acquire()
+        finally:
+            with self._lock:
+                self._queued -= 1
+        try:
+            yield
+        finally:
+            self._worker.release()
+
+    def _2img(self, payload: Dict[str, Any], img2img: bool) -> Dict[str, Any]:
+        batch_size = payload.get("batch_size", 1)
+        n_iter = payload.get("n_iter", 1)
+        n = batch_size * n_iter
+        steps = payload.get("steps", 20)
+        if img2img:
+            steps = max(1, int(steps * payload.get("denoising_strength", 0.75)))
+        width, height = payload.get("width", 512), payload.get("height", 512)
+        override = payload.get("override_settings") or {}
+
+        with self._queue():
+            self._load_model(override.get("sd_model_checkpoint"))
+            step_secs = self.step_time * (1 + self.batch_cost * (batch_size - 1))
+            self._run(steps * n_iter, step_secs)
+            model = self.options["sd_model_checkpoint"]
+            with self._lock:
+                seed = payload.get("seed", -1)
+                if seed == -1:
+                    self._seed += 1
+                    seed = self._seed
+
+        seeds = [seed + i for i in range(n)]
+        prompt = payload.get("prompt", "")
+        negative_prompt = payload.get("negative_prompt", "")
+        infotexts = [
+            f"{prompt}\nNegative prompt: {negative_prompt}\n"
+            f"Steps: {steps}, Sampler: {payload.get('sampler_name') or 'Euler a'}, "
+            f"CFG scale: {payload.get('cfg_scale', 7.0)}, Seed: {s}, "
+            f"Size: {width}x{height}, Model: {model.split('.')[0]}"
+            for s in seeds
+        ]
+        grid = n > 1 and self.options["return_grid"]
+        if grid:
+            infotexts.insert(0, infotexts[0])
+
+        images = []
+        if payload.get("send_images", True):
+            png = self._png(width, height)
+            images = [
+                base64.b64encode(png_add_text(png, "parameters", text)).decode()
+                for text in infotexts
+            ]
+        info = {
+            "prompt": prompt,
+            "all_prompts": [prompt] * n,
+            "negative_prompt": negative_prompt,
+            "all_negative_prompts": [negative_prompt] * n,
+            "seed": seed,
+            "all_seeds": seeds,
+            "subseed": seed,
+            "all_subseeds": seeds,
+            "width": width,
+            "height": height,
+            "steps": steps,
+            "batch_size": batch_size,
+            "sd_model_name": model.split(".")[0],
+            "infotexts": infotexts,
+            "index_of_first_image": int(grid),
+        }
+        return {
+            "images": images,
+            "parameters": payload,
+            "info": orjson.dumps(info).decode(),
+        }
+
+    def _extras(self, images: List[Any], payload: Dict[str, Any]) -> List[str]:
+        sizes = []
+        for data in images:
+            with Image.open(io.BytesIO(base64.b64decode(data or ""))) as image:
+                width, height = image.size
+            if payload.get("resize_mode", 0) == 1:
+                width = payload.get("upscaling_resize_w", 512)
+                height = payload.get("upscaling_resize_h", 512)
+            else:
+                scale = payload.get("upscaling_resize", 2.0)
+                width, height = int(width * scale), int(height * scale)
+            sizes.append((width, height))
+
+        with self._queue():
+            time.sleep(self.extras_time * len(images))
+        return [base64.b64encode(self._png(w, h)).decode() for w, h in sizes]
+
+    def _png_info(self, data: str) -> Dict[str, Any]:
+        if data.startswith("data:"):
+            data = data.split(",", 1)[1]
+        with Image.open(io.BytesIO(base64.b64decode(data))) as image:
+            items = {k: v for k, v in image.info.items() if isinstance(v, str)}
+        return {"info": items.pop("parameters", ""), "items": items}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # a client that went away is not an error of the server
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def _handler(webui: FakeWebUI):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # the headers and the body are separate writes, with nagle the body
+        # waits for the client's delayed ack on a keep-alive connection
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):  # noqa: A002
+            pass
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def _handle(self, method: str) -> None:
+            url = urlsplit(self.path)
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length) if length else b""
+            try:
+                body = orjson.loads(raw) if raw else {}
+                status, data = webui.handle(method, url.path, parse_qs(url.query), body)
+            except Exception as e:
+                status, data = 500, {"error": type(e).__name__, "detail": str(e)}
+
+            out = orjson.dumps(data)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+    return Handler
@@ -0,0 +1,105 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from httpx import Response
+
+
+@dataclass
+class Span:
+    # one timed phase of a call:
+    #   payload   loading and merging the payload, converting the scripts
+    #   encode    reading and base64 encoding the input images
+    #   request   one http round trip, sent again on a retry
+    #   connect   opening a new connection, part of request
+    #   upload    sending the request, part of request
+    #   server    from the request sent to the response headers, part of request
+    #   download  receiving the response body, part of request
+    #   parse     decoding the response body
+    #   save      writing one image to disk (ImageWriter)
+    # `start` and `end` are time.perf_counter() values.
+    name: str
+    endpoint: str
+    start: float
+    end: float = 0.0
+    bytes: int = 0
+    backend: str = ""
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+SpanHook = Callable[[Span], None]
+
+# http round trip phases: (name, first trace event, last trace event).
+# the events are httpcore's, without the "http11."/"http2." prefix.
+HTTP_PHASES = (
+    ("connect", "connect_tcp.started", "connect_tcp.complete"),
+    ("upload", "send_request_headers.started", "send_request_body.complete"),
+    ("server", "send_request_body.complete", "receive_response_headers.complete"),
+    ("download", "receive_response_headers.complete", "receive_response_body.complete"),
+)
+
+
+class SpanContext:
+    # `with SpanContext(hook, span) as span:` times the block and passes the
+    # span to `hook`, with the exception type as `error` if the block raised
+    __slots__ = ("hook", "span")
+
+    def __init__(self, hook: SpanHook, span: Span):
+        self.hook = hook
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self.span.start = time.perf_counter()
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.span.end = time.perf_counter()
+        if exc_type is not None and self.span.error is None:
+            self.span.error = exc_type.__name__
+        self.hook(self.span)
+
+
+class _NoSpan:
+    # what `span()` returns with no hook: nothing is timed or kept,
+    # writes go to a shared throwaway span
+    __slots__ = ()
+    span = Span("", "", 0.0)
+
+    def __enter__(self) -> Span:
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+class HTTPTrace:
+    # the httpx "trace" extension: records when each httpcore event happened
+    __slots__ = ("events",)
+
+    def __init__(self):
+        self.events: Dict[str, float] = {}
+
+    def __call__(self, name: str, info: Dict[str, Any]) -> None:
+        self.events[name.split(".", 1)[1]] = time.perf_counter()
+
+    async def acall(self, name: str, info: Dict[str, Any]) -> None:
+        self(name, info)
+
+    def spans(self, endpoint: str, backend: str, resp: Optional[Response]):
+        for name, first, last in HTTP_PHASES:
+            if first not in self.events or last not in self.events:
+                continue
+            span = Span(name, endpoint, self.events[first], self.events[last])
+            span.backend = backend
+            if name == "upload" and resp is not None:
+                span.bytes = len(resp.request.content)
+            elif name == "download" and resp is not None:
+                span.bytes = resp.num_bytes_downloaded
+            yield span
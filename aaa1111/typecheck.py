@@ -0,0 +1,24 @@
+import os
+from typing import TypeVar
+
+T = TypeVar("T")
+
+# AAA1111_TYPECHECK=0 turns the runtime type checks into no-ops.
+# the decorators run when the modules are imported, so it must be set
+# before `import aaa1111`.
+TYPECHECK = os.environ.get("AAA1111_TYPECHECK", "1").strip().lower() not in (
+    "0",
+    "false",
+    "no",
+    "off",
+)
+
+if TYPECHECK:
+    from beartype import beartype
+else:
+
+    def beartype(obj: T) -> T:
+        return obj
+
+
+__all__ = ["TYPECHECK", "beartype"]
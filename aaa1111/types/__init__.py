@@ -1,17 +1,27 @@
+from aaa1111.utils import LazyImage
+
 from .extras import (
     ExtrasBatchImages,
     ExtrasBatchImagesResponse,
+    ExtrasBatchImagesStreamResponse,
     ExtrasSingleImage,
     ExtrasSingleImageResponse,
 )
-from .toimg import IMG2IMG, TXT2IMG, Script
+from .info import ProgressEvent, ProgressResponse
+from .toimg import IMG2IMG, TXT2IMG, Script, ToImageResponse, ToImageStreamResponse
 
 __all__ = [
     "IMG2IMG",
     "TXT2IMG",
     "ExtrasBatchImages",
+    "ExtrasBatchImagesResponse",
+    "ExtrasBatchImagesStreamResponse",
     "ExtrasSingleImage",
     "ExtrasSingleImageResponse",
-    "ExtrasBatchImagesResponse",
+    "LazyImage",
+    "ProgressEvent",
+    "ProgressResponse",
     "Script",
+    "ToImageResponse",
+    "ToImageStreamResponse",
 ]
@@ -4,7 +4,9 @@ from typing import Any, Dict, Sized, Union
 
 from PIL import Image
 
-ImageType = Union[str, Path, Image.Image]
+from aaa1111.utils import LazyImage
+
+ImageType = Union[str, Path, Image.Image, LazyImage]
 PathType = Union[str, Path]
 Number = Union[int, float]
 
@@ -2,8 +2,7 @@ from dataclasses import dataclass, fields
 from enum import Enum
 from typing import Union
 
-from beartype import beartype
-
+from aaa1111.typecheck import beartype
 from aaa1111.types.base import Number
 from aaa1111.types.toimg import ScriptBase
 
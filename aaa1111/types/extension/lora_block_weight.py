@@ -2,8 +2,7 @@ from dataclasses import dataclass, fields
 from enum import Enum, IntEnum
 from typing import Literal, Union
 
-from beartype import beartype
-
+from aaa1111.typecheck import beartype
 from aaa1111.types.toimg import ScriptBase
 
 _lbw_loraratios_default = "\
@@ -1,7 +1,6 @@
 from dataclasses import dataclass
 
-from beartype import beartype
-
+from aaa1111.typecheck import beartype
 from aaa1111.types.toimg import ScriptBase
 
 
@@ -1,12 +1,10 @@
 from dataclasses import dataclass, field
 from enum import IntEnum
 from pathlib import Path
-from typing import List, Literal, Optional, Union
+from typing import Any, List, Literal, Optional, Union
 
-from beartype import beartype
-from PIL import Image
-
-from aaa1111.utils import base64_to_image
+from aaa1111.typecheck import beartype
+from aaa1111.utils import LazyImage
 
 from .base import AsdictMixin, ImageType, Number, PathType
 
@@ -62,18 +60,24 @@ class ExtrasBatchImages(ExtraBase):
 @dataclass
 class ExtrasSingleImageResponse:
     html_info: str
-    image: Image.Image
+    image: LazyImage
 
     def __post_init__(self):
         if isinstance(self.image, str):
-            self.image = base64_to_image(self.image)
+            self.image = LazyImage(self.image)
 
 
 @dataclass
 class ExtrasBatchImagesResponse:
     html_info: str
-    images: List[Image.Image]
+    images: List[LazyImage]
 
     def __post_init__(self):
         if self.images and isinstance(self.images[0], str):
-            self.images = [base64_to_image(img) for img in self.images]
+            self.images = [LazyImage(img) for img in self.images]
+
+
+@dataclass
+class ExtrasBatchImagesStreamResponse:
+    html_info: str
+    images: List[Any]  # saved paths, or the objects returned by the sink
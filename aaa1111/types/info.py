@@ -1,10 +1,8 @@
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Union
 
-from beartype import beartype
-from PIL import Image
-
-from aaa1111.utils import base64_to_image
+from aaa1111.typecheck import beartype
+from aaa1111.utils import LazyImage
 
 from .base import Number
 
@@ -22,12 +20,28 @@ class ProgressResponse:
     progress: Number
     eta_relative: Number
     state: Dict[str, Any]
-    current_image: Optional[Image.Image]
+    current_image: Union[LazyImage, str, None]
     textinfo: Optional[str] = None
 
     def __post_init__(self):
+        # decoded only when the preview is actually used
         if isinstance(self.current_image, str):
-            self.current_image = base64_to_image(self.current_image)
+            self.current_image = LazyImage(self.current_image)
+
+
+@beartype
+@dataclass
+class ProgressEvent:
+    progress: Number
+    eta_relative: Number
+    state: Dict[str, Any]
+    current_image: Optional[LazyImage] = None
+    textinfo: Optional[str] = None
+    result: Any = None  # the response of the job, set on the last event
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
 
 
 @beartype
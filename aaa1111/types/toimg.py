@@ -5,10 +5,9 @@ from pathlib import Path
 from typing import Any, Dict, List, Literal, Mapping, Optional, Sequence, Union
 
 import orjson
-from beartype import beartype
-from PIL import Image
 
-from aaa1111.utils import base64_to_image, load_from_file
+from aaa1111.typecheck import beartype
+from aaa1111.utils import LazyImage, load_from_file
 
 from .base import AsdictMixin, ImageType, Number
 
@@ -166,13 +165,24 @@ class IMG2IMG(_2IMG):
 
 @dataclass
 class ToImageResponse:
-    images: List[Image.Image]
+    images: List[LazyImage]
     parameters: Dict[str, Any]
     info: Dict[str, Any]
 
     def __post_init__(self):
         if self.images and isinstance(self.images[0], str):
-            self.images = [base64_to_image(img) for img in self.images]
+            self.images = [LazyImage(img) for img in self.images]
 
         if isinstance(self.info, str):
             self.info = orjson.loads(self.info)
+
+
+@dataclass
+class ToImageStreamResponse:
+    images: List[Any]  # saved paths, or the objects returned by the sink
+    parameters: Dict[str, Any]
+    info: Dict[str, Any]
+
+    def __post_init__(self):
+        if isinstance(self.info, str):
+            self.info = orjson.loads(self.info)
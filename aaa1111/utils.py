@@ -1,26 +1,159 @@
+import asyncio
 import base64
+import contextvars
 import io
+import os
+import struct
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Any, Dict, Mapping, Optional, Sequence, Union
+from types import TracebackType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Deque,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
 import orjson
-import pyjson5
-import rtoml
-from aiofile import async_open
-from beartype import beartype
 from PIL import Image, PngImagePlugin
-from ruamel.yaml import YAML
-from ulid import ULID
 
-ImageType = Union[str, Path, Image.Image]  # prevent circular import
+from aaa1111 import cache as _cache
+from aaa1111.typecheck import beartype
+
+if TYPE_CHECKING:
+    from ruamel.yaml import YAML
+
+    from aaa1111.trace import SpanHook
+
+# the format parsers, aiofile and ulid are imported on first use,
+# most runs need only one of them and `import aaa1111` should stay fast
+
 PathType = Union[str, Path]
 
 FILE_EXT = (".toml", ".yaml", ".yml", ".json", ".json5")
-available_extensions = Image.registered_extensions()
+
+
+@lru_cache(maxsize=None)
+def image_extensions() -> Dict[str, str]:
+    # loads every PIL plugin, which is slow, so not done at import time
+    return Image.registered_extensions()
+
+
+def __getattr__(name: str) -> Any:
+    if name == "available_extensions":
+        return image_extensions()
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
+
+
+def sniff_format(data: bytes) -> Optional[str]:
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return "WEBP"
+    if data.startswith(b"GIF8"):
+        return "GIF"
+    return None
+
+
+class LazyImage:
+    # Holds the encoded image bytes and decodes them only when the image is
+    # actually used. Unknown attributes are forwarded to the decoded
+    # PIL.Image.Image, so it can be used mostly like one.
+    __slots__ = ("_data", "_format", "_image")
+
+    def __init__(self, data: Union[str, bytes]):
+        if isinstance(data, str):
+            data = base64.b64decode(data)
+        self._data = data
+        self._format = sniff_format(data)
+        self._image: Optional[Image.Image] = None
+
+    @property
+    def bytes(self) -> bytes:
+        return self._data
+
+    @property
+    def format(self) -> Optional[str]:
+        if self._format is None:
+            self._format = self.image.format
+        return self._format
+
+    @property
+    def image(self) -> Image.Image:
+        if self._image is None:
+            self._image = Image.open(io.BytesIO(self._data))
+        return self._image
+
+    @property
+    def is_decoded(self) -> bool:
+        return self._image is not None
+
+    def base64(self) -> str:
+        return base64.b64encode(self._data).decode("utf-8")
+
+    def save(
+        self,
+        fp: Any,
+        format: Optional[str] = None,  # noqa: A002
+        **params: Any,
+    ) -> None:
+        # same format and no encoder options: write the original bytes.
+        # like PIL, the format is inferred from a path or the file's name
+        target = format
+        name = fp if isinstance(fp, (str, Path)) else getattr(fp, "name", None)
+        if target is None and isinstance(name, (str, Path)):
+            target = image_extensions().get(Path(name).suffix.lower(), "")
+        if not params and (target is None or target.upper() == self.format):
+            if isinstance(fp, (str, Path)):
+                with open(fp, "wb") as f:
+                    f.write(self._data)
+            else:
+                fp.write(self._data)
+            return
+        self.image.save(fp, format, **params)
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__") or name in LazyImage.__slots__:
+            raise AttributeError(name)
+        return getattr(self.image, name)
+
+    def __repr__(self) -> str:
+        return f"<LazyImage format={self._format} bytes={len(self._data)}>"
+
+
+ImageType = Union[str, Path, Image.Image, LazyImage]  # prevent circular import
 
 
 @beartype
 def pil_to_base64(img: Image.Image) -> str:
+    cache = _cache.image_cache
+    if cache is None:
+        return _pil_to_base64(img)
+
+    key = cache.image_key(img)
+    value = cache.get(key)
+    if value is None:
+        value = _pil_to_base64(img)
+        cache.put(key, value)
+    return value
+
+
+def _pil_to_base64(img: Image.Image) -> str:
     buf = io.BytesIO()
     # 1. png
     if "parameters" in img.info:
@@ -36,28 +169,52 @@ def pil_to_base64(img: Image.Image) -> str:
 
 @beartype
 def image_to_base64(img: ImageType) -> str:
+    if isinstance(img, LazyImage):
+        return img.base64()
     if isinstance(img, Image.Image):
         return pil_to_base64(img)
 
-    if isinstance(img, str) and not Path(img).is_file():
+    if isinstance(img, str) and not is_file(img):
         # expect img is base64 string
         return img
+
+    cache = _cache.image_cache
+    key = cache.file_key(img) if cache is not None else ""
+    if cache is not None and (value := cache.get(key)) is not None:
+        return value
+
     with open(img, "rb") as f:
-        value = f.read()
-    return base64.b64encode(value).decode("utf-8")
+        data = f.read()
+    value = base64.b64encode(data).decode("utf-8")
+    if cache is not None:
+        cache.put(key, value)
+    return value
 
 
 @beartype
 async def aimage_to_base64(img: ImageType) -> str:
+    if isinstance(img, LazyImage):
+        return img.base64()
     if isinstance(img, Image.Image):
         return pil_to_base64(img)
 
-    if isinstance(img, str) and not Path(img).is_file():
+    if isinstance(img, str) and not is_file(img):
         # expect img is base64 string
         return img
+
+    cache = _cache.image_cache
+    key = cache.file_key(img) if cache is not None else ""
+    if cache is not None and (value := cache.get(key)) is not None:
+        return value
+
+    from aiofile import async_open
+
     async with async_open(img, "rb") as f:
-        value = await f.read()
-    return base64.b64encode(value).decode("utf-8")
+        data = await f.read()
+    value = base64.b64encode(data).decode("utf-8")
+    if cache is not None:
+        cache.put(key, value)
+    return value
 
 
 @beartype
@@ -65,50 +222,89 @@ def base64_to_image(s: str) -> Image.Image:
     return Image.open(io.BytesIO(base64.b64decode(s)))
 
 
+def is_file(path: PathType) -> bool:
+    # a long prompt or a base64 string is not a valid path
+    try:
+        return Path(path).is_file()
+    except (OSError, ValueError):
+        return False
+
+
 def is_image(obj: Any) -> bool:
-    if isinstance(obj, (str, Path)) and (p := Path(obj)).is_file():
-        return p.suffix.lower() in available_extensions
-    return isinstance(obj, Image.Image)
+    if isinstance(obj, (str, Path)) and is_file(obj):
+        return Path(obj).suffix.lower() in image_extensions()
+    return isinstance(obj, (Image.Image, LazyImage))
+
+
+_encoder: Optional[ThreadPoolExecutor] = None
+
+
+def _get_encoder() -> ThreadPoolExecutor:
+    global _encoder
+    if _encoder is None:
+        workers = min(8, os.cpu_count() or 1)
+        _encoder = ThreadPoolExecutor(workers, "aaa1111-encoder")
+    return _encoder
 
 
-def _recursive_read_image(item: Any):
+def _collect_images(item: Any, leaves: List[Tuple[Any, Any, Any]]) -> Any:
+    # copy the containers, and record where the images are
     if not isinstance(item, str) and isinstance(item, Sequence):
-        return [
-            image_to_base64(v) if is_image(v) else _recursive_read_image(v)
-            for v in item
-        ]
-    if isinstance(item, Mapping):
-        return {
-            k: image_to_base64(v) if is_image(v) else _recursive_read_image(v)
-            for k, v in item.items()
-        }
-    return item
+        out = list(item)
+        keys = range(len(out))
+    elif isinstance(item, Mapping):
+        out = dict(item)
+        keys = list(out)
+    else:
+        return item
+
+    for k in keys:
+        v = out[k]
+        if is_image(v):
+            leaves.append((out, k, v))
+        else:
+            out[k] = _collect_images(v, leaves)
+    return out
+
+
+def _unique_images(leaves: List[Tuple[Any, Any, Any]]) -> Dict[int, Any]:
+    # the same object can appear more than once, e.g. one image for
+    # several controlnet units. encode it once: PIL images are not safe
+    # to load from multiple threads.
+    return {id(v): v for _, _, v in leaves}
 
 
 def recursive_read_image(item: Mapping[str, Any]) -> Dict[str, Any]:
-    return _recursive_read_image(item)
+    leaves = []
+    data = _collect_images(item, leaves)
+    images = _unique_images(leaves)
 
+    if len(images) > 1:
+        values = _get_encoder().map(image_to_base64, images.values())
+    else:
+        values = map(image_to_base64, images.values())
+    encoded = dict(zip(images, values))
 
-async def _arecursive_read_image(item: Any):
-    if not isinstance(item, str) and isinstance(item, Sequence):
-        return [
-            (await aimage_to_base64(v))
-            if is_image(v)
-            else (await _arecursive_read_image(v))
-            for v in item
-        ]
-    if isinstance(item, Mapping):
-        return {
-            k: (await aimage_to_base64(v))
-            if is_image(v)
-            else (await _arecursive_read_image(v))
-            for k, v in item.items()
-        }
-    return item
+    for container, k, v in leaves:
+        container[k] = encoded[id(v)]
+    return data
 
 
 async def arecursive_read_image(item: Mapping[str, Any]) -> Dict[str, Any]:
-    return await _arecursive_read_image(item)
+    leaves = []
+    data = _collect_images(item, leaves)
+    images = _unique_images(leaves)
+
+    loop = asyncio.get_running_loop()
+    encoder = _get_encoder()
+    values = await asyncio.gather(
+        *(loop.run_in_executor(encoder, image_to_base64, v) for v in images.values())
+    )
+    encoded = dict(zip(images, values))
+
+    for container, k, v in leaves:
+        container[k] = encoded[id(v)]
+    return data
 
 
 @beartype
@@ -117,6 +313,31 @@ def is_valid_file(file: PathType) -> bool:
     return ext in FILE_EXT
 
 
+_yaml: Optional["YAML"] = None
+_yaml_lock = threading.Lock()
+
+
+def _parse(data: str, ext: str) -> Dict[str, Any]:
+    global _yaml
+    if ext == ".toml":
+        import rtoml
+
+        return rtoml.loads(data)
+    if ext == ".json":
+        return orjson.loads(data)
+    if ext == ".json5":
+        import pyjson5
+
+        return pyjson5.decode(data)
+    # a YAML instance is not thread-safe, but expensive to create
+    with _yaml_lock:
+        if _yaml is None:
+            from ruamel.yaml import YAML
+
+            _yaml = YAML()
+        return dict(_yaml.load(data))
+
+
 @beartype
 def load_from_file(file: PathType) -> Dict[str, Any]:
     if not is_valid_file(file):
@@ -124,14 +345,17 @@ def load_from_file(file: PathType) -> Dict[str, Any]:
         raise ValueError(msg)
     ext = Path(file).suffix.lower()
 
+    cache = _cache.payload_cache
+    key = _cache.file_key(file) if cache is not None else ""
+    if cache is not None and (data := cache.get(key)) is not None:
+        return data
+
     with open(file, encoding="utf-8") as raw:
-        if ext == ".toml":
-            return rtoml.load(raw)
-        if ext == ".json":
-            return orjson.loads(raw.read())
-        if ext == ".json5":
-            return pyjson5.decode_io(raw)
-        return dict(YAML().load(raw))
+        text = raw.read()
+    data = _parse(text, ext)
+    if cache is not None:
+        cache.put(key, data, len(text))
+    return data
 
 
 @beartype
@@ -141,29 +365,96 @@ async def aload_from_file(file: PathType) -> Dict[str, Any]:
         raise ValueError(msg)
     ext = Path(file).suffix.lower()
 
+    cache = _cache.payload_cache
+    key = _cache.file_key(file) if cache is not None else ""
+    if cache is not None and (data := cache.get(key)) is not None:
+        return data
+
+    from aiofile import async_open
+
     async with async_open(file, encoding="utf-8") as raw:
-        data = await raw.read()
-        if ext == ".toml":
-            return rtoml.loads(data)
-        if ext == ".json":
-            return orjson.loads(data)
-        if ext == ".json5":
-            return pyjson5.decode(data)
-        return dict(YAML().load(data))
+        text = await raw.read()
+    data = _parse(text, ext)
+    if cache is not None:
+        cache.put(key, data, len(text))
+    return data
+
+
+def get_infotext(image: Union[Image.Image, LazyImage]) -> Optional[str]:
+    # only reads the header, pixel data is not decoded
+    if "parameters" in image.info:
+        return image.info["parameters"]
+    exif = image.getexif()
+    # written by webui in the exif ifd, by `save_image` in ifd0
+    comment = exif.get(0x9286) or exif.get_ifd(0x8769).get(0x9286)
+    if isinstance(comment, bytes):
+        # an exif UserComment: 8 bytes of encoding, then the text
+        codecs = {b"UNICODE\0": "utf-16-be", b"ASCII\0\0\0": "ascii"}
+        codec = codecs.get(comment[:8])
+        try:
+            return comment[8:].decode(codec) if codec else None
+        except UnicodeDecodeError:
+            return None
+    return comment or None
+
+
+def has_infotext(image: Union[Image.Image, LazyImage]) -> bool:
+    return get_infotext(image) is not None
+
+
+def png_add_text(data: bytes, key: str, text: str) -> bytes:
+    # insert a text chunk right after IHDR, the same chunk `PngInfo.add_text` writes
+    try:
+        chunk_type = b"tEXt"
+        chunk = key.encode("latin-1") + b"\0" + text.encode("latin-1")
+    except UnicodeEncodeError:
+        chunk_type = b"iTXt"
+        chunk = key.encode("latin-1") + b"\0\0\0\0\0" + text.encode("utf-8")
+    crc = zlib.crc32(chunk_type + chunk) & 0xFFFFFFFF
+    chunk = struct.pack(">I", len(chunk)) + chunk_type + chunk + struct.pack(">I", crc)
+
+    ihdr_end = 8 + 8 + struct.unpack(">I", data[8:12])[0] + 4
+    return data[:ihdr_end] + chunk + data[ihdr_end:]
+
+
+def _save_verbatim(image: LazyImage, path: Path, infotext: Optional[str]) -> bool:
+    # same format as the server sent: write the bytes without re-encoding
+    if image_extensions().get(path.suffix.lower()) != image.format:
+        return False
+
+    data = image.bytes
+    if infotext:
+        embedded = get_infotext(image)
+        if embedded is not None and embedded != infotext:
+            # another infotext than the caller's, re-encoded with theirs
+            return False
+        if embedded is None:
+            if image.format != "PNG":
+                return False
+            data = png_add_text(data, "parameters", infotext)
+
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
 
 
 def save_image(
-    image: Image.Image,
+    image: Union[Image.Image, LazyImage],
     save_dir: Path,
     infotext: Optional[str] = None,
     ext: str = "png",
     quality: int = 95,
     lossless: bool = True,
 ) -> Path:
+    from ulid import ULID
+
     if not ext.startswith("."):
         ext = "." + ext
     path = save_dir.joinpath(str(ULID())).with_suffix(ext)
 
+    if isinstance(image, LazyImage) and _save_verbatim(image, path, infotext):
+        return path
+
     if not infotext:
         image.save(path, quality=quality, lossless=lossless)
 
@@ -179,3 +470,166 @@ def save_image(
         image.save(path, quality=quality, lossless=lossless, exif=exif)
 
     return path
+
+
+class ImageWriter:
+    def __init__(
+        self,
+        save_dir: Path,
+        ext: str = "png",
+        quality: int = 95,
+        lossless: bool = True,
+        max_workers: int = 2,
+        max_pending: Optional[int] = None,
+        on_span: Optional["SpanHook"] = None,
+    ):
+        self.save_dir = save_dir
+        self.ext = ext
+        self.quality = quality
+        self.lossless = lossless
+        # called with a "save" Span from the writer threads
+        self.on_span = on_span
+
+        self._executor = ThreadPoolExecutor(max_workers, "aaa1111-writer")
+        # queued + running saves. `submit` blocks when full, so memory stays
+        # bounded when saving falls behind generation.
+        self._slots = threading.BoundedSemaphore(max_pending or max_workers * 4)
+        self._lock = threading.Lock()
+        # `asubmit` calls waiting for a slot, woken one at a time as saves end
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._futures: Set[Future] = set()
+        self._error: Optional[BaseException] = None
+
+    def _done(self, fut: Future) -> None:
+        with self._lock:
+            self._futures.discard(fut)
+            if self._error is None and not fut.cancelled():
+                self._error = fut.exception()
+        self._slots.release()
+        self._wake()
+
+    def _wake(self) -> None:
+        with self._lock:
+            if not self._waiters:
+                return
+            loop, waiter = self._waiters.popleft()
+        try:
+            loop.call_soon_threadsafe(self._set_waiter, waiter)
+        except RuntimeError:  # its loop is closed
+            self._wake()
+
+    def _set_waiter(self, waiter: asyncio.Future) -> None:
+        if waiter.done():  # cancelled since, the next one gets the slot
+            self._wake()
+        else:
+            waiter.set_result(None)
+
+    def _drop_waiter(
+        self, loop: asyncio.AbstractEventLoop, waiter: asyncio.Future
+    ) -> None:
+        # a waiter that leaves without taking its wake up passes it on
+        with self._lock:
+            if (loop, waiter) in self._waiters:
+                self._waiters.remove((loop, waiter))
+                return
+        if not waiter.cancel():
+            self._wake()
+
+    # the first failed save is re-raised by the next submit, join or close.
+    def _raise_error(self) -> None:
+        with self._lock:
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _submit(
+        self, image: Union[Image.Image, LazyImage], infotext: Optional[str]
+    ) -> "Future[Path]":
+        # a traced save runs in the submitter's context, like asyncio.to_thread:
+        # the hook can tell which job the span belongs to
+        save = (
+            save_image
+            if self.on_span is None
+            else partial(contextvars.copy_context().run, self._save_traced)
+        )
+        try:
+            fut = self._executor.submit(
+                save,
+                image,
+                self.save_dir,
+                infotext,
+                self.ext,
+                self.quality,
+                self.lossless,
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._futures.add(fut)
+        fut.add_done_callback(self._done)
+        return fut
+
+    def _save_traced(self, *args: Any) -> Path:
+        from aaa1111.trace import Span, SpanContext
+
+        with SpanContext(self.on_span, Span("save", "", 0.0)) as span:
+            path = save_image(*args)
+            span.bytes = path.stat().st_size
+        return path
+
+    def submit(
+        self, image: Union[Image.Image, LazyImage], infotext: Optional[str] = None
+    ) -> "Future[Path]":
+        self._raise_error()
+        self._slots.acquire()
+        return self._submit(image, infotext)
+
+    async def asubmit(
+        self, image: Union[Image.Image, LazyImage], infotext: Optional[str] = None
+    ) -> "Future[Path]":
+        self._raise_error()
+        # waits in the loop: a cancelled caller never takes a slot,
+        # and no thread is held while waiting
+        loop = asyncio.get_running_loop()
+        while not self._slots.acquire(blocking=False):
+            waiter = loop.create_future()
+            with self._lock:
+                self._waiters.append((loop, waiter))
+            try:
+                # a slot freed before the waiter was queued woke nobody
+                if self._slots.acquire(blocking=False):
+                    self._drop_waiter(loop, waiter)
+                    break
+                await waiter
+            except BaseException:
+                self._drop_waiter(loop, waiter)
+                raise
+        return self._submit(image, infotext)
+
+    def join(self) -> None:
+        with self._lock:
+            futures = list(self._futures)
+        for fut in futures:
+            fut.exception()
+        self._raise_error()
+
+    def close(self) -> None:
+        try:
+            self.join()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "ImageWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,127 @@
+# deterministic inputs for the benchmarks: the same seed gives the same
+# images and payloads on every run and every machine.
+import base64
+import io
+import random
+from pathlib import Path
+from typing import Any, Dict
+
+import orjson
+import pyjson5
+import rtoml
+from PIL import Image, PngImagePlugin
+from ruamel.yaml import YAML
+
+from aaa1111.types.extension import ControlNet, ControlNetArgs
+from aaa1111.types.toimg import TXT2IMG
+
+SEED = 1111
+INFOTEXT = (
+    "masterpiece, best quality, 1girl\n"
+    "Negative prompt: (worst quality, low quality:1.1), text, title, logo\n"
+    "Steps: 20, Sampler: DPM++ 2M Karras, CFG scale: 7.5, Seed: 1111, "
+    "Size: 512x512, Model: model1"
+)
+
+
+def make_image(width: int = 512, height: int = 512, seed: int = SEED) -> Image.Image:
+    # 8x8 blocks of random colors: compresses about as well as a generated
+    # image, unlike pure noise
+    rng = random.Random(seed)
+    n = width * height * 3 // 64
+    data = rng.getrandbits(n * 8).to_bytes(n, "little")
+    small = Image.frombytes("RGB", (width // 8, height // 8), data)
+    return small.resize((width, height), Image.Resampling.BILINEAR)
+
+
+def encode(image: Image.Image, fmt: str = "png", infotext: str = "") -> bytes:
+    buf = io.BytesIO()
+    if infotext and fmt == "png":
+        pnginfo = PngImagePlugin.PngInfo()
+        pnginfo.add_text("parameters", infotext)
+        image.save(buf, format=fmt, pnginfo=pnginfo)
+    else:
+        image.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def png_base64(width: int = 512, height: int = 512) -> str:
+    data = encode(make_image(width, height), "png", INFOTEXT)
+    return base64.b64encode(data).decode()
+
+
+def payload(seed: int = SEED) -> Dict[str, Any]:
+    # a txt2img payload file as users write them, with a long prompt
+    rng = random.Random(seed)
+    tags = [f"tag{rng.randrange(1000)}" for _ in range(60)]
+    return {
+        "prompt": ", ".join(tags),
+        "negative_prompt": "(worst quality, low quality:1.1), text, title, logo",
+        "sampler_name": "DPM++ 2M Karras",
+        "batch_size": 2,
+        "cfg_scale": 7.5,
+        "width": 512,
+        "height": 768,
+        "steps": 20,
+        "seed": seed,
+        "styles": [f"style{i}" for i in range(8)],
+        "override_settings": {
+            "CLIP_stop_at_last_layers": 2,
+            "sd_model_checkpoint": "model1.safetensors",
+            "sd_vae": "vae1.safetensors",
+        },
+        "alwayson_scripts": {"Simple wildcards": {"args": []}},
+    }
+
+
+def write_payload(path: Path, data: Dict[str, Any]) -> Path:
+    ext = path.suffix.lower()
+    if ext == ".toml":
+        text = rtoml.dumps(data)
+    elif ext == ".json":
+        text = orjson.dumps(data).decode()
+    elif ext == ".json5":
+        text = pyjson5.encode(data)
+    else:
+        buf = io.StringIO()
+        YAML().dump(data, buf)
+        text = buf.getvalue()
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+def nested_payload(image: Any, units: int = 3, leaves: int = 500) -> Dict[str, Any]:
+    # a controlnet request: the same image in every unit, and many
+    # non-image values that `recursive_read_image` has to walk over
+    rng = random.Random(SEED)
+    return {
+        **payload(),
+        "init_images": [image],
+        "alwayson_scripts": {
+            "ControlNet": {
+                "args": [
+                    {"image": image, "module": "canny", "weight": 1.0}
+                    for _ in range(units)
+                ]
+            },
+            "Extra": {
+                "args": [
+                    {"name": f"item{i}", "values": [rng.random() for _ in range(4)]}
+                    for i in range(leaves)
+                ]
+            },
+        },
+    }
+
+
+def txt2img() -> TXT2IMG:
+    return TXT2IMG(**payload())
+
+
+def script_payload(image: Any) -> Dict[str, Any]:
+    units = [ControlNetArgs(image=image, module="canny") for _ in range(3)]
+    return {
+        **payload(),
+        "alwayson_scripts": ControlNet(units),
+        "script_name": {"title": "x/y/z plot", "args": [7, "7.5,8", 0, "", 0, ""]},
+    }
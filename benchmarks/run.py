@@ -0,0 +1,164 @@
+# offline benchmarks of the per-request work done by the client, no webui needed.
+#
+#   python benchmarks/run.py               run and compare with baseline.json
+#   python benchmarks/run.py --save        run and overwrite baseline.json
+#   python benchmarks/run.py -k base64     only the benchmarks matching "base64"
+#
+# the caches in aaa1111.cache are turned off, so every call does the full work.
+# a baseline is only comparable on the machine that saved it.
+import argparse
+import platform
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+import orjson
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fixtures import (
+    INFOTEXT,
+    encode,
+    make_image,
+    nested_payload,
+    payload,
+    png_base64,
+    script_payload,
+    txt2img,
+    write_payload,
+)
+
+from aaa1111 import AAA1111, cache
+from aaa1111.utils import (
+    LazyImage,
+    base64_to_image,
+    image_to_base64,
+    load_from_file,
+    pil_to_base64,
+    recursive_read_image,
+    save_image,
+)
+
+BASELINE = Path(__file__).with_name("baseline.json")
+
+Bench = Tuple[str, Callable[[], Any]]
+
+
+def benchmarks(tmp: Path) -> Iterator[Bench]:
+    image = make_image()
+    png = make_image()
+    png.info["parameters"] = INFOTEXT
+    b64 = png_base64()
+
+    yield "pil_to_base64[png]", lambda: pil_to_base64(png)
+    yield "pil_to_base64[webp]", lambda: pil_to_base64(image)
+
+    for fmt in ("png", "webp", "jpeg"):
+        path = tmp / f"image.{fmt}"
+        path.write_bytes(encode(image, fmt))
+        yield f"image_to_base64[{fmt} file]", partial_call(image_to_base64, str(path))
+    lazy = LazyImage(b64)
+    yield "image_to_base64[LazyImage]", lambda: image_to_base64(lazy)
+
+    yield "base64_to_image", lambda: base64_to_image(b64).load()
+    yield "LazyImage", lambda: LazyImage(b64)
+
+    nested = nested_payload(LazyImage(b64))
+    yield "recursive_read_image[LazyImage]", lambda: recursive_read_image(nested)
+    nested = nested_payload(png)
+    yield "recursive_read_image[PIL]", lambda: recursive_read_image(nested)
+
+    for ext in (".toml", ".yaml", ".json", ".json5"):
+        path = write_payload(tmp / f"payload{ext}", payload())
+        yield f"load_from_file[{ext[1:]}]", partial_call(load_from_file, path)
+
+    params = txt2img()
+    yield "asdict[TXT2IMG]", params.asdict
+    scripts = script_payload(b64)
+    yield "_convert_script", lambda: AAA1111._convert_script(dict(scripts))
+
+    for ext in ("png", "webp", "jpg"):
+        yield f"save_image[{ext}]", partial_call(save_and_remove, png, tmp, ext)
+    yield "save_image[png verbatim]", partial_call(
+        save_and_remove, LazyImage(b64), tmp, "png"
+    )
+
+
+def partial_call(fn: Callable[..., Any], *args: Any) -> Callable[[], Any]:
+    return lambda: fn(*args)
+
+
+def save_and_remove(image: Any, tmp: Path, ext: str) -> None:
+    save_image(image, tmp, INFOTEXT, ext).unlink()
+
+
+def measure(fn: Callable[[], Any], repeat: int, min_time: float) -> float:
+    # seconds per call, the best of `repeat` rounds of at least `min_time`
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(repeat, number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-k", "--filter", default="")
+    parser.add_argument("--save", action="store_true")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.1)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.5,
+        help="fail when a benchmark is this many times slower than the baseline",
+    )
+    args = parser.parse_args()
+
+    cache.set_image_cache(None)
+    cache.set_payload_cache(None)
+
+    baseline: Dict[str, float] = {}
+    if BASELINE.exists():
+        baseline = orjson.loads(BASELINE.read_bytes())["results"]
+
+    results: Dict[str, float] = {}
+    regressions = []
+    print(f"{'benchmark':<36}{'time (us)':>12}{'baseline':>12}{'ratio':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, fn in benchmarks(Path(tmp)):
+            if args.filter not in name:
+                continue
+            t = measure(fn, args.repeat, args.min_time)
+            results[name] = t
+
+            line = f"{name:<36}{t * 1e6:>12.1f}"
+            if name in baseline and not args.save:
+                ratio = t / baseline[name]
+                line += f"{baseline[name] * 1e6:>12.1f}{ratio:>7.2f}x"
+                if ratio > args.tolerance:
+                    regressions.append(name)
+                    line += " !"
+            print(line)
+
+    if args.save:
+        data = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            # with -k, only the selected results are replaced
+            "results": {**baseline, **results},
+        }
+        BASELINE.write_bytes(
+            orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+        )
+        print(f"saved {len(results)} results to {BASELINE.name}")
+
+    if regressions:
+        print(f"slower than {args.tolerance}x the baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
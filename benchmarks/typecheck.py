@@ -0,0 +1,65 @@
+# per-call cost of the runtime type checks.
+# each case runs in a fresh interpreter, with AAA1111_TYPECHECK on and off,
+# because the checks are applied when aaa1111 is imported.
+#
+#   python benchmarks/typecheck.py [--number N]
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+SETUP = """
+from aaa1111.types.info import LoraInfo
+from aaa1111.types.toimg import TXT2IMG
+from aaa1111.utils import is_valid_file
+
+lora = {"name": "lora", "alias": "lora", "path": "/models/lora.safetensors", "metadata": {}}
+loras = [lora] * 100
+"""
+
+CASES = {
+    "TXT2IMG()": 'TXT2IMG(prompt="cat", seed=1, steps=20, cfg_scale=7.0)',
+    "100 x LoraInfo()": "[LoraInfo(**item) for item in loras]",
+    "is_valid_file()": 'is_valid_file("a.yaml")',
+}
+
+
+def measure(stmt: str, number: int, typecheck: bool) -> float:
+    # seconds per call, the best of 5 repeats
+    code = (
+        "import timeit\n"
+        f"t = timeit.repeat({stmt!r}, setup={SETUP!r}, number={number}, repeat=5)\n"
+        f"print(min(t) / {number})\n"
+    )
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(ROOT),
+        "AAA1111_TYPECHECK": "1" if typecheck else "0",
+    }
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    return float(out.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'case':<20}{'on (us)':>12}{'off (us)':>12}{'overhead':>12}")
+    for name, stmt in CASES.items():
+        on = measure(stmt, args.number, typecheck=True) * 1e6
+        off = measure(stmt, args.number, typecheck=False) * 1e6
+        print(f"{name:<20}{on:>12.2f}{off:>12.2f}{on / off:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,15 @@ from pathlib import Path
 from rich.progress import track
 
 tests_dir = Path(__file__).parent
+# the offline tests in tests/unit are already async where they need to be
+unit_dir = tests_dir.joinpath("unit")
 
 py_files = [
     file
     for file in tests_dir.rglob("*.py")
-    if file.name.startswith("test") and not file.name.startswith("test_async")
+    if file.name.startswith("test")
+    and not file.name.startswith("test_async")
+    and unit_dir not in file.parents
 ]
 
 func_pattern = re.compile(r"def (?P<func>[^\(]+)(?!\()")
@@ -2,13 +2,13 @@ import asyncio
 import os
 import subprocess
 import time
+from pathlib import Path
 
 import pytest
 from dotenv import load_dotenv
 
 load_dotenv()
-python = os.environ["AAA1111_PYTHON"]
-webui_dir = os.environ["AAA1111_WEBUI"]
+unit_dir = Path(__file__).parent.joinpath("unit")
 sleep_sec = int(os.getenv("AAA1111_SLEEP", 20))
 cmd_args = [
     "--xformers",
@@ -24,8 +24,13 @@ if os.name == "nt":
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 
-def pytest_sessionstart(session: pytest.Session) -> None:
+def pytest_collection_finish(session: pytest.Session) -> None:
+    # the offline tests in tests/unit run without a webui
     global process
+    if all(unit_dir in item.path.parents for item in session.items):
+        return
+    python = os.environ["AAA1111_PYTHON"]
+    webui_dir = os.environ["AAA1111_WEBUI"]
     process = subprocess.Popen([python, "launch.py", *cmd_args], cwd=webui_dir)
     time.sleep(sleep_sec)
 
@@ -0,0 +1,28 @@
+# offline tests: answered by httpx.MockTransport or aaa1111.testing.FakeWebUI,
+# the root conftest does not launch a webui for them
+from typing import Any, Callable, List, Optional
+
+import httpx
+import pytest
+
+from aaa1111 import AAA1111
+
+Handler = Callable[[httpx.Request], Any]
+
+
+@pytest.fixture
+def mock_api() -> Callable[..., AAA1111]:
+    # an AAA1111 answered by `handler`, sync or async. the paths it requests
+    # are appended to `calls`, when given
+    def make(
+        handler: Handler, calls: Optional[List[str]] = None, **kwargs: Any
+    ) -> AAA1111:
+        def record(request: httpx.Request) -> Any:
+            if calls is not None:
+                calls.append(request.url.path)
+            return handler(request)
+
+        transport = httpx.MockTransport(record)
+        return AAA1111(client_kwargs={"transport": transport}, **kwargs)
+
+    return make
@@ -0,0 +1,101 @@
+import asyncio
+
+import httpx
+import orjson
+import pytest
+
+from aaa1111.client.base import SingleFlight, request_key
+
+
+async def upscaled(request: httpx.Request) -> httpx.Response:
+    await asyncio.sleep(0.05)
+    return httpx.Response(200, json={"html_info": "", "image": ""})
+
+
+def test_request_key():
+    assert request_key("/a", {"x": 1, "y": 2}) == request_key("/a", {"y": 2, "x": 1})
+    assert request_key("/a", {"x": 1}) != request_key("/b", {"x": 1})
+    assert request_key("/a", {"x": 1}) != request_key("/a", {"x": 2})
+
+
+async def test_single_flight():
+    flights = SingleFlight()
+    count = 0
+
+    async def fetch():
+        nonlocal count
+        count += 1
+        await asyncio.sleep(0.05)
+        return count
+
+    results = await asyncio.gather(*(flights.do("a", fetch) for _ in range(5)))
+    assert results == [1] * 5
+    assert len(flights) == 0
+    assert await flights.do("a", fetch) == 2
+
+
+async def test_single_flight_error():
+    flights = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        msg = "boom"
+        raise RuntimeError(msg)
+
+    results = await asyncio.gather(
+        *(flights.do("a", fetch) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+async def test_single_flight_cancel():
+    flights = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    first = asyncio.ensure_future(flights.do("a", fetch))
+    second = asyncio.ensure_future(flights.do("a", fetch))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "ok"
+
+
+@pytest.mark.parametrize("coalesce", [True, False])
+async def test_coalesce_extra_single_image(coalesce: bool, mock_api):
+    calls = []
+    api = mock_api(upscaled, calls, coalesce=coalesce)
+    payload = {"image": "tests/image/test1.png", "upscaling_resize": 2}
+
+    resps = await asyncio.gather(*(api.aextra_single_image(payload) for _ in range(4)))
+    assert len(calls) == (1 if coalesce else 4)
+    # every caller gets its own response object
+    assert len({id(r) for r in resps}) == 4
+
+    await asyncio.gather(
+        api.aextra_single_image(payload),
+        api.aextra_single_image(payload, upscaling_resize=4),
+    )
+    assert len(calls) == (3 if coalesce else 6)
+
+
+async def test_coalesce_random_seed(mock_api):
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(orjson.loads(request.content)["seed"])
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"images": [], "parameters": {}, "info": "{}"})
+
+    api = mock_api(handler)
+    await asyncio.gather(
+        *(api.atxt2img({"prompt": "cat", "seed": -1}) for _ in range(3))
+    )
+    assert calls == [-1, -1, -1]
+
+    calls.clear()
+    await asyncio.gather(
+        *(api.atxt2img({"prompt": "cat", "seed": 1}) for _ in range(3))
+    )
+    assert calls == [1]
@@ -0,0 +1,147 @@
+import asyncio
+import base64
+import io
+
+import httpx
+import orjson
+import pytest
+from PIL import Image
+
+from aaa1111 import AAA1111, MicroBatcher
+from aaa1111.client.batch import batch_key, split_batches
+
+
+def encode(color: int) -> str:
+    buf = io.BytesIO()
+    Image.new("L", (8, 8), color).save(buf, "PNG")
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+def batched(requests):
+    # answers like webui: the grid first, then one image per seed
+    async def handler(request: httpx.Request) -> httpx.Response:
+        payload = orjson.loads(request.content)
+        requests.append(payload)
+        await asyncio.sleep(0.01)
+        n = payload.get("batch_size", 1)
+        seed = payload.get("seed", -1)
+        seed = seed if seed != -1 else 100
+        seeds = [seed + i for i in range(n)]
+        grid = n > 1
+        info = {
+            "seed": seed,
+            "all_seeds": seeds,
+            "all_prompts": [payload["prompt"]] * n,
+            "infotexts": ["grid"] * grid + [f"seed {s}" for s in seeds],
+            "index_of_first_image": int(grid),
+            "batch_size": n,
+        }
+        images = [encode(255)] * grid + [encode(s % 256) for s in seeds]
+        return httpx.Response(
+            200,
+            json={
+                "images": images,
+                "parameters": payload,
+                "info": orjson.dumps(info).decode(),
+            },
+        )
+
+    return handler
+
+
+def test_batch_key():
+    assert batch_key({"prompt": "a", "seed": 1}) == batch_key(
+        {"prompt": "a", "seed": 2}
+    )
+    assert batch_key({"prompt": "a"}) != batch_key({"prompt": "b"})
+    assert batch_key({"prompt": "a", "batch_size": 2}) is None
+    assert batch_key({"prompt": "a", "subseed_strength": 0.5}) is None
+    assert batch_key({"prompt": "a", "script_name": "x/y/z plot"}) is None
+
+
+def test_split_batches():
+    jobs = [({"seed": s}, None) for s in (3, 1, 2, 7, -1, -1, 8)]
+    batches = split_batches(jobs, max_batch=2)
+    seeds = [[j[0]["seed"] for j in b] for b in batches]
+    assert seeds == [[1, 2], [3], [7, 8], [-1, -1]]
+
+
+async def test_micro_batcher(mock_api):
+    requests = []
+    batcher = MicroBatcher(mock_api(batched(requests)), window=0.05)
+
+    resps = await asyncio.gather(
+        *(batcher.atxt2img({"prompt": "cat", "seed": s}) for s in (10, 11, 12)),
+        batcher.atxt2img({"prompt": "dog", "seed": 5}),
+    )
+
+    assert len(requests) == 2
+    cat = next(r for r in requests if r["prompt"] == "cat")
+    assert cat["batch_size"] == 3
+    assert cat["seed"] == 10
+
+    for resp, seed in zip(resps, (10, 11, 12, 5)):
+        assert len(resp.images) == 1
+        assert resp.images[0].getpixel((0, 0)) == seed
+        assert resp.info["infotexts"] == [f"seed {seed}"]
+        assert resp.info["all_seeds"] == [seed]
+        assert resp.parameters["seed"] == seed
+        assert resp.parameters.get("batch_size", 1) == 1
+
+
+async def test_micro_batcher_images(tmp_path, mock_api):
+    requests = []
+    batcher = MicroBatcher(mock_api(batched(requests)), window=0.05)
+    image = Image.new("RGB", (8, 8), "red")
+    path = tmp_path.joinpath("mask.png")
+    image.save(path)
+    controlnet = {"args": [{"image": image, "mask": path}]}
+
+    resps = await asyncio.gather(
+        *(
+            batcher.atxt2img(
+                {
+                    "prompt": "cat",
+                    "seed": s,
+                    "alwayson_scripts": {"controlnet": controlnet},
+                }
+            )
+            for s in (1, 2)
+        )
+    )
+
+    assert len(requests) == 1
+    assert requests[0]["batch_size"] == 2
+    args = requests[0]["alwayson_scripts"]["controlnet"]["args"][0]
+    assert isinstance(args["image"], str)
+    assert isinstance(args["mask"], str)
+    assert [r.info["seed"] for r in resps] == [1, 2]
+
+
+async def test_micro_batcher_random_seed(mock_api):
+    requests = []
+    batcher = MicroBatcher(mock_api(batched(requests)), window=0.05, max_batch=2)
+    resps = await asyncio.gather(
+        *(batcher.atxt2img({"prompt": "cat"}) for _ in range(5))
+    )
+
+    assert sorted(r.get("batch_size", 1) for r in requests) == [1, 2, 2]
+    seeds = [r.info["seed"] for r in resps]
+    assert len(set(seeds)) == 5
+
+
+async def test_micro_batcher_error(mock_api):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(500)
+
+    batcher = MicroBatcher(mock_api(handler), window=0.01)
+    results = await asyncio.gather(
+        *(batcher.atxt2img({"prompt": "cat", "seed": s}) for s in (1, 2)),
+        return_exceptions=True,
+    )
+    assert all(isinstance(r, httpx.HTTPStatusError) for r in results)
+
+
+def test_micro_batcher_max_batch():
+    with pytest.raises(ValueError, match="max_batch"):
+        MicroBatcher(AAA1111(), max_batch=0)
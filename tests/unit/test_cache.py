@@ -0,0 +1,170 @@
+import os
+from pathlib import Path
+
+import httpx
+import orjson
+from PIL import Image
+
+from aaa1111 import cache
+from aaa1111.cache import (
+    Base64Cache,
+    DiskStore,
+    LRUCache,
+    PayloadCache,
+    ResultCache,
+)
+from aaa1111.utils import image_to_base64, load_from_file
+
+
+def test_lru_cache():
+    cache = LRUCache(max_bytes=10)
+    cache.put("a", "1234")
+    cache.put("b", "1234")
+    assert cache.get("a") == "1234"
+    cache.put("c", "1234")
+    assert "b" not in cache
+    assert "a" in cache
+    assert cache.nbytes == 8
+    cache.put("d", "x" * 11)
+    assert "d" not in cache
+
+
+def test_disk_store(tmp_path: Path):
+    store = DiskStore(tmp_path, max_bytes=10)
+    store.put("aaaa", b"1234")
+    store.put("bbbb", b"1234")
+    os.utime(tmp_path.joinpath("aa", "aaaa"), (0, 0))
+    store.put("cccc", b"1234")
+    assert store.get("aaaa") is None
+    assert store.get("bbbb") == b"1234"
+    assert store.nbytes <= 9
+
+
+def test_base64_cache_file_key(tmp_path: Path):
+    path = tmp_path.joinpath("image.png")
+    path.write_bytes(b"1234")
+    key = Base64Cache.file_key(path)
+    assert Base64Cache.file_key(path) == key
+    path.write_bytes(b"12345")
+    assert Base64Cache.file_key(path) != key
+
+
+def test_base64_cache_image_key_palette():
+    a = Image.new("P", (4, 4), 1)
+    a.putpalette([0, 0, 0, 255, 0, 0])
+    b = Image.new("P", (4, 4), 1)
+    b.putpalette([0, 0, 0, 0, 0, 255])
+    assert a.tobytes() == b.tobytes()
+    assert Base64Cache.image_key(a) != Base64Cache.image_key(b)
+    assert Base64Cache.image_key(a) == Base64Cache.image_key(a.copy())
+
+    c = a.copy()
+    c.info["transparency"] = 1
+    assert Base64Cache.image_key(a) != Base64Cache.image_key(c)
+
+
+def test_base64_cache_disk(tmp_path: Path):
+    cache = Base64Cache(disk=tmp_path)
+    cache.put("key", "value")
+    cache.memory.clear()
+    assert cache.get("key") == "value"
+    assert "key" in cache.memory
+
+
+def test_payload_cache(tmp_path: Path):
+    file = tmp_path.joinpath("params.yaml")
+    file.write_text("prompt: a\ncfg_scale: 7.5\noverride_settings:\n  a: 1\n")
+    cache.set_payload_cache(PayloadCache(disk=tmp_path.joinpath("cache")))
+    try:
+        first = load_from_file(file)
+        first["override_settings"]["a"] = 2
+        assert load_from_file(file) == {
+            "prompt": "a",
+            "cfg_scale": 7.5,
+            "override_settings": {"a": 1},
+        }
+
+        cache.set_payload_cache(PayloadCache(disk=tmp_path.joinpath("cache")))
+        assert load_from_file(file)["cfg_scale"] == 7.5
+
+        file.write_text("prompt: b\n")
+        assert load_from_file(file) == {"prompt": "b"}
+    finally:
+        cache.set_payload_cache(PayloadCache())
+
+
+def test_result_cache(tmp_path: Path):
+    assert not ResultCache.cacheable({"prompt": "a"})
+    assert not ResultCache.cacheable({"seed": -1})
+    assert not ResultCache.cacheable({"seed": 1, "subseed_strength": 0.5})
+    assert ResultCache.cacheable({"seed": 1, "subseed": 2, "subseed_strength": 0.5})
+    assert ResultCache.cacheable({"seed": 1})
+
+    model = {"sd_model_checkpoint": "a.safetensors", "sd_vae": "Automatic"}
+    key = ResultCache.key("/sdapi/v1/txt2img", {"seed": 1, "prompt": "a"}, model)
+    assert key == ResultCache.key(
+        "/sdapi/v1/txt2img", {"prompt": "a", "seed": 1}, model
+    )
+    assert key != ResultCache.key(
+        "/sdapi/v1/img2img", {"prompt": "a", "seed": 1}, model
+    )
+    assert key != ResultCache.key(
+        "/sdapi/v1/txt2img", {"prompt": "a", "seed": 1}, {**model, "sd_vae": "None"}
+    )
+
+    cache = ResultCache(tmp_path)
+    cache.put(key, b"{}")
+    assert cache.get(key) == b"{}"
+
+
+def webui(model):
+    # `model` is the loaded checkpoint, changed by the test like another client
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/sdapi/v1/options":
+            return httpx.Response(200, json={"sd_model_checkpoint": model[0]})
+        return httpx.Response(
+            200,
+            json={
+                "images": [image_to_base64(Image.new("RGB", (8, 8)))],
+                "parameters": orjson.loads(request.content),
+                "info": "{}",
+            },
+        )
+
+    return handler
+
+
+def test_client_result_cache(tmp_path: Path, mock_api):
+    calls = []
+    model = ["a"]
+    api = mock_api(webui(model), calls, result_cache=tmp_path)
+    first = api.txt2img({"prompt": "cat", "seed": 1})
+    second = api.txt2img({"prompt": "cat", "seed": 1})
+    assert second.images[0].tobytes() == first.images[0].tobytes()
+    # the loaded model is read again, the generation is not
+    assert calls == ["/sdapi/v1/options", "/sdapi/v1/txt2img", "/sdapi/v1/options"]
+
+    # the checkpoint was changed outside of this client
+    calls.clear()
+    model[0] = "b"
+    api.txt2img({"prompt": "cat", "seed": 1})
+    assert calls == ["/sdapi/v1/options", "/sdapi/v1/txt2img"]
+
+    # set by the payload, nothing to read
+    calls.clear()
+    override = {"sd_model_checkpoint": "a", "sd_vae": None}
+    api.txt2img({"prompt": "cat", "seed": 2, "override_settings": override})
+    api.txt2img({"prompt": "cat", "seed": 2, "override_settings": override})
+    assert calls == ["/sdapi/v1/txt2img"]
+
+
+async def test_aclient_result_cache(tmp_path: Path, mock_api):
+    calls = []
+    model = ["a"]
+    api = mock_api(webui(model), calls, result_cache=tmp_path)
+    await api.atxt2img({"prompt": "cat", "seed": 1})
+    await api.atxt2img({"prompt": "cat", "seed": 1})
+    assert calls.count("/sdapi/v1/txt2img") == 1
+    model[0] = "b"
+    await api.atxt2img({"prompt": "cat", "seed": 1})
+    assert calls.count("/sdapi/v1/txt2img") == 2
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from aaa1111 import AAA1111
+from aaa1111.testing import FakeWebUI
+from aaa1111.testing.load import percentile, run_load
+
+
+@pytest.fixture
+def server():
+    with FakeWebUI(step_time=0.005, extras_time=0.01, model_load_time=0.05) as s:
+        yield s
+
+
+@pytest.fixture
+def api(server: FakeWebUI):
+    with AAA1111(base_url=server.base_url) as api:
+        yield api
+
+
+def test_txt2img(api: AAA1111):
+    resp = api.txt2img({"prompt": "cat", "seed": 7, "batch_size": 2, "width": 64})
+    # the grid first, like webui
+    assert len(resp.images) == 3
+    assert resp.info["index_of_first_image"] == 1
+    assert resp.info["all_seeds"] == [7, 8]
+    assert resp.images[1].size == (64, 512)
+    assert "Seed: 8" in resp.images[2].info["parameters"]
+
+
+def test_single_worker(server: FakeWebUI, api: AAA1111):
+    payload = {"prompt": "cat", "steps": 20, "width": 64, "height": 64}
+    threads = [threading.Thread(target=api.txt2img, args=(payload,)) for _ in range(2)]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+
+    seen = []
+    while any(t.is_alive() for t in threads):
+        seen.append(api.progress())
+        time.sleep(0.01)
+    elapsed = time.monotonic() - start
+
+    # 20 steps of 5 ms, one job after the other
+    assert elapsed >= 0.2
+    assert max(p.state["job_count"] for p in seen) == 2
+    assert any(0 < p.progress < 1 and p.current_image is not None for p in seen)
+    assert api.progress().state["job_count"] == 0
+
+
+def test_model_load(server: FakeWebUI, api: AAA1111):
+    model = api.sd_models()[1].title
+    api.txt2img({"prompt": "cat", "override_settings": {"sd_model_checkpoint": model}})
+    assert api.get_options()["sd_model_checkpoint"] == model
+
+
+def test_extras_and_png_info(api: AAA1111):
+    image = api.txt2img({"prompt": "cat", "width": 32, "height": 32}).images[0]
+    resp = api.extra_single_image({"image": image, "upscaling_resize": 2})
+    assert resp.image.size == (64, 64)
+    info = api.png_info(image)
+    assert info.info.startswith("cat\n")
+
+
+def test_inventory(server: FakeWebUI, api: AAA1111):
+    assert len(api.loras()) == 100
+    assert api.samplers()[0].name == "Euler a"
+    assert server.requests["/sdapi/v1/loras"] == 1
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 0.5) == 51.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([], 0.5) == 0.0
+
+
+def test_run_load(server: FakeWebUI):
+    results = run_load(
+        server.base_url, concurrency=(1, 2), requests=3, steps=2, size=32
+    )
+    assert len(results) == 12
+    assert all(r.errors == 0 and r.requests == 3 for r in results)
+    assert all(0 < r.p50 <= r.p95 <= r.p99 for r in results)
@@ -0,0 +1,68 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).parents[2]
+
+# imported on first use, never by `import aaa1111` or `--help`.
+# rich is not listed: httpx imports it for its own cli when click is installed.
+LAZY = ("aiofile", "caio", "pyjson5", "rtoml", "ruamel", "ulid")
+
+# seconds, only catches something gone badly wrong, a warm import is ~0.5 s
+IMPORT_BUDGET = 10.0
+
+SCRIPT = """\
+import json, runpy, sys, time
+start = time.perf_counter()
+try:
+    {code}
+except SystemExit:
+    pass
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "modules": sorted(sys.modules)}}))
+"""
+
+
+def run_imports(code: str) -> Dict[str, Any]:
+    # the modules loaded by `code` in a fresh interpreter, and its run time
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    proc = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(code=code)],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=ROOT,
+        check=True,
+    )
+    return json.loads(proc.stdout.splitlines()[-1])
+
+
+def lazy_imported(modules: List[str]) -> List[str]:
+    # PngImagePlugin is used directly, the other plugins by the first
+    # `image_extensions()`
+    plugins = [
+        m
+        for m in modules
+        if m.startswith("PIL.")
+        and m.endswith("ImagePlugin")
+        and m != "PIL.PngImagePlugin"
+    ]
+    return sorted(m for m in modules if m.split(".")[0] in LAZY) + plugins
+
+
+def test_import_time():
+    result = run_imports("import aaa1111")
+    assert lazy_imported(result["modules"]) == []
+    assert "aaa1111.__main__" not in result["modules"]
+    assert result["seconds"] < IMPORT_BUDGET
+
+
+def test_cli_help_import_time():
+    code = 'sys.argv = ["aaa1111", "--help"]; runpy.run_module("aaa1111", run_name="__main__")'
+    result = run_imports(code)
+    assert "typer" in result["modules"]
+    assert lazy_imported(result["modules"]) == []
+    assert result["seconds"] < IMPORT_BUDGET
@@ -0,0 +1,82 @@
+import httpx
+import pytest
+
+from aaa1111.client.inventory import INVENTORY_TTL
+
+sampler = {"name": "Euler", "aliases": ["k_euler"], "options": {}}
+lora = {
+    "name": "foo",
+    "alias": "foo",
+    "path": "/models/Lora/foo.safetensors",
+    "metadata": {},
+}
+
+
+def handler(request: httpx.Request) -> httpx.Response:
+    if request.method == "POST":
+        return httpx.Response(200, json=None)
+    if request.url.path.endswith("/embeddings"):
+        return httpx.Response(200, json={"loaded": {}, "skipped": {}})
+    if request.url.path.endswith("/scripts"):
+        return httpx.Response(200, json={"txt2img": [], "img2img": []})
+    if request.url.path.endswith("/samplers"):
+        return httpx.Response(200, json=[sampler])
+    if request.url.path.endswith("/loras"):
+        return httpx.Response(200, json=[lora])
+    if request.url.path.endswith(("/cmd-flags", "/options")):
+        return httpx.Response(200, json={})
+    return httpx.Response(200, json=[])
+
+
+def test_inventory_cached(mock_api):
+    calls = []
+    api = mock_api(handler, calls)
+    first = api.inventory("samplers")
+    assert first[0].name == "Euler"
+    assert api.inventory("samplers") is first
+    assert calls == ["/sdapi/v1/samplers"]
+
+
+def test_inventory_ttl(mock_api):
+    calls = []
+    api = mock_api(handler, calls, inventory_ttl={"samplers": 0.0})
+    api.inventory("samplers")
+    api.inventory("samplers")
+    assert len(calls) == 2
+
+
+def test_inventory_unknown(mock_api):
+    api = mock_api(handler)
+    with pytest.raises(ValueError, match="unknown inventory"):
+        api.inventory("progress")
+
+
+def test_inventory_invalidate(mock_api):
+    calls = []
+    api = mock_api(handler, calls)
+    api.inventory("loras")
+    api.inventory("samplers")
+    api.refresh_loras()
+    api.inventory("loras")
+    api.inventory("samplers")
+    assert calls.count("/sdapi/v1/loras") == 2
+    assert calls.count("/sdapi/v1/samplers") == 1
+
+    api.invalidate()
+    api.inventory("samplers")
+    assert calls.count("/sdapi/v1/samplers") == 2
+
+
+async def test_asnapshot(mock_api):
+    calls = []
+    api = mock_api(handler, calls)
+    snapshot = await api.asnapshot()
+    assert set(snapshot) == set(INVENTORY_TTL)
+    assert snapshot["loras"][0].name == "foo"
+    assert len(calls) == len(INVENTORY_TTL)
+    assert await api.asnapshot() == snapshot
+    assert len(calls) == len(INVENTORY_TTL)
+
+    await api.arefresh_checkpoints()
+    await api.asnapshot()
+    assert calls.count("/sdapi/v1/sd-models") == 2
@@ -0,0 +1,81 @@
+from concurrent.futures import Future
+from pathlib import Path
+
+from aaa1111.__main__ import completed, count_jobs, iter_jobs
+from aaa1111.journal import Journal, file_digest, when_saved
+
+
+def test_journal(tmp_path: Path):
+    param = tmp_path.joinpath("param.yaml")
+    param.write_text("prompt: a\n")
+    digest = file_digest(param)
+
+    journal = Journal(tmp_path)
+    assert not journal.is_done("txt2img", param, digest)
+    journal.record("txt2img", param, digest, [tmp_path.joinpath("a.png")])
+    assert journal.is_done("txt2img", param, digest)
+
+    with journal.path.open("ab") as f:
+        f.write(b'{"task": "txt2img", "fi')  # interrupted write
+
+    journal = Journal(tmp_path)
+    assert journal.is_done("txt2img", param, digest)
+    assert not journal.is_done("img2img", param, digest)
+    param.write_text("prompt: b\n")
+    assert not journal.is_done("txt2img", param, file_digest(param))
+
+
+def test_journal_sweep_index(tmp_path: Path):
+    param = tmp_path.joinpath("sweep.yaml")
+    param.write_text("sweep:\n  seed: [1, 2]\n")
+    digest = file_digest(param)
+
+    journal = Journal(tmp_path)
+    journal.record("txt2img", param, digest, [], index=1)
+    journal = Journal(tmp_path)
+    assert journal.is_done("txt2img", param, digest, 1)
+    assert not journal.is_done("txt2img", param, digest, 0)
+    assert not journal.is_done("txt2img", param, digest)
+
+
+def test_when_saved():
+    futures = [Future(), Future()]
+    results = []
+    when_saved(futures, results.append)
+    futures[0].set_result(Path("a.png"))
+    assert not results
+    futures[1].set_result(Path("b.png"))
+    assert results == [[Path("a.png"), Path("b.png")]]
+
+    futures = [Future()]
+    when_saved(futures, results.append)
+    futures[0].set_exception(OSError())
+    assert len(results) == 1
+
+
+def test_count_jobs(tmp_path: Path):
+    plain = tmp_path.joinpath("plain.yaml")
+    plain.write_text("prompt: a\n")
+    sweep = tmp_path.joinpath("sweep.yaml")
+    sweep.write_text("sweep:\n  seed: [1, 2, 3]\n")
+    params = [plain, sweep, tmp_path.joinpath("missing.yaml")]
+
+    journal = Journal(tmp_path)
+    journal.record("txt2img", sweep, file_digest(sweep), [], index=1)
+    sweeps = {}
+    counts = []
+    jobs = count_jobs(
+        iter_jobs(params, "txt2img", sweeps),
+        len(params),
+        sweeps,
+        completed(journal, "txt2img", resume=True),
+        lambda planned, skipped: counts.append((planned, skipped)),
+    )
+
+    # files are read as their jobs are reached
+    assert next(jobs).path == plain
+    assert counts == []
+    assert next(jobs).index == 0
+    assert counts == [(5, 0)]
+    assert next(jobs).index == 2
+    assert counts == [(5, 0), (4, 1)]
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+import httpx
+import pytest
+
+from aaa1111 import AAA1111, AAA1111Pool
+
+
+def test_lazy_clients():
+    api = AAA1111()
+    assert api._client is None
+    assert api._aclient is None
+    assert str(api.base_url) == "http://127.0.0.1:7860"
+    assert api._client is None
+
+    assert api.client is api.client
+    assert api._aclient is None
+    api.close()
+    assert api._client is None
+
+
+def test_limits():
+    api = AAA1111(max_connections=4, max_keepalive_connections=2, keepalive_expiry=1.0)
+    limits = api._client_kwargs["limits"]
+    assert limits.max_connections == 4
+    assert limits.max_keepalive_connections == 2
+    assert limits.keepalive_expiry == 1.0
+
+
+def test_context_manager():
+    with AAA1111() as api:
+        client = api.client
+    assert client.is_closed
+    assert api._client is None
+
+
+async def test_async_context_manager():
+    async with AAA1111() as api:
+        aclient = api.aclient
+        client = api.client
+    assert aclient.is_closed
+    assert client.is_closed
+
+
+async def test_pool_context_manager():
+    async with AAA1111Pool(["http://127.0.0.1:7860", "http://127.0.0.1:7861"]) as pool:
+        aclients = [b.aclient for b in pool.backends]
+    assert all(c.is_closed for c in aclients)
+
+
+def test_del_without_loop():
+    api = AAA1111()
+    api.aclient  # noqa: B018
+    del api  # must not start an event loop
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b'{"uds": true}')
+
+    def log_message(self, *args):
+        pass
+
+
+class UnixHTTPServer(HTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        self.socket.bind(self.server_address)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="no unix sockets")
+def test_uds(tmp_path: Path):
+    path = str(tmp_path.joinpath("webui.sock"))
+    server = UnixHTTPServer(path, Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with AAA1111(uds=path) as api:
+            assert api.get_options() == {"uds": True}
+
+        async def run():
+            async with AAA1111(uds=path) as api:
+                return await api.aget_options()
+
+        assert asyncio.run(run()) == {"uds": True}
+    finally:
+        server.shutdown()
+        os.unlink(path)
+
+
+def test_uds_keeps_transport():
+    transport = httpx.MockTransport(lambda _: httpx.Response(200, json={}))
+    api = AAA1111(uds="/nonexistent.sock", client_kwargs={"transport": transport})
+    assert api.get_options() == {}
@@ -0,0 +1,82 @@
+import asyncio
+import socket
+import time
+
+import httpx
+import pytest
+
+from aaa1111 import AAA1111, AAA1111Pool
+
+
+def test_pool_backends():
+    pool = AAA1111Pool(["http://127.0.0.1:7860", AAA1111(port=7861)])
+    assert len(pool) == 2
+    assert str(pool.backends[0].base_url) == "http://127.0.0.1:7860"
+    assert str(pool.backends[1].base_url) == "http://127.0.0.1:7861"
+
+
+def test_pool_empty():
+    with pytest.raises(ValueError, match="backend"):
+        AAA1111Pool([])
+
+
+def test_pool_least_loaded():
+    pool = AAA1111Pool([f"http://127.0.0.1:{port}" for port in (7860, 7861, 7862)])
+    first = [pool._acquire() for _ in range(3)]
+    assert sorted(first) == [0, 1, 2]
+    pool._release(1)
+    assert pool._acquire() == 1
+    assert pool.in_flight() == [1, 1, 1]
+
+
+def progress(job_count):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/sdapi/v1/progress":
+            return httpx.Response(
+                200,
+                json={
+                    "progress": 0.5 if job_count else 0.0,
+                    "eta_relative": 1.0 if job_count else 0.0,
+                    "state": {"job_count": job_count},
+                    "current_image": None,
+                },
+            )
+        return httpx.Response(200, json={})
+
+    return handler
+
+
+def test_pool_skips_busy_backend(mock_api):
+    busy, idle = [], []
+    pool = AAA1111Pool([mock_api(progress(1), busy), mock_api(progress(0), idle)])
+    for _ in range(3):
+        pool._dispatch("get_options")
+    assert pool._healthy == [True, True]
+    assert busy == ["/sdapi/v1/progress"]
+    assert idle.count("/sdapi/v1/options") == 3
+
+
+async def test_pool_hung_backend(mock_api):
+    # accepts the connection, never answers
+    with socket.socket() as hung:
+        hung.bind(("127.0.0.1", 0))
+        hung.listen()
+        port = hung.getsockname()[1]
+        hits = []
+        pool = AAA1111Pool(
+            [f"http://127.0.0.1:{port}", mock_api(progress(0), hits)],
+            poll_timeout=0.1,
+        )
+
+        start = time.monotonic()
+        pool._dispatch("get_options")
+        assert time.monotonic() - start < 1
+        assert pool._healthy == [False, True]
+
+        pool._polled_at = [float("-inf")] * 2
+        polls = [pool._apoll() for _ in range(3)]
+        start = time.monotonic()
+        await asyncio.gather(*polls)
+        assert time.monotonic() - start < 1
+        # concurrent polls do not poll the same backend again
+        assert hits.count("/sdapi/v1/progress") == 2
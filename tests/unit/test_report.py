@@ -0,0 +1,227 @@
+import asyncio
+import random
+from concurrent.futures import Future
+from pathlib import Path
+
+import httpx
+import orjson
+import pytest
+from PIL import Image
+
+from aaa1111.__main__ import _inner
+from aaa1111.report import (
+    LatencySketch,
+    RunReport,
+    attach,
+    on_span,
+    percentile,
+    track,
+)
+from aaa1111.testing import FakeWebUI
+from aaa1111.trace import Span
+from aaa1111.utils import ImageWriter
+
+TXT2IMG = "/sdapi/v1/txt2img"
+
+
+def span(name: str, endpoint: str = TXT2IMG, **kwargs) -> Span:
+    return Span(name, endpoint, 1.0, 1.5, **kwargs)
+
+
+def read(path: Path):
+    return [orjson.loads(line) for line in path.read_bytes().splitlines()]
+
+
+def write_params(tmp_path: Path, n: int):
+    params = []
+    for i in range(n):
+        param = tmp_path.joinpath(f"p{i}.yaml")
+        param.write_text(f"prompt: cat {i}\nsteps: 2\nwidth: 16\nheight: 16\n")
+        params.append(param)
+    return params
+
+
+def test_track():
+    on_span(span("request"))  # outside of a job, ignored
+    with track(TXT2IMG) as stats:
+        on_span(span("request", backend="a", error="HTTP 500"))
+        on_span(span("request", backend="b", bytes=10))
+        on_span(span("server"))
+        on_span(span("request", "/sdapi/v1/progress", backend="c"))
+
+    assert stats.backend == "b"
+    assert (stats.requests, stats.failed_requests, stats.downloaded) == (2, 1, 10)
+    assert stats.phases == {"request": 1.0, "server": 0.5}
+    assert stats.latency > 0
+
+
+def test_attach_writer(tmp_path: Path):
+    with track(TXT2IMG) as stats:
+        pass
+    latency = stats.latency
+    with ImageWriter(tmp_path, on_span=on_span) as writer:
+        with attach(stats):
+            writer.submit(Image.new("RGB", (8, 8))).result()
+        saved = stats.phases["save"]
+        writer.submit(Image.new("RGB", (8, 8))).result()  # not of the job
+
+    assert saved > 0
+    assert stats.phases == {"save": saved}
+    assert stats.latency == latency
+
+
+def test_latency_sketch():
+    sketch = LatencySketch(accuracy=0.01)
+    assert sketch.quantile(0.5) == 0.0
+    values = [random.lognormvariate(0, 2) for _ in range(10000)]
+    for v in values:
+        sketch.add(v)
+    values.sort()
+    for q in (0.0, 0.5, 0.9, 0.99, 1.0):
+        assert sketch.quantile(q) == pytest.approx(percentile(values, q), rel=0.01)
+    assert sketch.max == values[-1]
+    assert sketch.count == len(values)
+    # the buckets grow with the spread of the values, not their number
+    assert len(sketch._counts) < 2000
+
+
+async def test_track_tasks():
+    async def job(backend: str):
+        with track(TXT2IMG) as stats:
+            await asyncio.sleep(0.01)
+            # a task started by the job, like a hedged request
+            await asyncio.ensure_future(send(backend))
+        return stats
+
+    async def send(backend: str):
+        on_span(span("request", backend=backend))
+
+    stats = await asyncio.gather(job("a"), job("b"))
+    assert [s.backend for s in stats] == ["a", "b"]
+    assert all(s.requests == 1 for s in stats)
+
+
+def test_run_report(tmp_path: Path):
+    image = tmp_path.joinpath("a.png")
+    image.write_bytes(b"0" * 10)
+    path = tmp_path.joinpath("report.jsonl")
+    metrics = tmp_path.joinpath("metrics.prom")
+    report = RunReport("txt2img", path, metrics)
+    report.plan(2)
+
+    for i, backend in enumerate(("a", "b")):
+        with track(TXT2IMG) as stats:
+            on_span(span("request", backend=backend, bytes=100))
+        saved = [Future(), Future()]
+        report.job(tmp_path.joinpath("p.yaml"), i, stats, saved)
+        saved[0].set_result(image)
+        assert not path.exists() or len(read(path)) == i
+        if i == 0:
+            saved[1].set_result(image)
+        else:
+            saved[1].set_exception(OSError("disk full"))
+    summary = report.close()
+
+    first, second, last = read(path)
+    assert first["type"] == second["type"] == "job"
+    assert first["run"] == last["run"]
+    assert first["index"] == 0
+    assert first["backend"] == "a"
+    assert first["images"] == 2
+    assert first["bytes"] == 20
+    assert first["error"] is None
+    assert second["images"] == 1
+    assert second["error"] == "OSError: disk full"
+
+    assert last == summary
+    assert summary["jobs"] == 2
+    assert summary["failed_jobs"] == 1
+    assert summary["images"] == 3
+    assert summary["downloaded_bytes"] == 200
+    assert summary["backends"] == {"a": 1, "b": 1}
+    assert summary["latency"]["p50"] <= summary["latency"]["max"]
+
+    text = metrics.read_text()
+    assert 'aaa1111_jobs_planned{task="txt2img"} 2' in text
+    assert 'aaa1111_jobs_total{task="txt2img",backend="b",status="failed"} 1' in text
+    assert 'aaa1111_job_duration_seconds_bucket{task="txt2img",le="+Inf"} 2' in text
+    assert 'aaa1111_images_total{task="txt2img"} 3' in text
+
+
+def test_metrics_port():
+    report = RunReport("img2img", metrics_port=0)
+    port = report.metrics._server.server_address[1]
+    try:
+        resp = httpx.get(f"http://127.0.0.1:{port}/metrics")
+        assert resp.status_code == 200
+        assert "# TYPE aaa1111_jobs_total counter" in resp.text
+        assert httpx.get(f"http://127.0.0.1:{port}/").status_code == 404
+    finally:
+        report.close()
+    assert report.metrics._server is None
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+def test_cli_report(tmp_path: Path, concurrency: int):
+    params = write_params(tmp_path, 3)
+    path = tmp_path.joinpath("report.jsonl")
+
+    with FakeWebUI(step_time=0.001) as server:
+        _inner(
+            params,
+            tmp_path.joinpath("out"),
+            [server.base_url],
+            "127.0.0.1",
+            7860,
+            False,
+            "png",
+            95,
+            True,
+            concurrency,
+            report=path,
+        )
+
+    *jobs, summary = read(path)
+    assert sorted(r["file"] for r in jobs) == [str(p) for p in params]
+    for r in jobs:
+        assert r["backend"] == server.base_url
+        assert r["requests"] == 1
+        assert r["downloaded_bytes"] > 0
+        assert {"request", "server", "parse", "save"} <= set(r["phases"])
+        assert Path(r["outputs"][0]["path"]).stat().st_size == r["bytes"]
+    assert summary["type"] == "summary"
+    assert summary["images"] == 3
+    assert summary["error"] is None
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+def test_cli_report_failed_job(tmp_path: Path, concurrency: int):
+    params = write_params(tmp_path, 3)
+    # the fake webui answers 500
+    params[1].write_text("prompt: cat\nsteps: many\n")
+    path = tmp_path.joinpath("report.jsonl")
+
+    with FakeWebUI(step_time=0.001) as server:
+        _inner(
+            params,
+            tmp_path.joinpath("out"),
+            [server.base_url],
+            "127.0.0.1",
+            7860,
+            False,
+            "png",
+            95,
+            True,
+            concurrency,
+            report=path,
+        )
+
+    *jobs, summary = read(path)
+    failed = [r for r in jobs if r["error"]]
+    assert len(jobs) == 3
+    assert [r["file"] for r in failed] == [str(params[1])]
+    assert failed[0]["error"].startswith("HTTPStatusError")
+    assert failed[0]["images"] == 0
+    assert (summary["jobs"], summary["failed_jobs"]) == (3, 1)
+    assert summary["images"] == 2
+    assert summary["error"] is None
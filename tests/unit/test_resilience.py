@@ -0,0 +1,226 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from aaa1111 import AAA1111Pool, CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+def status_error(code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://test/")
+    response = httpx.Response(code, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+def flaky(codes):
+    # answers with `codes` in order, then 200
+    def handler(request: httpx.Request) -> httpx.Response:
+        code = codes.pop(0) if codes else 200
+        if code == 0:
+            msg = "connection refused"
+            raise httpx.ConnectError(msg, request=request)
+        return httpx.Response(code, json={"job": 0})
+
+    return handler
+
+
+def test_retry_policy():
+    policy = RetryPolicy(attempts=3, backoff=1.0)
+    assert policy.retryable(status_error(503))
+    assert not policy.retryable(status_error(422))
+    assert not policy.retryable(status_error(503), idempotent=False)
+    connect = httpx.ConnectError("refused")
+    assert policy.retryable(connect, idempotent=False)
+
+    assert 0 <= policy.delay(0, connect) <= 1.0
+    assert 0 <= policy.delay(1, connect) <= 2.0
+    assert policy.delay(2, connect) is None
+
+    with pytest.raises(ValueError, match="attempts"):
+        RetryPolicy(attempts=0)
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(threshold=2, reset_after=0.05)
+    breaker.record(status_error(422))
+    breaker.record(status_error(500))
+    assert breaker.state == "closed"
+    breaker.record(status_error(500))
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    breaker.check()  # the trial request
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    breaker.record(status_error(500))
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    breaker.check()
+    breaker.record()
+    assert breaker.state == "closed"
+
+
+def test_retry_request(mock_api):
+    calls = []
+    api = mock_api(flaky([500, 0]), calls, retry=RetryPolicy(attempts=3, backoff=0.01))
+    assert api.get_options() == {"job": 0}
+    assert len(calls) == 3
+
+    calls.clear()
+    api = mock_api(flaky([500, 500, 500]), calls, retry=RetryPolicy(backoff=0.01))
+    with pytest.raises(httpx.HTTPStatusError):
+        api.get_options()
+    assert len(calls) == 3
+
+
+def test_retry_not_idempotent(mock_api):
+    calls = []
+    api = mock_api(flaky([500]), calls, retry=RetryPolicy(backoff=0.01))
+    with pytest.raises(httpx.HTTPStatusError):
+        api.skip()
+    assert len(calls) == 1
+
+    calls.clear()
+    api = mock_api(flaky([0]), calls, retry=RetryPolicy(backoff=0.01))
+    api.skip()
+    assert len(calls) == 2
+
+
+def test_retry_generation(mock_api):
+    # sent again only when it did not reach the server
+    calls = []
+    api = mock_api(flaky([0, 500]), calls, retry=RetryPolicy(backoff=0.01))
+    with pytest.raises(httpx.HTTPStatusError):
+        api.txt2img({"prompt": "cat"})
+    assert len(calls) == 2
+
+
+async def test_aretry_generation(mock_api):
+    calls = []
+    api = mock_api(flaky([502, 0]), calls, retry=RetryPolicy(backoff=0.01))
+    with pytest.raises(httpx.HTTPStatusError):
+        await api.aimg2img({"prompt": "cat"})
+    assert len(calls) == 1
+
+
+def test_progress_outside_breaker(mock_api):
+    breaker = CircuitBreaker(threshold=1)
+    api = mock_api(flaky([500]), breaker=breaker)
+    with pytest.raises(httpx.HTTPStatusError):
+        api.progress()
+    assert breaker.state == "closed"
+
+
+async def test_aretry_request(mock_api):
+    calls = []
+    api = mock_api(flaky([502]), calls, retry=RetryPolicy(backoff=0.01))
+    assert await api.aget_options() == {"job": 0}
+    assert len(calls) == 2
+
+
+def test_breaker_request(mock_api):
+    calls = []
+    api = mock_api(flaky([500, 500]), calls, breaker=CircuitBreaker(threshold=2))
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError):
+            api.get_options()
+    with pytest.raises(CircuitOpenError):
+        api.get_options()
+    assert len(calls) == 2
+
+
+def test_pool_skips_open_circuit(mock_api):
+    down, up = [], []
+    broken = mock_api(flaky([500] * 10), down, breaker=CircuitBreaker(threshold=1))
+    pool = AAA1111Pool([broken, mock_api(flaky([]), up)])
+    with pytest.raises(httpx.HTTPStatusError):
+        broken.get_options()
+
+    pool._healthy = [True, True]
+    pool._polled_at = [time.monotonic()] * 2
+    for _ in range(3):
+        assert pool._dispatch("get_options") == {"job": 0}
+    assert len(down) == 1
+    assert len(up) == 3
+
+
+async def test_pool_hedge(mock_api):
+    def backend(delay):
+        async def handler(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(delay)
+            return httpx.Response(200, json={"delay": delay})
+
+        return mock_api(handler)
+
+    pool = AAA1111Pool([backend(1.0), backend(0.01)], hedge_percentile=0.9)
+    pool._polled_at = [time.monotonic()] * 2
+    for _ in range(20):
+        pool._record("aget_options", 0.02)
+
+    start = time.monotonic()
+    assert await pool._adispatch("aget_options") == {"delay": 0.01}
+    assert time.monotonic() - start < 0.5
+    assert pool.in_flight() == [0, 0]
+
+
+async def test_pool_hedge_other_backend(mock_api):
+    def backend(delay):
+        async def handler(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(delay)
+            return httpx.Response(200, json={"delay": delay})
+
+        return mock_api(handler)
+
+    pool = AAA1111Pool([backend(0.5), backend(0.01)], hedge_percentile=0.9)
+    pool._polled_at = [time.monotonic()] * 2
+    # the second backend scores worse than the first, even with the primary on it
+    pool._busy[1] = True
+    pool._eta[1] = 5.0
+    for _ in range(20):
+        pool._record("aget_options", 0.02)
+
+    assert await pool._adispatch("aget_options") == {"delay": 0.01}
+
+
+async def test_breaker_cancelled_trial(mock_api):
+    delays = [1.0]
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(delays.pop(0) if delays else 0)
+        return httpx.Response(200, json={})
+
+    breaker = CircuitBreaker(threshold=1, reset_after=0.01)
+    api = mock_api(handler, breaker=breaker)
+    breaker.record(status_error(500))
+    await asyncio.sleep(0.02)
+
+    # the trial is cancelled, like the loser of a hedged request
+    task = asyncio.ensure_future(api.aget_options())
+    await asyncio.sleep(0.01)
+    assert breaker.state == "open"
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert breaker.state == "half-open"
+
+    assert await api.aget_options() == {}
+    assert breaker.state == "closed"
+
+
+def test_breaker_trial_other_error(mock_api):
+    def handler(request: httpx.Request) -> httpx.Response:
+        msg = "boom"
+        raise RuntimeError(msg)
+
+    breaker = CircuitBreaker(threshold=1, reset_after=0.01)
+    api = mock_api(handler, breaker=breaker)
+    breaker.record(status_error(500))
+    time.sleep(0.02)
+    with pytest.raises(RuntimeError):
+        api.get_options()
+    assert breaker.state == "half-open"
@@ -0,0 +1,87 @@
+import pytest
+
+from aaa1111.scheduler import AffinityQueue, affinity, schedule
+
+
+def job(ckpt=None, vae=None):
+    override = {}
+    if ckpt:
+        override["sd_model_checkpoint"] = ckpt
+    if vae:
+        override["sd_vae"] = vae
+    return {"override_settings": override}
+
+
+def test_affinity():
+    assert affinity({}) == (None, None)
+    assert affinity(job("a", "v")) == ("a", "v")
+
+
+def test_queue_groups_models():
+    queue = AffinityQueue(max_skips=10)
+    for i, key in enumerate(["a", "b", "a", "b", "a"]):
+        queue.push(i, (key, None))
+    assert [queue.pop() for _ in range(5)] == [0, 2, 4, 1, 3]
+
+
+def test_queue_prefers_vae_swap():
+    queue = AffinityQueue()
+    queue.push(0, ("a", "x"))
+    queue.push(1, ("b", "x"))
+    queue.push(2, ("a", "y"))
+    assert [queue.pop() for _ in range(3)] == [0, 2, 1]
+
+
+def test_queue_any_model():
+    queue = AffinityQueue()
+    queue.push(0, ("a", None))
+    queue.push(1, ("b", None))
+    queue.push(2, (None, None))
+    assert [queue.pop() for _ in range(3)] == [0, 2, 1]
+    assert queue.current == ("b", None)
+
+
+def test_queue_fairness():
+    queue = AffinityQueue(max_skips=2)
+    queue.push(0, ("a", None))
+    queue.push(1, ("b", None))
+    for i in range(2, 6):
+        queue.push(i, ("a", None))
+    assert [queue.pop() for _ in range(6)] == [0, 2, 3, 1, 4, 5]
+
+
+def test_queue_keep_order():
+    queue = AffinityQueue(max_skips=0)
+    for i, key in enumerate(["a", "b", "a", "b"]):
+        queue.push(i, (key, None))
+    assert [queue.pop() for _ in range(4)] == [0, 1, 2, 3]
+
+
+def test_queue_empty():
+    with pytest.raises(IndexError):
+        AffinityQueue().pop()
+    with pytest.raises(ValueError, match="max_skips"):
+        AffinityQueue(max_skips=-1)
+
+
+def test_schedule_window():
+    payloads = [job(c) for c in "abababab"]
+    order = list(schedule(range(8), key=lambda i: affinity(payloads[i]), window=2))
+    assert sorted(order) == list(range(8))
+    assert order[:2] == [0, 2]
+
+    order = list(schedule(range(8), key=lambda i: affinity(payloads[i]), window=8))
+    assert order == [0, 2, 4, 6, 1, 3, 5, 7]
+
+
+def test_schedule_lazy():
+    consumed = []
+
+    def items():
+        for i in range(100):
+            consumed.append(i)
+            yield i
+
+    it = schedule(items(), key=lambda _: (None, None), window=4)
+    assert next(it) == 0
+    assert len(consumed) == 4
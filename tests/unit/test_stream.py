@@ -0,0 +1,127 @@
+import base64
+import io
+from pathlib import Path
+
+import httpx
+import orjson
+import pytest
+
+from aaa1111 import CircuitBreaker, CircuitOpenError, RetryPolicy
+from aaa1111.stream import ImageStreamParser
+
+images = [
+    Path(f).read_bytes()
+    for f in (
+        "tests/image/test1.png",
+        "tests/image/test2.webp",
+        "tests/image/test3.jpg",
+    )
+]
+body = orjson.dumps(
+    {
+        "images": [base64.b64encode(image).decode() for image in images],
+        "parameters": {"prompt": 'a "b" \\ , } ]', "init_images": [], "seed": -1},
+        "info": '{"infotexts": ["a"]}',
+    }
+)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096, len(body)])
+def test_stream_parser(chunk_size: int):
+    sinks = {}
+    parser = ImageStreamParser(lambda i: sinks.setdefault(i, io.BytesIO()))
+    for i in range(0, len(body), chunk_size):
+        parser.feed(body[i : i + chunk_size])
+    data = parser.close()
+
+    assert [sinks[i].getvalue() for i in range(len(images))] == images
+    assert data["parameters"]["prompt"] == 'a "b" \\ , } ]'
+    assert data["info"] == '{"infotexts": ["a"]}'
+
+
+def test_stream_parser_dir(tmp_path: Path):
+    parser = ImageStreamParser(tmp_path)
+    parser.feed(body)
+    paths = parser.close()["images"]
+    assert [p.suffix for p in paths] == [".png", ".webp", ".jpg"]
+    assert [p.read_bytes() for p in paths] == images
+
+
+def test_stream_parser_incomplete(tmp_path: Path):
+    parser = ImageStreamParser(tmp_path)
+    parser.feed(body[: len(body) // 2])
+    with pytest.raises(ValueError, match="incomplete"):
+        parser.close()
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, len(body)])
+def test_stream_parser_escaped_key(chunk_size: int):
+    data = orjson.dumps({"a\\": 1, 'b"': [2], "images": []})
+    parser = ImageStreamParser(lambda i: io.BytesIO())
+    for i in range(0, len(data), chunk_size):
+        parser.feed(data[i : i + chunk_size])
+    assert parser.close() == {"a\\": 1, 'b"': [2], "images": []}
+
+
+def streamed(codes):
+    # answers with `codes` in order, then the body in small chunks
+    def handler(request: httpx.Request) -> httpx.Response:
+        code = codes.pop(0) if codes else 200
+        if code != 200:
+            return httpx.Response(code)
+        chunks = [body[i : i + 1000] for i in range(0, len(body), 1000)]
+        return httpx.Response(200, stream=httpx.ByteStream(b"".join(chunks)))
+
+    return handler
+
+
+def test_txt2img_stream(tmp_path: Path, mock_api):
+    calls = []
+    spans = []
+    # a generation is only retried after a 5xx when asked to
+    api = mock_api(streamed([503]), calls, retry=RetryPolicy(backoff=0.01))
+    with pytest.raises(httpx.HTTPStatusError):
+        api.txt2img_stream({"prompt": "cat"}, tmp_path)
+    calls.clear()
+
+    retry = RetryPolicy(backoff=0.01, retry_generation=True)
+    api = mock_api(streamed([503]), calls, retry=retry, on_span=spans.append)
+    resp = api.txt2img_stream({"prompt": "cat"}, tmp_path)
+
+    assert [p.read_bytes() for p in resp.images] == images
+    assert resp.info == {"infotexts": ["a"]}
+    assert calls == ["/sdapi/v1/txt2img"] * 2
+    requests = [s for s in spans if s.name == "request"]
+    assert [s.error for s in requests] == ["HTTP 503", None]
+    assert requests[1].bytes == len(body)
+
+
+def test_extra_batch_images_stream_spans(mock_api):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"html_info": "", "images": []})
+
+    spans = []
+    api = mock_api(handler, on_span=spans.append)
+    payload = {"imageList": [{"data": "tests/image/test1.png", "name": "a"}]}
+    api.extra_batch_images_stream(payload, lambda i: io.BytesIO())
+    assert [s.name for s in spans] == ["payload", "encode", "request"]
+
+
+async def test_aimg2img_stream(mock_api):
+    calls = []
+    breaker = CircuitBreaker(threshold=1)
+    api = mock_api(streamed([500]), calls, breaker=breaker)
+    with pytest.raises(httpx.HTTPStatusError):
+        await api.aimg2img_stream({"prompt": "cat"}, lambda i: io.BytesIO())
+    with pytest.raises(CircuitOpenError):
+        await api.aimg2img_stream({"prompt": "cat"}, lambda i: io.BytesIO())
+    assert calls == ["/sdapi/v1/img2img"]
+
+    api = mock_api(streamed([]), calls)
+    sinks = {}
+    resp = await api.aimg2img_stream(
+        {"prompt": "cat"}, lambda i: sinks.setdefault(i, io.BytesIO())
+    )
+    assert [sinks[i].getvalue() for i in range(len(images))] == images
+    assert resp.parameters["seed"] == -1
@@ -0,0 +1,73 @@
+import pytest
+
+from aaa1111.sweep import Sweep, is_sweep
+
+
+def test_sweep():
+    base = {"prompt": "cat", "steps": 20, "sweep": {}}
+    sweep = Sweep(base, {"cfg_scale": [5, 7], "seed": {"start": 1, "stop": 4}})
+    assert len(sweep) == 6
+    payloads = list(sweep)
+    assert [(p["cfg_scale"], p["seed"]) for p in payloads] == [
+        (5, 1),
+        (5, 2),
+        (5, 3),
+        (7, 1),
+        (7, 2),
+        (7, 3),
+    ]
+    assert all("sweep" not in p and p["prompt"] == "cat" for p in payloads)
+    assert sweep[4] == payloads[4]
+    with pytest.raises(IndexError):
+        sweep[6]
+
+
+def test_sweep_expensive_axes_first():
+    override = {"CLIP_stop_at_last_layers": 2}
+    sweep = Sweep(
+        {"prompt": "cat", "override_settings": override},
+        {
+            "seed": [1, 2],
+            "override_settings.sd_vae": ["v1", "v2"],
+            "override_settings.sd_model_checkpoint": ["a", "b"],
+        },
+    )
+    assert [name for name, _ in sweep.axes] == [
+        "override_settings.sd_model_checkpoint",
+        "override_settings.sd_vae",
+        "seed",
+    ]
+    first = sweep[0]
+    assert first["override_settings"] == {
+        "CLIP_stop_at_last_layers": 2,
+        "sd_model_checkpoint": "a",
+        "sd_vae": "v1",
+    }
+    # the base payload is not modified
+    assert override == {"CLIP_stop_at_last_layers": 2}
+    models = [p["override_settings"]["sd_model_checkpoint"] for p in sweep]
+    assert models == ["a"] * 4 + ["b"] * 4
+
+
+def test_sweep_large():
+    sweep = Sweep({}, {"seed": {"start": 0, "stop": 10**6}, "steps": [10, 20]})
+    assert len(sweep) == 2 * 10**6
+    assert sweep[len(sweep) - 1] == {"seed": 10**6 - 1, "steps": 20}
+
+
+def test_sweep_invalid():
+    with pytest.raises(ValueError, match="not a txt2img field"):
+        Sweep({}, {"init_images": [[]]})
+    Sweep({}, {"init_images": [[]]}, task="img2img")
+    with pytest.raises(ValueError, match="no values"):
+        Sweep({}, {"seed": []})
+    with pytest.raises(ValueError, match="range"):
+        Sweep({}, {"seed": {"stop": 3}})
+    with pytest.raises(ValueError, match="at least one axis"):
+        Sweep({}, {})
+
+
+def test_is_sweep():
+    assert is_sweep({"sweep": {"seed": [1]}})
+    assert not is_sweep({"prompt": "cat"})
+    assert len(Sweep.from_payload({"sweep": {"seed": [1, 2]}})) == 2
@@ -0,0 +1,106 @@
+from pathlib import Path
+
+import httpx
+import pytest
+
+from aaa1111 import AAA1111
+from aaa1111.testing import FakeWebUI
+from aaa1111.trace import Span
+from aaa1111.utils import ImageWriter
+
+TXT2IMG = "/sdapi/v1/txt2img"
+PAYLOAD = {"prompt": "cat", "steps": 4, "width": 32, "height": 32}
+
+
+@pytest.fixture(scope="module")
+def server():
+    with FakeWebUI(step_time=0.005) as s:
+        yield s
+
+
+def names(spans):
+    return [s.name for s in spans]
+
+
+def test_spans(server: FakeWebUI):
+    spans = []
+    with AAA1111(base_url=server.base_url, on_span=spans.append) as api:
+        api.txt2img(PAYLOAD)
+
+    assert names(spans) == [
+        "payload",
+        "encode",
+        "request",
+        "connect",
+        "upload",
+        "server",
+        "download",
+        "parse",
+    ]
+    by_name = {s.name: s for s in spans}
+    assert all(s.endpoint == TXT2IMG for s in spans)
+    assert all(s.backend == server.base_url for s in spans)
+    assert by_name["server"].duration >= 4 * 0.005
+    assert by_name["upload"].bytes > 0
+    assert by_name["download"].bytes == by_name["parse"].bytes > 0
+    # the phases of the request are in order and inside it
+    request = by_name["request"]
+    phases = [by_name[n] for n in ("connect", "upload", "server", "download")]
+    assert request.start <= phases[0].start
+    assert all(a.end <= b.start + 1e-6 for a, b in zip(phases, phases[1:]))
+    assert phases[-1].end <= request.end
+
+
+async def test_aspans(server: FakeWebUI):
+    spans = []
+    async with AAA1111(base_url=server.base_url, on_span=spans.append) as api:
+        await api.atxt2img(PAYLOAD)
+        await api.askip()
+
+    txt2img = [s for s in spans if s.endpoint == TXT2IMG]
+    assert names(txt2img) == [
+        "payload",
+        "encode",
+        "request",
+        "connect",
+        "upload",
+        "server",
+        "download",
+        "parse",
+    ]
+    # the connection is reused
+    skip = [s for s in spans if s.endpoint == "/sdapi/v1/skip"]
+    assert names(skip) == ["request", "upload", "server", "download"]
+
+
+def test_span_error(mock_api):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(500)
+
+    spans = []
+    api = mock_api(handler, on_span=spans.append)
+    with pytest.raises(httpx.HTTPStatusError):
+        api.txt2img(PAYLOAD)
+    # no connection events from a mock transport
+    assert names(spans) == ["payload", "encode", "request"]
+    assert spans[-1].error == "HTTP 500"
+
+
+def test_no_hook(server: FakeWebUI, monkeypatch: pytest.MonkeyPatch):
+    def fail(*args, **kwargs):
+        raise AssertionError
+
+    monkeypatch.setattr(Span, "__init__", fail)
+    with AAA1111(base_url=server.base_url) as api:
+        api.txt2img(PAYLOAD)
+
+
+def test_writer_span(server: FakeWebUI, tmp_path: Path):
+    spans = []
+    with AAA1111(base_url=server.base_url) as api:
+        resp = api.txt2img(PAYLOAD)
+    with ImageWriter(tmp_path, on_span=spans.append) as writer:
+        path = writer.submit(resp.images[0]).result()
+
+    assert names(spans) == ["save"]
+    assert spans[0].bytes == path.stat().st_size
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parents[2]
+
+CODE = """
+from aaa1111.typecheck import TYPECHECK
+from aaa1111.types.toimg import TXT2IMG
+
+try:
+    TXT2IMG(steps="20")
+except Exception:
+    print(TYPECHECK, "checked")
+else:
+    print(TYPECHECK, "unchecked")
+"""
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [("1", "True checked"), ("0", "False unchecked"), ("off", "False unchecked")],
+)
+def test_typecheck_env(value: str, expected: str):
+    # the checks are applied at import time, so every case needs a fresh interpreter
+    env = {**os.environ, "PYTHONPATH": str(ROOT), "AAA1111_TYPECHECK": value}
+    out = subprocess.run(
+        [sys.executable, "-c", CODE],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    assert out.stdout.strip() == expected
@@ -0,0 +1,186 @@
+import asyncio
+import io
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from aaa1111 import utils
+from aaa1111.utils import (
+    ImageWriter,
+    LazyImage,
+    arecursive_read_image,
+    image_to_base64,
+    recursive_read_image,
+    save_image,
+)
+
+image_png = "tests/image/test1.png"
+
+
+def test_image_writer(tmp_path: Path):
+    image = Image.open(image_png)
+    image.load()
+    with ImageWriter(tmp_path, "webp", max_workers=2, max_pending=2) as writer:
+        futures = [writer.submit(image, "infotext") for _ in range(5)]
+    paths = [fut.result() for fut in futures]
+    assert len(set(paths)) == 5
+    assert all(p.suffix == ".webp" and p.is_file() for p in paths)
+
+
+async def test_image_writer_cancelled_asubmit(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    release = threading.Event()
+
+    def slow_save(*args):
+        release.wait(5)
+        return tmp_path
+
+    monkeypatch.setattr(utils, "save_image", slow_save)
+    image = Image.new("RGB", (8, 8))
+    with ImageWriter(tmp_path, max_workers=1, max_pending=1) as writer:
+        first = await writer.asubmit(image)
+        waiting = asyncio.ensure_future(writer.asubmit(image))
+        await asyncio.sleep(0.02)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+        release.set()
+        await asyncio.wrap_future(first)
+        # the cancelled call did not keep the slot
+        second = await asyncio.wait_for(writer.asubmit(image), 1)
+        assert await asyncio.wrap_future(second) == tmp_path
+
+
+async def test_image_writer_woken_cancelled(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    release = threading.Event()
+
+    def slow_save(*args):
+        release.wait(5)
+        return tmp_path
+
+    monkeypatch.setattr(utils, "save_image", slow_save)
+    image = Image.new("RGB", (8, 8))
+    with ImageWriter(tmp_path, max_workers=1, max_pending=1) as writer:
+        first = await writer.asubmit(image)
+        woken = asyncio.ensure_future(writer.asubmit(image))
+        await asyncio.sleep(0.01)
+        third = asyncio.ensure_future(writer.asubmit(image))
+        await asyncio.sleep(0.01)
+
+        # the slot is freed and `woken` cancelled before it runs again
+        release.set()
+        first.result()
+        time.sleep(0.05)
+        woken.cancel()
+        # the wake up is passed on
+        second = await asyncio.wait_for(third, 1)
+        assert await asyncio.wrap_future(second) == tmp_path
+
+
+async def test_image_writer_many_asubmit(tmp_path: Path):
+    image = Image.new("RGB", (8, 8))
+    with ImageWriter(tmp_path, max_workers=2, max_pending=2) as writer:
+        futures = await asyncio.wait_for(
+            asyncio.gather(*(writer.asubmit(image) for _ in range(50))), 10
+        )
+        paths = [await asyncio.wrap_future(f) for f in futures]
+    assert len(set(paths)) == 50
+    assert not writer._waiters
+
+
+def test_image_writer_error(tmp_path: Path):
+    writer = ImageWriter(tmp_path.joinpath("not_exists"))
+    writer.submit(Image.open(image_png))
+    with pytest.raises(FileNotFoundError):
+        writer.close()
+
+
+def test_lazy_image(tmp_path: Path):
+    data = Path(image_png).read_bytes()
+    image = LazyImage(image_to_base64(image_png))
+    assert image.bytes == data
+    assert image.format == "PNG"
+
+    image.save(tmp_path.joinpath("same.png"))
+    assert tmp_path.joinpath("same.png").read_bytes() == data
+    assert not image.is_decoded
+
+    image.save(tmp_path.joinpath("other.webp"))
+    assert image.is_decoded
+    assert Image.open(tmp_path.joinpath("other.webp")).format == "WEBP"
+    assert image.size == (512, 768)
+    assert "parameters" in image.info
+
+
+def test_lazy_image_file_object(tmp_path: Path):
+    data = Path(image_png).read_bytes()
+    image = LazyImage(data)
+    with tmp_path.joinpath("same.png").open("wb") as f:
+        image.save(f)
+    assert tmp_path.joinpath("same.png").read_bytes() == data
+    assert not image.is_decoded
+
+    # the format follows the file's name, like PIL
+    with tmp_path.joinpath("other.jpg").open("wb") as f:
+        LazyImage(data).save(f)
+    assert Image.open(tmp_path.joinpath("other.jpg")).format == "JPEG"
+
+    buf = io.BytesIO()
+    image.save(buf)
+    assert buf.getvalue() == data
+
+
+def test_save_image_verbatim(tmp_path: Path):
+    image = LazyImage(image_to_base64(image_png))
+    embedded = image.info["parameters"]
+    path = save_image(image, tmp_path, embedded, "png")
+    assert path.read_bytes() == image.bytes
+    # the caller's infotext wins over the one in the file
+    path = save_image(image, tmp_path, "infotext", "png")
+    assert Image.open(path).info["parameters"] == "infotext"
+
+    image = LazyImage(image_to_base64(Image.new("RGB", (8, 8))))
+    assert image.format == "WEBP"
+    path = save_image(image, tmp_path, None, "webp")
+    assert path.read_bytes() == image.bytes
+    path = save_image(image, tmp_path, "infotext ✓", "png")
+    assert Image.open(path).info["parameters"] == "infotext ✓"
+
+
+def test_recursive_read_image():
+    image = Image.open(image_png)
+    payload = {
+        "init_images": [image_png, image],
+        "mask": image,
+        "alwayson_scripts": {"ControlNet": {"args": [{"image": image, "weight": 1}]}},
+        "prompt": "masterpiece",
+    }
+    data = recursive_read_image(payload)
+    encoded = image_to_base64(image)
+    assert data["init_images"] == [image_to_base64(image_png), encoded]
+    assert data["mask"] == encoded
+    assert data["alwayson_scripts"]["ControlNet"]["args"] == [
+        {"image": encoded, "weight": 1}
+    ]
+    assert data["prompt"] == "masterpiece"
+    assert payload["mask"] is image
+
+
+def test_recursive_read_image_long_string():
+    # longer than a file name can be
+    prompt = ", ".join(["masterpiece"] * 50)
+    assert recursive_read_image({"prompt": prompt}) == {"prompt": prompt}
+    assert image_to_base64("a" * 1000) == "a" * 1000
+
+
+async def test_arecursive_read_image():
+    image = Image.open(image_png)
+    payload = {"init_images": [image_png, image], "mask": image}
+    assert await arecursive_read_image(payload) == recursive_read_image(payload)
@@ -0,0 +1,90 @@
+import asyncio
+import base64
+from pathlib import Path
+
+import httpx
+import pytest
+
+from aaa1111.client.watch import next_interval
+from aaa1111.types import LazyImage, ProgressResponse
+
+preview = base64.b64encode(Path("tests/image/test1.png").read_bytes()).decode()
+
+
+def generating(polls, duration=0.3, fail=False):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/progress"):
+            skip = request.url.params["skip_current_image"] == "true"
+            polls.append(skip)
+            return httpx.Response(
+                200,
+                json={
+                    "progress": 0.5,
+                    "eta_relative": 1.0,
+                    "state": {"job_count": 1},
+                    "current_image": None if skip else preview,
+                    "textinfo": None,
+                },
+            )
+        await asyncio.sleep(duration)
+        if fail:
+            return httpx.Response(500)
+        return httpx.Response(
+            200, json={"images": [preview], "parameters": {}, "info": "{}"}
+        )
+
+    return handler
+
+
+def test_next_interval():
+    assert next_interval(0.0, 0.25, 5.0) == 0.25
+    assert next_interval(10.0, 0.25, 5.0) == 1.0
+    assert next_interval(600.0, 0.25, 5.0) == 5.0
+
+
+def test_progress_preview_lazy():
+    resp = ProgressResponse(
+        progress=0.5, eta_relative=1.0, state={}, current_image=preview
+    )
+    assert isinstance(resp.current_image, LazyImage)
+    assert not resp.current_image.is_decoded
+
+
+async def test_atxt2img_progress(mock_api):
+    polls = []
+    api = mock_api(generating(polls))
+    events = [
+        e
+        async for e in api.atxt2img_progress(
+            {"prompt": "cat"}, min_interval=0.05, max_interval=0.1
+        )
+    ]
+
+    assert polls
+    assert all(polls)
+    assert all(not e.done and e.current_image is None for e in events[:-1])
+    last = events[-1]
+    assert last.done
+    assert last.progress == 1.0
+    assert last.state == {"job_count": 1}
+    assert len(last.result.images) == 1
+
+
+async def test_atxt2img_progress_previews(mock_api):
+    polls = []
+    api = mock_api(generating(polls))
+    events = [
+        e
+        async for e in api.atxt2img_progress(
+            {"prompt": "cat"}, previews=True, min_interval=0.05, max_interval=0.1
+        )
+    ]
+    assert not any(polls)
+    assert isinstance(events[0].current_image, LazyImage)
+
+
+async def test_atxt2img_progress_error(mock_api):
+    api = mock_api(generating([], duration=0.1, fail=True))
+    with pytest.raises(httpx.HTTPStatusError):
+        async for _ in api.atxt2img_progress({"prompt": "cat"}, min_interval=0.05):
+            pass